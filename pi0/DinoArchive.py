@@ -0,0 +1,356 @@
+import os
+import time
+import numpy as np
+
+from DinoConstants import *  # Data columns (I_COLUMNS)
+from DinoLog       import *  # Entry types and CSV layout
+from DinoLogReader import *  # Segments of an archive
+from DinoCompress  import *  # Read compressed segments
+
+
+# Extension of the cache written next to the index of an archive.
+ARCHIVE_CACHE_EXT = ".npz"
+
+# Incremented when the layout of the cache changes.
+ARCHIVE_CACHE_VERSION = 3
+
+# Data column with the flight state letter (see I_COLUMNS).
+ARCHIVE_STATE_COLUMN = "flight_state"
+
+# NumPy type of each struct format character (little-endian, no padding).
+STRUCT_DTYPES = {'c' : 'S1', 'b' : 'i1', 'B' : 'u1', '?' : '?',  \
+                 'h' : '<i2', 'H' : '<u2', 'i' : '<i4', 'I' : '<u4', \
+                 'l' : '<i4', 'L' : '<u4', 'q' : '<i8', 'Q' : '<u8', \
+                 'f' : '<f4', 'd' : '<f8'}
+
+# Columns of the events (messages) in the text log.
+EVENT_FIELDS = ["id", "time", "met", "msg"]
+
+
+class DinoArchive(object):
+   """
+   Class DinoArchive - Load a DinoLog archive into NumPy arrays.
+
+   The data is a structured array with the record header (id, time, met,
+   vtime, nulls) followed by the data columns (i.e. "altitude" for 
+   I_ALTITUDE), sorted by MET. Float columns that were not available and
+   unknown vehicle times are NaN. The vehicle time is only recorded in
+   binary data segments (NaN for data written to the text log). The 
+   events (messages) are a separate structured array with the id,
+   date/time string, MET and message.
+
+   Binary data segments are read in one pass with np.frombuffer(). Data
+   that was written to the text log (see DinoLog.logData()) is parsed
+   and merged with it. The arrays are saved next to the index
+   (ARCHIVE_CACHE_EXT) along with a copy of the index, and loaded from
+   there as long as the index is unchanged.
+
+   Queries by MET range use np.searchsorted() on the sorted MET column,
+   and queries by flight state slice the periods of each state (computed
+   once), instead of scanning the data.
+   """
+
+   def __init__(self, indexPath, useCache=True):
+      """
+      Load an archive.
+
+      Parameters
+      ----------
+      indexPath : str
+         Filename of the index (see DinoLog.getIndexFilename()).
+      useCache : bool
+         Load from and save to the cache next to the index.
+      """
+      self.__indexPath = indexPath
+      self.__cachePath = os.path.splitext(indexPath)[0] + ARCHIVE_CACHE_EXT
+      self.__cached    = False
+      with open(indexPath, 'rb') as fp:
+         self.__indexData = fp.read()
+      if((useCache == True) and (self.__isCacheValid() == True)):
+         with np.load(self.__cachePath) as cache:
+            self.__data   = cache['data']
+            self.__events = cache['events']
+         self.__cached = True
+      else:
+         self.__load()
+         if(useCache == True):
+            self.__saveCache()
+      # Contiguous copies of the MET such that searchsorted() does not
+      # copy the column of the structured array on every query.
+      self.__met       = np.ascontiguousarray(self.__data['met'])
+      self.__eventsMet = np.ascontiguousarray(self.__events['met'])
+      self.__states    = None
+
+
+   def isCached(self):
+      """
+      Return True if the archive was loaded from the cache.
+      """
+      return self.__cached
+
+
+   def getData(self):
+      """
+      Return the data sorted by MET (structured array).
+      """
+      return self.__data
+
+
+   def getEvents(self):
+      """
+      Return the events sorted by MET (structured array).
+      """
+      return self.__events
+
+
+   def getColumn(self, name):
+      """
+      Return a data column by name (i.e. "altitude").
+      """
+      return self.__data[name]
+
+
+   def getRange(self, startMet, endMet):
+      """
+      Return the data with a MET in [startMet, endMet).
+
+      Parameters
+      ----------
+      startMet : float
+         First MET included.
+      endMet : float
+         First MET excluded.
+
+      Returns
+      -------
+      numpy.ndarray
+         View of the data (not a copy).
+      """
+      (start, end) = np.searchsorted(self.__met, (startMet, endMet))
+      return self.__data[start:end]
+
+
+   def getEventsRange(self, startMet, endMet):
+      """
+      Return the events with a MET in [startMet, endMet).
+      """
+      (start, end) = np.searchsorted(self.__eventsMet, (startMet, endMet))
+      return self.__events[start:end]
+
+
+   def getStates(self):
+      """
+      Return the periods spent in each flight state.
+
+      Returns
+      -------
+      list
+         (state letter, first MET, first MET of the next state) of each
+         period in MET order. The end of the last period is infinity.
+      """
+      (states, starts) = self.__getPeriods()
+      ends = np.append(self.__met[starts[1:]], np.inf)
+      return [(state, float(self.__met[start]), float(end)) \
+         for (state, start, end) in zip(states, starts, ends)]
+
+
+   def getState(self, stateLetter):
+      """
+      Return the data recorded during a flight state.
+
+      Parameters
+      ----------
+      stateLetter : str
+         Flight state (see NR_STATE_LETTERS).
+
+      Returns
+      -------
+      numpy.ndarray
+         Data of every period in that state.
+      """
+      (states, starts) = self.__getPeriods()
+      ends    = np.append(starts[1:], len(self.__data))
+      periods = [self.__data[starts[i]:ends[i]] for i in range(len(states)) \
+         if (states[i] == stateLetter)]
+      if(len(periods) == 0):
+         return self.__data[:0]
+      if(len(periods) == 1):
+         return periods[0]
+      return np.concatenate(periods)
+
+
+   @staticmethod
+   def getDtype(header):
+      """
+      Return the NumPy type of the records in a binary data segment.
+
+      Parameters
+      ----------
+      header : dict
+         Header of the segment (see DinoLogReader.readHeader()).
+
+      Returns
+      -------
+      numpy.dtype
+         Structured type with one field per record field.
+      """
+      formats = [STRUCT_DTYPES[char] for char in header['record'].lstrip("<")]
+      return np.dtype({'names' : header['fields'], 'formats' : formats})
+
+
+   def __getPeriods(self):
+      """
+      Return the flight state of each period and the index of its first
+      record, computed on first use.
+      """
+      if(self.__states is None):
+         states = []
+         starts = np.zeros(0, np.intp)
+         if((len(self.__data) > 0) and (ARCHIVE_STATE_COLUMN in self.__data.dtype.names)):
+            column = self.__data[ARCHIVE_STATE_COLUMN]
+            starts = np.concatenate(([0], np.flatnonzero(column[1:] != column[:-1]) + 1))
+            states = [state.decode('ascii') for state in column[starts]]
+         self.__states = (states, starts)
+      return self.__states
+
+
+   def __isCacheValid(self):
+      """
+      Return True if the cache has the current layout and was written
+      from the same index. The index records the size and MET range of
+      every segment, so it changes on every flush.
+      """
+      if(os.path.exists(self.__cachePath) == False):
+         return False
+      try:
+         with np.load(self.__cachePath) as cache:
+            return (int(cache['version']) == ARCHIVE_CACHE_VERSION) and \
+               (cache['index'].tobytes() == self.__indexData)
+      except:
+         return False
+
+
+   def __saveCache(self):
+      """
+      Save the arrays next to the index. Written to a temporary file first
+      such that an interrupted save does not leave a partial cache.
+      """
+      tmp = self.__cachePath + ".tmp"
+      with open(tmp, 'wb') as fp:
+         np.savez(fp, data=self.__data, events=self.__events, \
+            version=np.array(ARCHIVE_CACHE_VERSION), \
+            index=np.frombuffer(self.__indexData, np.uint8))
+      os.replace(tmp, self.__cachePath)
+
+
+   def __load(self):
+      """
+      Read every segment of the archive.
+      """
+      arrays = []
+      dtype  = None
+      for path in DinoLogReader.getSegments(self.__indexPath, ".bin"):
+         with DinoCompressor.open(path, 'rb') as fp:
+            header = DinoLogReader.readHeader(fp)
+            dtype  = DinoArchive.getDtype(header)
+            buf    = fp.read()
+         records = np.frombuffer(buf, dtype, len(buf) // dtype.itemsize)
+         # Ids start at 1. Zero is the preallocated space of an open segment.
+         end = np.flatnonzero(records['id'] == 0)
+         if(len(end) > 0):
+            records = records[:end[0]]
+         arrays.append(records)
+
+      (events, rows) = self.__readText()
+      if(dtype is None):
+         dtype = np.dtype({'names' : DATA_HEADER_FIELDS + [name for (name, fmt) in I_COLUMNS], \
+            'formats' : [STRUCT_DTYPES[fmt] for fmt in DATA_RECORD_HEADER.lstrip("<")] + \
+                        [STRUCT_DTYPES[fmt] for (name, fmt) in I_COLUMNS]})
+      arrays.append(self.__parseRows(rows, dtype))
+
+      data = np.concatenate(arrays)
+      data = data[np.argsort(data['met'], kind='stable')]
+      self.__applyNulls(data)
+      self.__data   = data
+      self.__events = events
+
+
+   def __readText(self):
+      """
+      Split the text log into events and data rows.
+
+      Returns
+      -------
+      tuple
+         (events, rows) where events is a structured array and rows is a
+         list of the fields of each data entry written as text.
+      """
+      events = []
+      rows   = []
+      for line in DinoLogReader.readLog(DinoLogReader.getSegments(self.__indexPath, ".txt")):
+         fields = line.rstrip("\n").split(CSV_SEP)
+         # Skip lines that are not entries (i.e. corrupted).
+         if((len(fields) < 4) or (fields[2][1:].isdigit() == False)):
+            continue
+         try:
+            met = float(fields[1])
+         except ValueError:
+            continue
+         if(fields[2].startswith(EVENT_ID) == True):
+            events.append((int(fields[2][1:]), fields[0], met, CSV_SEP.join(fields[3:])))
+         elif(fields[2].startswith(DATA_ID) == True):
+            rows.append(fields)
+
+      msgLength = max([len(event[3]) for event in events] + [1])
+      dtype = np.dtype({'names' : EVENT_FIELDS, \
+         'formats' : ['<u4', 'U' + str(len(time.strftime(TIME_STR_FORMAT))), '<f8', 'U' + str(msgLength)]})
+      events = np.array(events, dtype)
+      return (events[np.argsort(events['met'], kind='stable')], rows)
+
+
+   @staticmethod
+   def __parseRows(rows, dtype):
+      """
+      Convert data entries from the text log to records. Entries with a
+      different number of columns are skipped.
+      """
+      headerSize = dtype.names.index("nulls") + 1
+      numColumns = len(dtype.names) - headerSize
+      rows = [row for row in rows if (len(row) == numColumns + 3)]
+      records = np.zeros(len(rows), dtype)
+      for i in range(len(rows)):
+         row   = rows[i]
+         nulls = 0
+         for j in range(numColumns):
+            value = row[j + 3]
+            if((value == "None") or (value == "")):
+               nulls = nulls | (1 << j)
+               continue
+            field = dtype.names[j + headerSize]
+            if(dtype[field].kind == 'S'):
+               records[field][i] = value.encode('ascii')
+            else:
+               records[field][i] = float(value) if (dtype[field].kind == 'f') else int(float(value))
+         records['id'][i]    = int(row[2][1:])
+         records['met'][i]   = float(row[1])
+         records['time'][i]  = time.mktime(time.strptime(row[0], TIME_STR_FORMAT))
+         records['nulls'][i] = nulls
+         if("vtime" in dtype.names):
+            records['vtime'][i] = np.nan
+      return records
+
+
+   @staticmethod
+   def __applyNulls(data):
+      """
+      Set float columns that were not available to NaN.
+      """
+      if(len(data) == 0):
+         return
+      nulls = data['nulls']
+      if(np.any(nulls != 0) == False):
+         return
+      columns = data.dtype.names[data.dtype.names.index("nulls") + 1:]
+      for j in range(len(columns)):
+         if(data.dtype[columns[j]].kind == 'f'):
+            data[columns[j]][(nulls >> j) & 1 == 1] = np.nan
@@ -0,0 +1,310 @@
+# Python libraries
+import asyncio
+from collections        import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Project interfaces
+from DinoMain           import *  # Experiment state machine
+
+
+# Number of threads for blocking driver calls (I2C, PiCamera, spectrometer).
+EXECUTOR_WORKERS = 3
+
+# Messages of this module (see DinoLogger).
+_LOGGER = DinoLogger.get("DinoAsyncMain")
+
+
+class DinoAsyncMain(DinoMain):
+   """
+   Class DinoAsyncMain - Run the experiment on a single asyncio event loop.
+
+   DinoMain runs the camera, the servo and the spectrometer as jobs of the
+   DinoScheduler timing thread, next to the main loop and the serial 
+   thread. On the single core Pi Zero these threads compete for the GIL.
+   This class runs the same work as cooperative tasks instead:
+      1) Serial packets are read through a reader callback on the
+         DinoSerial notification fd (see DinoSerial.fileno()).
+      2) Thermal control and Envirophat reads run as periodic tasks.
+      3) Servo agitation, spectrometer captures and the camera recording
+         run as tasks created on DINO_STATE_START_EXP and cancelled on
+         DINO_STATE_END_EXP.
+
+   Blocking driver calls, including waiting for a device that is still
+   being initialized (see DinoStartup.get()), are sent to a small 
+   executor such that they do not stall the event loop. The state 
+   machine is inherited from DinoMain.
+   """
+
+   def __new__(cls, filename="results"):
+      return DinoMain.__new__(cls, filename)
+
+
+   def _readEnvirophat(self):
+      """
+      Return the Envirophat data read by the executor before the packet
+      is processed, such that the event loop does not block on I2C.
+      """
+      return self._envData
+
+
+   def _startExperiment(self):
+      """
+      Create the tasks for the camera, servo and spectrometer once the
+      devices are ready (see _startExperimentAsync()).
+      """
+      self._expTasks = [self._loop.create_task(self._startExperimentAsync())]
+
+
+   def _stopExperiment(self):
+      """
+      Stop the camera, servo and spectrometer tasks in the background
+      (see _stopExperimentAsync()).
+      """
+      self._stopTask = self._loop.create_task(self._stopExperimentAsync())
+
+
+   def _finishTest(self):
+      """
+      Terminate the test. The shutdown runs at the end of _run(), after
+      the experiment was stopped.
+      """
+      self._endTest  = True
+      self._finished = True
+      self._packetsReady.set()
+
+
+   async def _startExperimentAsync(self):
+      """
+      Create the tasks for the camera, servo and spectrometer.
+      """
+      (camera, servo, spectrometer) = await self._runBlocking(self._getExperimentDevices)
+      if(camera is not None):
+         self._expTasks.append(self._loop.create_task(self._recordTask(camera)))
+      if(servo is not None):
+         self._expTasks.append(self._loop.create_task(self._runPeriodic(SERVO_AGITATION_INTERVAL, \
+            lambda: self._runBlocking(servo.agitate))))
+      if(spectrometer is not None):
+         self._expTasks.append(self._loop.create_task(self._runPeriodic(SPECTROMETER_CAPTURE_INTERVAL, \
+            lambda: self._runBlocking(spectrometer.captureOnce))))
+
+
+   async def _stopExperimentAsync(self):
+      """
+      Cancel the camera, servo and spectrometer tasks and wait for them
+      to end, such that the last video file is closed before the 
+      shutdown syncs the log.
+      """
+      for task in self._expTasks:
+         task.cancel()
+      await asyncio.gather(*self._expTasks, return_exceptions=True)
+      await self._runBlocking(DinoMain._stopExperiment, self)
+
+
+   def _onSignal(self):
+      """
+      End the test after a shutdown triggered by a signal.
+      """
+      DinoMain._onSignal(self)
+      self._packetsReady.set()
+
+
+   async def _runBlocking(self, func, *args):
+      """
+      Run a blocking driver call in the executor.
+
+      Parameters
+      ----------
+      func : function
+         Function to call.
+      args : list
+         Arguments for the function.
+
+      Returns
+      -------
+      Value returned by the function.
+      """
+      return await self._loop.run_in_executor(self._executor, func, *args)
+
+
+   async def _runPeriodic(self, period, step):
+      """
+      Await a step every period seconds until it returns False.
+
+      Uses the same fixed-rate deadlines as DinoMain.run().
+
+      Parameters
+      ----------
+      period : float
+         Time in seconds between steps.
+      step : function
+         Coroutine function that returns True to continue.
+      """
+      deadline = DinoTime.getMET()
+      while((await step()) == True):
+         currMet  = DinoTime.getMET()
+         deadline = self._nextDeadline(deadline, period, currMet)
+         await DinoTime.sleepAsync(deadline - currMet)
+
+
+   async def _readEnvirophatAsync(self):
+      """
+      Read the Envirophat in the executor.
+      The lock ensures a single I2C transaction is in progress.
+      """
+      async with self._envLock:
+         start   = DinoProfiler.start()
+         tempEnv = await self._runBlocking(self._readEnvirophatData)
+         DinoProfiler.stop(PHASE_ENVIROPHAT, start)
+         return tempEnv
+
+
+   async def _thermalStep(self):
+      """
+      Run the thermal control algorithm.
+      """
+      start = DinoProfiler.start()
+      try:
+         self._runThermalControl()
+      except:
+         DinoLog.logThrottled("ERROR - Failed Thermal Control.")
+         _LOGGER.debug("Failed Thermal Control")
+      DinoProfiler.stop(PHASE_THERMAL, start)
+      return True
+
+
+   async def _profileTask(self):
+      """
+      Write the loop timing to the log every PROFILE_PERIOD seconds.
+      """
+      while(True):
+         await DinoTime.sleepAsync(PROFILE_PERIOD)
+         DinoProfiler.logSummary()
+         DinoMain._logClock()
+
+
+   async def _recordTask(self, camera):
+      """
+      Record continuously in files of CAMERA_REC_DURATION seconds until
+      the task is cancelled. Files are split without stopping the encoder
+      (see DinoCamera.splitFile()) on drift-free deadlines.
+
+      Parameters
+      ----------
+      camera : DinoCamera
+         Camera to record with.
+      """
+      # Opening the file (with the pre-roll) completes even if the task is
+      # cancelled meanwhile, such that the file is always closed.
+      start   = asyncio.ensure_future(self._runBlocking(camera.startFile))
+      started = False
+      try:
+         started = await asyncio.shield(start)
+         deadline = DinoTime.getMET()
+         while(started == True):
+            deadline = deadline + CAMERA_REC_DURATION
+            await DinoTime.sleepAsync(deadline - DinoTime.getMET())
+            if((await self._runBlocking(camera.splitFile)) == False):
+               break
+      finally:
+         if(start.done() == False):
+            started = await start
+         if(started == True):
+            await self._runBlocking(camera.stopFile)
+
+
+   async def _envirophatTask(self):
+      """
+      Read the Envirophat while there are no packets.
+      Otherwise it is read along with each packet.
+      """
+      while(True):
+         if(DinoTime.getMET() >= self._nextEnv):
+            tempEnv = await self._readEnvirophatAsync()
+            self._data[I_TEMPERATURE] = tempEnv[ENV_HAT_TEMPERATURE]
+            self._nextEnv = self._nextDeadline(self._nextEnv, ENVIROPHAT_PERIOD, DinoTime.getMET())
+         await DinoTime.sleepAsync(self._nextEnv - DinoTime.getMET())
+
+
+   def _onSerialReady(self):
+      """
+      Reader callback for the DinoSerial notification fd.
+      Take the packets queued by the serial thread and wake up _serialTask().
+      """
+      self._pending.extend(self._serial.getPackets())
+      self._packetsReady.set()
+
+
+   async def _serialTask(self):
+      """
+      Process packets as they arrive until the end of the test.
+      """
+      while(self._endTest == False):
+         await self._packetsReady.wait()
+         self._packetsReady.clear()
+         DinoProfiler.countLoop()
+         while((len(self._pending) > 0) and (self._endTest == False)):
+            packet = self._pending.popleft()
+            self._envData = await self._readEnvirophatAsync()
+            start = DinoProfiler.start()
+            self._processPacket(packet)
+            DinoProfiler.stop(PHASE_PACKET, start)
+         self._nextEnv = DinoTime.getMET() + ENVIROPHAT_PERIOD
+
+
+   async def _run(self):
+      """
+      Start all tasks and wait until the end of the test.
+      """
+      self._loop         = asyncio.get_running_loop()
+      self._executor     = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+      self._envLock      = asyncio.Lock()
+      self._packetsReady = asyncio.Event()
+      self._pending      = deque()
+      self._envData      = None
+      self._expTasks     = []
+      self._stopTask     = None
+      self._finished     = False
+      self._shutdown.installSignalHandler(self._onSignal, loop=self._loop)
+
+      # Start receiving packets in the background.
+      self._serial = await self._runBlocking(lambda: self._dinoSerial)
+      if(self._serial.startReading() == False):
+         DinoLog.logMsg("ERROR - Failed To Open Serial Port.")
+         _LOGGER.debug("Failed To Open Serial Port")
+      serialFd = self._serial.fileno()
+      self._loop.add_reader(serialFd, self._onSerialReady)
+
+      self._nextEnv = DinoTime.getMET()
+      tasks = [
+         self._loop.create_task(self._serialTask()),
+         self._loop.create_task(self._runPeriodic(THERMAL_CONTROL_PERIOD, self._thermalStep)),
+         self._loop.create_task(self._envirophatTask()),
+         self._loop.create_task(self._profileTask()),
+         ]
+      try:
+         await tasks[0]
+      finally:
+         self._loop.remove_reader(serialFd)
+         tasks = tasks + self._expTasks
+         for task in tasks:
+            task.cancel()
+         await asyncio.gather(*tasks, return_exceptions=True)
+         if(self._stopTask is not None):
+            await asyncio.gather(self._stopTask, return_exceptions=True)
+         if(self._finished == True):
+            await self._runBlocking(self._shutdown.run, "FINISHED")
+         self._serial.stopReading()
+         self._executor.shutdown(wait=True)
+         self._startup.waitAll()
+         DinoImport.logReport()
+         DinoProfiler.logSummary()
+         DinoMain._logClock()
+         DinoMain._logCompression()
+
+
+   def run(self):
+      """
+      Run the experiment on a new event loop until the end of the test
+      (DINO_STATE_FINISHED or a signal).
+      """
+      asyncio.run(self._run())
@@ -1,15 +1,86 @@
-from threading     import Thread # Thread to record continuously
 from threading     import RLock  # Note re-entrant lock
-from threading     import Event  # Events for communicating within threads
+from threading     import Lock   # Order of the pre-roll and live frames
 
 from DinoConstants import *
 from DinoTime      import *
 from DinoLog       import *
+from DinoScheduler import *  # End of each recording
+from DinoImport    import *  # Lazy import of picamera (NoIR camera)
 
-try:
-   from picamera import PiCamera # NoIR camera
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - PiCamera not loaded.")
+
+class DinoPrerollOutput(object):
+   """
+   Class DinoPrerollOutput - File that starts with the pre-roll.
+
+   Output of the encoder for the first file after the camera was armed
+   (see DinoCamera.arm()). The encoder switches to this output while the
+   pre-roll is still in the circular buffer, so the live frames are held
+   in memory until writePreroll() wrote the buffer to the file. The file
+   then has the pre-roll followed by the live frames without a gap.
+   """
+
+   def __init__(self, path):
+      """
+      Open the file.
+      """
+      self.__fp      = open(path, 'wb')
+      self.__pending = []    # Live frames received before the pre-roll.
+      self.__ready   = False # Set once the pre-roll was written.
+      self.__lock    = Lock()
+
+
+   def writePreroll(self, buffer):
+      """
+      Write the content of the circular buffer followed by the live
+      frames received so far. Called once the encoder writes to this
+      output, such that the buffer does not change anymore.
+
+      Parameters
+      ----------
+      buffer : picamera.PiCameraCircularIO
+         Buffer of the armed camera.
+
+      Returns
+      -------
+      int
+         Bytes of pre-roll written.
+      """
+      try:
+         buffer.copy_to(self.__fp)
+      except:
+         DinoLog.logMsg("ERROR - Failed to write PiCamera pre-roll.")
+      size = self.__fp.tell()
+      with self.__lock:
+         for data in self.__pending:
+            self.__fp.write(data)
+         self.__pending = []
+         self.__ready   = True
+      return size
+
+
+   def write(self, data):
+      """
+      Write frames from the encoder.
+      """
+      with self.__lock:
+         if(self.__ready == False):
+            self.__pending.append(bytes(data))
+            return len(data)
+      return self.__fp.write(data)
+
+
+   def flush(self):
+      """
+      Flush the file (called by the encoder when it switches output).
+      """
+      self.__fp.flush()
+
+
+   def close(self):
+      """
+      Close the file.
+      """
+      self.__fp.close()
 
 
 class DinoCamera(object):
@@ -22,7 +93,15 @@ class DinoCamera(object):
    The stream of short recordings was designed to ensure files are saved
    periodically such that the data is not lost in case of an anomaly. 
    Each filename appends a timestamp such that the sequence of videos 
-   can be reconstructed for post-processing. 
+   can be reconstructed for post-processing. The files of a stream are
+   split without stopping the encoder (see splitFile()), such that the
+   footage is continuous and every file has the same duration.
+
+   Before the recording starts, the camera can be armed to keep the last
+   seconds of video in a circular buffer in memory (see arm()). The
+   first file then starts with the buffered pre-roll, such that the
+   event that started the recording is captured without the latency of
+   the state machine and of starting the encoder.
    """
 
    # DinoCamera Singleton instance 
@@ -31,6 +110,7 @@ class DinoCamera(object):
    # Constants
    MIN_DURATION = 5.0
    MAX_DURATION = 60.0
+   MAX_PREROLL  = 30.0
 
 
    def __new__(cls, filename="dinoVideo"):
@@ -47,40 +127,35 @@ class DinoCamera(object):
       if(DinoCamera.__instance is None):
          DinoCamera.__instance  = object.__new__(cls)
          DinoCamera.__filename  = filename
+         DinoCamera.__filepath  = ""
          DinoCamera.__folder    = DinoLog.getFolder()
          DinoCamera.__isRecording = False
          DinoCamera.__count     = 0
          DinoCamera.__single    = True
-         DinoCamera.__thread    = None
+         DinoCamera.__job       = None
+         DinoCamera.__recStart  = 0
+         DinoCamera.__preroll   = None  # Circular buffer while armed.
+         DinoCamera.__output    = None  # Output of a file that started with the pre-roll.
          DinoCamera.__lockCount = None
          DinoCamera.__lockRec   = None
-         DinoCamera.__stop      = None
 
          # Create lock object to protect shared resources
          # between the PiCamera() object and the main thread.
          # Note that these are separate such that they reduce 
          # deadlock scenarios:
          # __lockCount - used for updating/reading num recordings
-         # __lockRec - used to check if the recording thread is alive
+         # __lockRec - used to start/stop the files and check if one is open
          try:
             DinoCamera.__lockCount = RLock()         
             DinoCamera.__lockRec   = RLock()
          except:
             DinoLog.logMsg("ERROR - Could not create lock for PiCamera().")
 
-         # Create event to notify recording thread when to stop.
-         # While this could have been done with a lock, the event 
-         # has built in functions for checking if a flag is set.
-         try:
-            DinoCamera.__stop = Event()
-            DinoCamera.__stop.set()
-         except:
-            DinoLog.logMsg("ERROR - Could not create event for PiCamera().")
-
          # Create PiCamera object.
          # Change configuration parameters as needed for the 
+         picamera = DinoImport.load("picamera", "PiCamera")
          try:
-            DinoCamera.__camera = PiCamera()
+            DinoCamera.__camera = picamera.PiCamera()
             DinoCamera.__camera.resolution = (800, 600)
             DinoCamera.__camera.framerate  = 15
          except:
@@ -91,14 +166,14 @@ class DinoCamera(object):
 
    def __del__(self):
       """
-      Destructor that stops the active recording and terminates the thread.
+      Destructor that stops the active recording.
       """
       self.stopRecording()
 
 
    def isRecording(self):
       """
-      Return True if thread is active and PiCamera is recording.
+      Return True if PiCamera is recording.
       """
       self.__lockRec.acquire()
       isRecording = self.__isRecording
@@ -106,6 +181,79 @@ class DinoCamera(object):
       return isRecording
 
 
+   def isArmed(self):
+      """
+      Return True if PiCamera is recording into the pre-roll buffer.
+      """
+      self.__lockRec.acquire()
+      isArmed = (self.__preroll is not None)
+      self.__lockRec.release()
+      return isArmed
+
+
+   def arm(self, preroll=CAMERA_PREROLL):
+      """
+      Start recording into a circular buffer in memory that keeps the
+      last seconds of video. The next startRecording() (or startFile())
+      writes the buffer at the start of the file and continues with the
+      same encoder. The buffer uses preroll * CAMERA_BITRATE / 8 bytes.
+
+      Parameters
+      ----------
+      preroll : float
+         Seconds of video kept in the buffer.
+
+      Returns
+      -------
+      bool
+         True if the camera is armed.
+         False if it was already recording or armed, or failed to start.
+      """
+      if((preroll <= 0) or (preroll > self.MAX_PREROLL)):
+         DinoLog.logMsg("ERROR - Invalid PiCamera pre-roll=[" + str(preroll) + "].")
+         return False
+      picamera = DinoImport.load("picamera", "PiCamera")
+      self.__lockRec.acquire()
+      try:
+         if((self.__isRecording == True) or (self.__preroll is not None)):
+            return False
+         try:
+            self.__preroll = picamera.PiCameraCircularIO(self.__camera, seconds=preroll, bitrate=CAMERA_BITRATE)
+            self.__camera.start_recording(self.__preroll, format='h264', bitrate=CAMERA_BITRATE)
+         except:
+            self.__preroll = None
+            DinoLog.logMsg("ERROR - Failed to arm PiCamera pre-roll=[" + str(preroll) + "sec]")
+            return False
+      finally:
+         self.__lockRec.release()
+      DinoLog.logMsg("Armed PiCamera pre-roll=[" + str(preroll) + "sec] buffer=[" + \
+         str(int(preroll * CAMERA_BITRATE / 8)) + "B]")
+      return True
+
+
+   def disarm(self):
+      """
+      Stop recording into the pre-roll buffer and release the memory.
+
+      Returns
+      -------
+      bool
+         True if the camera was armed.
+      """
+      self.__lockRec.acquire()
+      try:
+         if(self.__preroll is None):
+            return False
+         self.__preroll = None
+         try:
+            self.__camera.stop_recording()
+         except:
+            DinoLog.logMsg("ERROR - Failed to disarm PiCamera.")
+      finally:
+         self.__lockRec.release()
+      return True
+
+
    def getNumRecordings(self):
       """
       Return the number of recordings made since the start of the program.
@@ -143,123 +291,229 @@ class DinoCamera(object):
          DinoLog.logMsg("ERROR - Invalid PiCamera recording duration=[" + str(duration) + "].")
          return False
 
-      # Record settings and start thread
+      # Record settings and start the first file.
       self.__duration  = int(duration)
-      self.__stop.set()
       self.__single    = single
-   
-      # Start thread.
+      self.__lockRec.acquire()
       try:
-         self.__stop.clear()
-         self.__thread = Thread(target=self.__run, args=(self.__stop, self.__lockCount, self.__lockRec,))
-         self.__thread.start()
-         status = (self.__thread is not None)
-      except:
-         DinoLog.logMsg("ERROR - Could not start PiCamera thread.")
-         status = False
-      return status
-
-
-   def stopRecording(self):
+         if(self.startFile() == False):
+            return False
+         self.__isRecording = True
+
+         # End or split the file when it reaches the duration. 
+         self.__job = DinoScheduler().schedule("camera", self.__nextFile, self.__duration, self.__duration)
+         if(self.__job is None):
+            DinoLog.logMsg("ERROR - Could not schedule PiCamera recording.")
+            self.__endFile()
+            return False
+      finally:
+         self.__lockRec.release()
+      return True
+
+
+   def stopRecording(self, timeout=None):
       """ 
-      Stop camera recording and terminate thread. 
+      Stop camera recording. 
 
       Terminates the ongoing recording even if it has not finished
-      the desired video duration. This will also stop terminate 
-      continuous recording in order to end the thread.
+      the desired video duration. This will also stop continuous 
+      recording.
+
+      Parameters
+      ----------
+      timeout : float
+         Maximum time in seconds to wait for a file that is being 
+         switched by the recording job (None waits until done, 0 only
+         cancels the job).
 
       Return
       ------
       bool
-         True if the recording was stopped or there was nothing running.
+         True if the recording is still in progress.
+      """
+      # Not triggered yet.
+      self.disarm()
+      job = self.__job
+      if(job is None):
+         return False
+      if(job.cancel(timeout) == False):
+         return self.isRecording()
+      self.__lockRec.acquire()
+      try:
+         if(self.__isRecording == True):
+            self.__endFile()
+      finally:
+         self.__lockRec.release()
+      return self.isRecording()
+
+
+   def startFile(self):
+      """
+      Start recording a new file named with the current timestamp.
+      If the camera is armed, the encoder already runs and switches to
+      the file, which starts with the pre-roll (see arm()).
+
+      Used by the recording job (see DinoScheduler) and by DinoAsyncMain,
+      which schedules each recording as a task.
+
+      Returns
+      -------
+      bool
+         True if the recording started. False otherwise.
+      """
+      # Generate filename for new recording
+      timestamp = DinoTime.getTimestampStr()
+      self.__filepath = self.__filename + "_" + timestamp + ".h264"
+
+      # Start new recording. If successful, increment the recording counter.
+      try:
+         if(self.__preroll is None):
+            self.__camera.start_recording(self.__folder + "/" + self.__filepath, bitrate=CAMERA_BITRATE)
+         else:
+            self.__startPreroll()
+         self.__recStart = DinoTime.getMET()
+         #DinoLog.logMsg("Start PiCamera file=[" + self.__filepath + "]")
+         self.__lockCount.acquire()
+         self.__count = self.__count + 1
+         self.__lockCount.release()
+      except:
+         DinoLog.logMsg("ERROR - Failed to start PiCamera file=[" + self.__filepath + "]")
+         return False
+      return True
+
+
+   def splitFile(self):
+      """
+      Continue the recording in a new file named with the current timestamp.
+
+      The encoder keeps running (PiCamera.split_recording()), so no frames
+      are lost between the files. A key frame is requested first such that
+      the new file starts on the next frame instead of waiting for the
+      next periodic key frame. The duration logged for the previous file
+      is measured when the split completed.
+
+      Used by the recording job for continuous recordings and by 
+      DinoAsyncMain.
+
+      Returns
+      -------
+      bool
+         True if the recording continues in the new file. False otherwise
+         (the recording is still in the previous file).
       """
-      self.__stop.set()
+      # Generate filename for the next file
+      timestamp = DinoTime.getTimestampStr()
+      filepath  = self.__filename + "_" + timestamp + ".h264"
+
+      # Returns once the new file received its first frame.
       try:
-         self.__thread.join()
-         self.__thread = None
+         self.__camera.request_key_frame()
+         self.__camera.split_recording(self.__folder + "/" + filepath)
       except:
+         DinoLog.logMsg("ERROR - Failed to split PiCamera file=[" + filepath + "]")
          return False
-      return self.isRecording()
+      self.__closeOutput()
+      splitTime = DinoTime.getMET()
+      DinoLog.logMsg("Split PiCamera file=[" + self.__filepath + "] duration=[" + \
+         str(splitTime - self.__recStart) + "sec]")
+      self.__filepath = filepath
+      self.__recStart = splitTime
+      self.__lockCount.acquire()
+      self.__count = self.__count + 1
+      self.__lockCount.release()
+      return True
+
 
+   def stopFile(self, recTime=None):
+      """
+      Stop the recording started with startFile().
+
+      Parameters
+      ----------
+      recTime : float
+         Duration of the recording in seconds (for the log). Defaults
+         to the time since the current file started.
+
+      Returns
+      -------
+      bool
+         True if the recording stopped. False otherwise.
+      """
+      if(recTime is None):
+         recTime = DinoTime.getMET() - self.__recStart
+      try:
+         self.__camera.stop_recording()
+         self.__closeOutput()
+         DinoLog.logMsg("Stop PiCamera file=[" + self.__filepath + "] duration=[" + str(recTime) + "sec]")
+      except:
+         DinoLog.logMsg("ERROR - Failed to stop PiCamera PiCamera file=[" + self.__filepath + "] ")
+         return False
+      return True
 
-   def __run(self, stopEvent, lockCount, lockRec):
+
+   def __nextFile(self):
       """ 
-      Thread for PiCamera. 
-
-      The thread runs once for a single recording (for testing) or
-      continuosly for a stream of recordings. If run continuosuly, 
-      the application must call stopRecording() to terminate the thread.
-
-      For each recording, the thread will:
-      1. Assign a unique filename with a timestamp
-      2. Start a recording
-      3. Capture the MET at the start of the recording
-      4. Wait in a loop until the recording completed
-
-      Exit the loop if an error is encountered when commanding the PiCamera
-      or when the stopEvent flag is set through the stopRecording() function.
-
-      Parameter
-      ---------
-      stopEvent : threading.Event
-         Flag to stop this thread from the main application.
-         Set by calling the function stopRecording()
-      lockCount : threading.RLock
-         Re-entrant safe lock to edit self.__count variable. 
-         This is updated after successfully starting a new recording.
-      lockRec : threading.RLock
-         Re-entrant safe lock to edit self.__isRecording variable.
-         This is set when the thread starts and cleared when the thread ends.
-         Used by the application to check whether there is a 
-         recording in progress.
-      """
-      # Set protected flag to show thread has started
-      lockRec.acquire()
-      self.__isRecording = True
-      lockRec.release()
-
-      # Run main loop for the required number of recordings
-      firstTime = True
-      faultFound = False
-      while(((firstTime == True) or (self.__single == False)) and (stopEvent.isSet() == False) and (faultFound == False)):
-         firstTime = False
-
-         # Generate filename for new recording
-         timestamp = DinoTime.getTimestampStr()
-         filepath = self.__filename + "_" + timestamp + ".h264"         
-         
-         # Start new recording. If successful, increment the recording counter.
-         try:
-            self.__camera.start_recording(self.__folder + "/" + filepath)
-            #DinoLog.logMsg("Start PiCamera file=[" + filepath + "]")
-            lockCount.acquire()
-            self.__count = self.__count + 1
-            lockCount.release()
-         except:
-            DinoLog.logMsg("ERROR - Failed to start PiCamera file=[" + filepath + "]")
-            faultFound = True
-
-         # Wait until it reaches the end of the recording or the application sends a request to stop the capture.
-         # Note that we do not want to sleep for the entire duration becasue that doesn't allow us to stop/save 
-         # the file early if needed. 
-         recStartTime = DinoTime.getMET() 
-         recTime = DinoTime.getMET() - recStartTime
-         while((recTime <= self.__duration) and (stopEvent.isSet() == False and (faultFound == False))):
-            time.sleep(2)
-            recTime = DinoTime.getMET() - recStartTime
-
-         # Stop the recording.
+      Recording job, run by DinoScheduler at the end of each file.
+
+      Stops a single recording or, for a stream of continuous recordings,
+      splits the file that reached the duration. Since the job runs on
+      absolute deadlines, every file has the same duration.
+
+      Returns
+      -------
+      bool
+         True to run again at the end of the next file. False after a
+         single recording, when the recording was stopped or on a fault.
+      """
+      self.__lockRec.acquire()
+      try:
+         if(self.__isRecording == False):
+            return False
+         if((self.__single == True) or (self.splitFile() == False)):
+            self.__endFile()
+            return False
+      finally:
+         self.__lockRec.release()
+      return True
+
+
+   def __startPreroll(self):
+      """
+      Switch the encoder from the pre-roll buffer to the current file
+      and write the pre-roll at the start of the file.
+      """
+      preroll = self.__preroll
+      self.__preroll = None
+      output = DinoPrerollOutput(self.__folder + "/" + self.__filepath)
+      try:
+         self.__camera.request_key_frame()
+         self.__camera.split_recording(output)
+      except:
+         output.close()
          try:
             self.__camera.stop_recording()
-            DinoLog.logMsg("Stop PiCamera file=[" + filepath + "] duration=[" + str(recTime) + "sec]")
          except:
-            DinoLog.logMsg("ERROR - Failed to stop PiCamera PiCamera file=[" + filepath + "] ")
-            faultFound = True
+            DinoLog.logMsg("ERROR - Failed to disarm PiCamera.")
+         raise
+      self.__output = output
+      size = output.writePreroll(preroll)
+      DinoLog.logMsg("Pre-roll PiCamera file=[" + self.__filepath + "] size=[" + str(size) + "B]")
 
-      # Clear protected flag to show thread has started
-      lockRec.acquire()
-      self.__isRecording = False
-      lockRec.release()
-      stopEvent.set()
 
+   def __closeOutput(self):
+      """
+      Close the file that started with the pre-roll once the encoder
+      switched to another output.
+      """
+      if(self.__output is not None):
+         self.__output.close()
+         self.__output = None
 
+
+   def __endFile(self):
+      """
+      Stop the current file and clear the recording flag.
+      Called with __lockRec.
+      """
+      self.__isRecording = False
+      return self.stopFile()
@@ -0,0 +1,222 @@
+import os
+import time
+import gzip
+import lzma
+import queue
+from   threading import Thread # Compression thread
+from   threading import Event  # Pause/resume and wait for the queue
+
+from DinoLog import *
+
+
+# Compression methods and the extension added to compressed files.
+COMPRESS_ZLIB = ".gz"   # zlib (gzip container). Fast, for the Pi Zero.
+COMPRESS_LZMA = ".xz"   # lzma. Smaller files, much slower.
+
+# Default level of each method. Low levels are used since the Pi Zero
+# has a single core and the log is mostly repeated numbers.
+COMPRESS_LEVELS = {COMPRESS_ZLIB : 1, COMPRESS_LZMA : 0}
+
+# Fraction of one CPU the compression thread may use on average.
+COMPRESS_CPU_BUDGET = 0.2
+
+# Bytes compressed between checks of the CPU budget.
+COMPRESS_CHUNK = 65536
+
+# Extension of a file while it is being compressed.
+COMPRESS_TMP_EXT = ".tmp"
+
+
+class DinoCompressor(object):
+   """
+   Class DinoCompressor - Compress complete files in the background.
+
+   Files are queued with submit() once they will not be written again
+   (i.e. a full log segment or a spectrum) and compressed one at a time
+   by a background thread. The compressed file is written next to the
+   original with the method's extension and replaces it once complete,
+   such that a power cut never leaves a file without a complete copy.
+   Use DinoCompressor.open() to read a file whether it was compressed
+   or not.
+
+   The thread uses at most COMPRESS_CPU_BUDGET of one CPU, by sleeping
+   between chunks when it is ahead of its budget. The application can
+   also pause() it entirely (i.e. during the experiment) and resume()
+   it afterwards.
+
+   Like DinoProfiler, the class uses static methods such that any class
+   can queue files without first getting an instance. Files submitted
+   before the compressor is created are left uncompressed.
+   """
+
+   # DinoCompressor Singleton instance
+   __instance = None
+
+
+   def __new__(cls, method=COMPRESS_ZLIB, level=None, budget=COMPRESS_CPU_BUDGET):
+      """
+      Create a singleton instance and start the compression thread.
+
+      Parameters
+      ----------
+      method : str
+         COMPRESS_ZLIB or COMPRESS_LZMA.
+      level : int
+         Compression level. Defaults to COMPRESS_LEVELS[method].
+      budget : float
+         Fraction of one CPU the thread may use (0 to 1].
+      """
+      if(DinoCompressor.__instance is None):
+         DinoCompressor.__instance = object.__new__(cls)
+         DinoCompressor.__method   = method
+         DinoCompressor.__level    = COMPRESS_LEVELS[method] if (level is None) else level
+         DinoCompressor.__budget   = budget
+         DinoCompressor.__queue    = queue.Queue()
+         DinoCompressor.__resume   = Event()
+         DinoCompressor.__resume.set()
+         DinoCompressor.__stats    = {'files' : 0, 'bytesIn' : 0, 'bytesOut' : 0, 'cpu' : 0.0}
+         DinoCompressor.__thread   = Thread(target=DinoCompressor.__run, name="DinoCompressor", daemon=True)
+         DinoCompressor.__thread.start()
+
+         # Compress each log segment once it is full.
+         DinoLog.setSealedHandler(DinoCompressor.submit)
+      return DinoCompressor.__instance
+
+
+   @staticmethod
+   def submit(path):
+      """
+      Queue a complete file for compression.
+
+      Parameters
+      ----------
+      path : str
+         File that will not be written again.
+      """
+      if(DinoCompressor.__instance is not None):
+         DinoCompressor.__queue.put(path)
+
+
+   @staticmethod
+   def pause():
+      """
+      Stop compressing after the current chunk until resume() is called.
+      """
+      if(DinoCompressor.__instance is not None):
+         DinoCompressor.__resume.clear()
+         DinoLog.logMsg("Compression paused.")
+
+
+   @staticmethod
+   def resume():
+      """
+      Resume compressing after pause(). Does nothing if not paused.
+      """
+      if((DinoCompressor.__instance is not None) and (DinoCompressor.__resume.is_set() == False)):
+         DinoCompressor.__resume.set()
+         DinoLog.logMsg("Compression resumed.")
+
+
+   @staticmethod
+   def waitAll():
+      """
+      Wait until all files submitted so far are compressed.
+      Resumes the compressor if it was paused.
+
+      Returns
+      -------
+      dict
+         'files' : number of files compressed.
+         'bytesIn' : bytes before compression.
+         'bytesOut' : bytes after compression.
+         'cpu' : CPU time in seconds used by the thread.
+      """
+      if(DinoCompressor.__instance is None):
+         return None
+      DinoCompressor.__resume.set()
+      DinoCompressor.__queue.join()
+      return dict(DinoCompressor.__stats)
+
+
+   @staticmethod
+   def open(path, mode='rb'):
+      """
+      Open a file that may have been compressed by DinoCompressor.
+
+      The original file is used if it still exists. Otherwise the
+      compressed copy is decompressed on the fly.
+
+      Parameters
+      ----------
+      path : str
+         Filename before compression.
+      mode : str
+         'rb' or 'r' (text).
+
+      Returns
+      -------
+      file
+         File object open for reading.
+      """
+      if(os.path.exists(path) == True):
+         return open(path, mode)
+      if(os.path.exists(path + COMPRESS_ZLIB) == True):
+         return gzip.open(path + COMPRESS_ZLIB, mode if (mode != 'r') else 'rt')
+      if(os.path.exists(path + COMPRESS_LZMA) == True):
+         return lzma.open(path + COMPRESS_LZMA, mode if (mode != 'r') else 'rt')
+      return open(path, mode)
+
+
+   @staticmethod
+   def __openOutput(path):
+      """
+      Open the compressed output of a file with the configured method.
+      """
+      if(DinoCompressor.__method == COMPRESS_LZMA):
+         return lzma.open(path, 'wb', preset=DinoCompressor.__level)
+      return gzip.open(path, 'wb', compresslevel=DinoCompressor.__level)
+
+
+   @staticmethod
+   def __compress(path):
+      """
+      Compress a file within the CPU budget and replace the original.
+      """
+      output = path + DinoCompressor.__method
+      tmp    = output + COMPRESS_TMP_EXT
+      stats  = DinoCompressor.__stats
+      cpuStart  = time.thread_time()
+      wallStart = time.monotonic()
+      with open(path, 'rb') as src, DinoCompressor.__openOutput(tmp) as dst:
+         while(True):
+            # Wait while paused, then stay within the CPU budget.
+            DinoCompressor.__resume.wait()
+            cpu  = time.thread_time() - cpuStart
+            wall = time.monotonic() - wallStart
+            if(cpu > DinoCompressor.__budget * wall):
+               time.sleep(cpu / DinoCompressor.__budget - wall)
+
+            chunk = src.read(COMPRESS_CHUNK)
+            if(len(chunk) == 0):
+               break
+            dst.write(chunk)
+            stats['bytesIn'] = stats['bytesIn'] + len(chunk)
+      os.replace(tmp, output)
+      os.remove(path)
+      stats['bytesOut'] = stats['bytesOut'] + os.path.getsize(output)
+      stats['files']    = stats['files'] + 1
+      stats['cpu']      = stats['cpu'] + time.thread_time() - cpuStart
+
+
+   @staticmethod
+   def __run():
+      """
+      Compression thread. Compress files in the order they were submitted.
+      """
+      while(True):
+         path = DinoCompressor.__queue.get()
+         try:
+            DinoCompressor.__compress(path)
+         except:
+            DinoLog.logMsg("ERROR - Could not compress file=[" + str(path) + "].")
+         DinoCompressor.__queue.task_done()
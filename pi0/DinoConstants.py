@@ -48,9 +48,16 @@ LIFT_OFF_EVENT            = 7.0     # sec
 COAST_START_EVENT         = 177.0   # sec
 COAST_END_EVENT           = 348.0   # sec
 
-# Camera recording duration in seconds
+# Duration of each file of the camera recording in seconds
 CAMERA_REC_DURATION = 30.0
 
+# Seconds of video kept in memory before the recording starts (pre-roll).
+# The buffer uses CAMERA_PREROLL * CAMERA_BITRATE / 8 bytes (5MB).
+CAMERA_PREROLL = 10.0
+
+# H.264 bitrate of the camera in bits per second.
+CAMERA_BITRATE = 4000000
+
 # Servo agitation interval in seconds
 SERVO_AGITATION_INTERVAL = 4.0
 
@@ -85,4 +92,22 @@ I_ACCEL_Y         = 10  # Float
 I_ACCEL_Z         = 11  # Float
 I_SIZE            = 12
 
+# Name and binary log format (see struct) of each column, indexed by I_*.
+# Floats are stored as doubles such that converting the binary log back
+# to CSV matches the text log.
+I_COLUMNS = (
+   ("flight_state", "c"),
+   ("altitude",     "d"),
+   ("acceleration", "d"),
+   ("light_red",    "H"),
+   ("light_green",  "H"),
+   ("light_blue",   "H"),
+   ("light_clear",  "H"),
+   ("temperature",  "d"),
+   ("pressure",     "d"),
+   ("accel_x",      "d"),
+   ("accel_y",      "d"),
+   ("accel_z",      "d"),
+   )
+
 
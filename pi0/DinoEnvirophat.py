@@ -1,14 +1,7 @@
 from DinoConstants import *
 from DinoTime      import *
 from DinoLog       import *
-
-try:
-   from envirophat import light    # light sensor
-   from envirophat import leds     # control leds on the board
-   from envirophat import weather  # temperature and pressure sensors
-   from envirophat import motion   # accelerometer sensor
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - Envirophat not loaded.")
+from DinoImport    import *  # Lazy import of envirophat
 
 
 # Index of telemetry read from Envirophat
@@ -56,6 +49,9 @@ class DinoEnvirophat(object):
          DinoEnvirophat.__instance = object.__new__(cls)
          DinoEnvirophat.__data = [None] * ENV_HAT_SIZE
 
+         # Load light, leds, weather and motion sensors into this module.
+         DinoImport.load("envirophat", "Envirophat", globals())
+
          # Turns LEDs on the board off so that they do not 
          # interfere with the experiment.
          try:
@@ -107,7 +103,7 @@ class DinoEnvirophat(object):
       try:
          temp = light.raw()
       except:
-         DinoLog.logMsg("ERROR - Envirophat fail to read light sensor.")
+         DinoLog.logThrottled("ERROR - Envirophat fail to read light sensor.")
          temp = (None, None, None, None)
       return temp
             
@@ -124,7 +120,7 @@ class DinoEnvirophat(object):
       try:
          value = (weather.temperature(),)
       except:
-         DinoLog.logMsg("ERROR - Envirophat fail to read temperature.")
+         DinoLog.logThrottled("ERROR - Envirophat fail to read temperature.")
          value = (None,)
       return value   
 
@@ -140,7 +136,7 @@ class DinoEnvirophat(object):
       try:
          value = (weather.pressure(unit='Pa'),)
       except:
-         DinoLog.logMsg("ERROR - Envirophat fail to read pressure.")
+         DinoLog.logThrottled("ERROR - Envirophat fail to read pressure.")
          value = (None,)
       return value
 
@@ -157,7 +153,7 @@ class DinoEnvirophat(object):
       try:
          value = motion.accelerometer()
       except:
-         DinoLog.logMsg("ERROR - Envirophat fail to read acceleration.")
+         DinoLog.logThrottled("ERROR - Envirophat fail to read acceleration.")
          value = (None, None, None)
       return value
 
@@ -0,0 +1,178 @@
+import re
+
+
+# Bytes that terminate a packet. The New Shepard sends "\n" while
+# the HAB pi3 sends "\n\r", so either one ends a packet.
+FRAME_TERMINATORS = b"\r\n"
+
+
+class DinoFramer(object):
+   """
+   Class DinoFramer - Split a serial byte stream into packets.
+
+   A serial read returns whatever bytes arrived before the timeout, which
+   may be part of a packet, one packet, or several packets. The framer
+   accumulates those bytes in a buffer and returns every complete packet,
+   carrying any partial packet over to the next read.
+
+   Each packet must start with a sync character (the flight state letter)
+   at a fixed offset. Bytes that do not line up with a sync character are
+   discarded up to the next one, which resynchronizes the stream after a
+   corrupted or truncated packet.
+
+   The buffer works as a ring: consumed bytes are only tracked with a read
+   index and the space is reclaimed once the read index passes
+   COMPACT_SIZE, such that the data is not copied on every read.
+   """
+
+   # Read index after which consumed bytes are removed from the buffer.
+   COMPACT_SIZE = 1024
+
+
+   def __init__(self, syncChars, syncOffset=0, maxLength=200):
+      """
+      Create a framer.
+
+      Parameters
+      ----------
+      syncChars : str
+         Characters that may start a packet (i.e. NR_STATE_LETTERS).
+      syncOffset : int
+         Number of bytes in a packet before the sync character.
+      maxLength : int
+         Maximum number of bytes in a packet. A partial packet longer
+         than this is discarded.
+      """
+      self.__syncOffset = syncOffset
+      self.__maxLength  = maxLength
+      self.__syncRe     = re.compile(b"[" + re.escape(syncChars.encode("ascii")) + b"]")
+      self.__termRe     = re.compile(b"[" + re.escape(FRAME_TERMINATORS) + b"]")
+      self.__isSync     = [False] * 256
+      for c in syncChars.encode("ascii"):
+         self.__isSync[c] = True
+      self.__isTerm     = [False] * 256
+      for c in FRAME_TERMINATORS:
+         self.__isTerm[c] = True
+
+      self.__buf   = bytearray()
+      self.__start = 0
+
+      # Counters
+      self.__numBytes     = 0
+      self.__numPackets   = 0
+      self.__numResyncs   = 0
+      self.__numDiscarded = 0
+
+
+   def feed(self, data):
+      """
+      Add bytes read from the serial port and return complete packets.
+
+      Parameters
+      ----------
+      data : bytes
+         Bytes returned by the last read.
+
+      Returns
+      -------
+      list
+         List of packets (bytes) without terminators, in the order received.
+      """
+      buf = self.__buf
+      buf += data
+      self.__numBytes = self.__numBytes + len(data)
+
+      packets = []
+      start   = self.__start
+      end     = len(buf)
+      offset  = self.__syncOffset
+      while(start < end):
+         # Skip terminators left between packets.
+         if(self.__isTerm[buf[start]] == True):
+            start = start + 1
+            continue
+
+         # Wait for more data if the sync character was not received yet.
+         if(start + offset >= end):
+            break
+
+         # Resync if the packet does not start with a sync character.
+         if(self.__isSync[buf[start + offset]] == False):
+            start = self.__resync(start, end)
+            continue
+
+         # Find the end of the packet.
+         match = self.__termRe.search(buf, start)
+         if(match is None):
+            if(end - start > self.__maxLength):
+               start = self.__resync(start, end)
+               continue
+            break
+
+         stop = match.start()
+         packets.append(bytes(buf[start:stop]))
+         start = stop + 1
+
+      self.__numPackets = self.__numPackets + len(packets)
+
+      # Reclaim consumed space.
+      if(start >= end):
+         del buf[:]
+         start = 0
+      elif(start > self.COMPACT_SIZE):
+         del buf[:start]
+         start = 0
+      self.__start = start
+      return packets
+
+
+   def __resync(self, start, end):
+      """
+      Discard bytes from start up to the next sync character.
+
+      Parameters
+      ----------
+      start : int
+         Index of the first byte of the misaligned packet.
+      end : int
+         Number of bytes in the buffer.
+
+      Returns
+      -------
+      int
+         Index where the next packet starts.
+      """
+      match = self.__syncRe.search(self.__buf, start + self.__syncOffset + 1)
+      if(match is None):
+         # Keep the bytes that may precede a sync character not received yet.
+         newStart = max(start, end - self.__syncOffset)
+      else:
+         newStart = match.start() - self.__syncOffset
+      self.__numResyncs   = self.__numResyncs + 1
+      self.__numDiscarded = self.__numDiscarded + (newStart - start)
+      return newStart
+
+
+   def reset(self):
+      """
+      Discard any partial packet (i.e. after flushing the serial port).
+      """
+      self.__numDiscarded = self.__numDiscarded + (len(self.__buf) - self.__start)
+      del self.__buf[:]
+      self.__start = 0
+
+
+   def getStats(self):
+      """
+      Return the framer counters since it was created.
+
+      Returns
+      -------
+      dict
+         Number of 'bytes' received, 'packets' returned,
+         'resyncs' performed and 'discarded' bytes.
+      """
+      return {'bytes'     : self.__numBytes,
+              'packets'   : self.__numPackets,
+              'resyncs'   : self.__numResyncs,
+              'discarded' : self.__numDiscarded}
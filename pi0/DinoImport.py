@@ -0,0 +1,121 @@
+import time
+import importlib
+from   threading import RLock
+
+from DinoConstants import *
+from DinoLog       import *
+
+
+class DinoImport(object):
+   """
+   Class DinoImport - Load hardware libraries on first use.
+
+   Importing picamera, envirophat, gpiozero, serial and the spectrometer
+   wrappers at the top of each module made every one of them load (and
+   stay resident) as soon as DinoMain was imported, even for devices that
+   are only needed once the experiment starts. Instead, each class loads
+   its library with DinoImport.load() when its singleton is created.
+
+   The time taken by each import is recorded such that regressions in
+   the cold start time show up in the log (see logReport()).
+
+   This class was designed using static methods such that these methods
+   can be called from any part of the application.
+   """
+
+   # Time in seconds taken by each import, in the order they were loaded.
+   __times = {}
+
+   # Libraries that failed to load (the error is only printed once).
+   __failed = set()
+
+   # Number of entries in __times already written to the log.
+   __numLogged = 0
+
+   # Devices are created concurrently (see DinoStartup).
+   __lock = RLock()
+
+
+   @staticmethod
+   def load(moduleName, desc=None, namespace=None):
+      """
+      Import a module and record how long it took.
+
+      Parameters
+      ----------
+      moduleName : str
+         Name of the module (i.e. "picamera").
+      desc : str
+         Description used in the error message if the import fails.
+      namespace : dict
+         If given (i.e. globals() of the caller), the public names of the
+         module are copied into it as "from module import *" would.
+
+      Returns
+      -------
+      module
+         Module imported, or None if it could not be imported.
+      """
+      with DinoImport.__lock:
+         if(moduleName in DinoImport.__failed):
+            return None
+         start = time.perf_counter()
+         try:
+            module = importlib.import_module(moduleName)
+         except:
+            DinoImport.__failed.add(moduleName)
+            print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - " + \
+               str(desc if (desc is not None) else moduleName) + " not loaded.")
+            return None
+         if(moduleName not in DinoImport.__times):
+            DinoImport.__times[moduleName] = time.perf_counter() - start
+
+      if(namespace is not None):
+         names = getattr(module, "__all__", None)
+         if(names is None):
+            names = [name for name in vars(module) if (name.startswith("_") == False)]
+         for name in names:
+            namespace[name] = getattr(module, name)
+      return module
+
+
+   @staticmethod
+   def record(name, seconds):
+      """
+      Record the time taken to import a module without using load()
+      (i.e. the project modules imported by main.py).
+
+      Parameters
+      ----------
+      name : str
+         Name of the module.
+      seconds : float
+         Time taken to import it.
+      """
+      with DinoImport.__lock:
+         DinoImport.__times[name] = seconds
+
+
+   @staticmethod
+   def getReport():
+      """
+      Return the time taken by each import.
+
+      Returns
+      -------
+      list
+         List of (module name, seconds) in the order they were loaded.
+      """
+      with DinoImport.__lock:
+         return list(DinoImport.__times.items())
+
+
+   @staticmethod
+   def logReport():
+      """
+      Write the imports loaded since the last report to the log.
+      """
+      report = DinoImport.getReport()
+      for (name, seconds) in report[DinoImport.__numLogged:]:
+         DinoLog.logMsg("IMPORT module=[" + name + "] time=[" + '{0:.1f}'.format(seconds * 1000) + "ms]")
+      DinoImport.__numLogged = len(report)
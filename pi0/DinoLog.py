@@ -1,10 +1,18 @@
 import time
 import os
 import sys
-
-from DinoTime import *
-
-#TODO - Update to support re-entrancy. 
+import queue
+import atexit
+import itertools
+import struct
+import json
+from   threading import Thread # Writer thread
+from   threading import Event  # Wait until queued entries are written
+from   threading import RLock  # Writes after the writer thread stopped
+from   threading import Lock   # Throttled messages logged from any thread
+
+from DinoTime    import *
+from DinoSegment import *  # Preallocated log segments
 
 # Unique identifiers to differenciate data and messages
 # recorded to the log. 
@@ -16,10 +24,55 @@ EVENT_ID       = "E"
 CSV_SEP        = ","
 # Character used to replace commas within messages. 
 SAFE_SEP       = ";"
+# Characters used to replace newlines within messages, such that each
+# entry is a single line.
+SAFE_NEWLINE   = "\\n"
 
 # Format for data/event counters in the log.
 MET_STR_FORMAT = "0>8.2f"
 
+# Format for the date/time of each entry. 
+TIME_STR_FORMAT = "%Y%m%d-%H%M%S"
+
+# Templates (printf-style, faster than str.format) equivalent to 
+# MET_STR_FORMAT for a positive MET and to '{0:.4f}' for floats.
+MET_TEMPLATE   = "%08.2f"
+FLOAT_TEMPLATE = "%.4f"
+
+# Template for messages: time, MET, type, id, message.
+MSG_TEMPLATE = "%s" + CSV_SEP + "%s" + CSV_SEP + "%s%s" + CSV_SEP + "%s\n"
+
+# Maximum number of data templates kept (see DinoLog.formatEntry()).
+MAX_DATA_TEMPLATES = 64
+
+# Group commit. Entries are written by a dedicated thread and flushed to 
+# the file once LOG_FLUSH_SIZE bytes are pending or LOG_FLUSH_PERIOD
+# seconds after the first entry that was not flushed, whichever is first.
+LOG_FLUSH_SIZE   = 16384 # Unit: bytes
+LOG_FLUSH_PERIOD = 0.5   # Unit: sec
+LOG_BATCH_SIZE   = 256   # Maximum entries taken from the queue per write.
+
+# Binary data channel. The file starts with DATA_MAGIC, the length of the
+# header (DATA_LENGTH) and a JSON header describing the records. Each record
+# is a DATA_RECORD_HEADER (id, time, MET, vehicle time or NaN, bitmask of
+# None columns) followed by the columns given to DinoLog() (i.e. I_COLUMNS).
+DATA_MAGIC         = b"DINODAT1"
+DATA_LENGTH        = "<I"
+DATA_RECORD_HEADER = "<IdddI"
+DATA_HEADER_FIELDS = ["id", "time", "met", "vtime", "nulls"]
+
+# Throttled messages. Repeats of a message key within the window are
+# counted instead of logged (see DinoLog.logThrottled()).
+LOG_THROTTLE_WINDOW = 10.0 # Unit: sec (MET)
+# Added to a throttled message with the number of repeats and the window.
+LOG_REPEAT_TEMPLATE = "%s (repeated %dx in %.0fs)"
+
+# Requests from the application to the writer thread.
+LOG_CTRL_FLUSH = 0   # Flush the file.
+LOG_CTRL_CLOSE = 1   # Flush and close the file (re-opened on the next entry).
+LOG_CTRL_STOP  = 2   # Flush, close the file and terminate the thread.
+LOG_CTRL_SYNC  = 3   # Flush the file and wait until it is on the storage (fsync).
+
 
 class DinoLog(object):
    """
@@ -28,13 +81,53 @@ class DinoLog(object):
    Provides interface for logging messages at runtime. 
    The class abstracts some functionality to add timestamps 
    and unique identifiers to facilitate parsing the log.
+
+   logMsg() and logData() can be called from any thread. They only take
+   the timestamps and the next identifier, and add the entry to a queue. 
+   A dedicated writer thread formats the entries and writes them in 
+   batches (see LOG_FLUSH_SIZE and LOG_FLUSH_PERIOD). The writer adds
+   the vehicle time estimated from the MET (see DinoTime.syncVehicle())
+   to binary data records, where it is NaN until the first packet. The
+   layout of the text log is unchanged. Errors and entries
+   logged with flush=True are flushed immediately along with everything
+   queued before them. 
+
+   If data columns are given, logData() entries are written to a binary
+   file with fixed width records instead of the text log (see DATA_MAGIC).
+   Use DinoLogReader to read it or convert it back to the CSV layout.
+   Entries that do not match the columns are written to the text log.
+
+   Both files are split into preallocated segments listed in an index
+   (see DinoSegmentFile). Archives left open by a power cut are 
+   recovered when the next DinoLog is created.
+
+   Failures that repeat on every loop (i.e. a missing sensor) should be
+   logged with logThrottled(), which logs the first occurrence of a 
+   message and then a count of the repeats once per window, such that a
+   fault does not flood the log with lines and flushes.
    """
 
    # DinoLog Singleton instance 
    __instance = None
+
+   # Writer thread state. Running until stop() is called, stopped once
+   # the thread handled the stop request.
+   __running = False
+   __stopped = False
+
+   # Date/time string of the last second formatted as (second, string).
+   __timeCache = (None, "")
+
+   # Format template of data entries for each sequence of column types.
+   __templates = {}
+
+   # Throttled messages. For each key: [start of window (MET), repeats, last message].
+   __throttle        = {}
+   __throttleWindows = {}
+   __throttleLock    = Lock()
    
 
-   def __new__(cls, archiveName):
+   def __new__(cls, archiveName, dataColumns=None):
       """
       Create a singleton instance and initialize the DinoLog. 
 
@@ -50,25 +143,57 @@ class DinoLog(object):
          Name for log archive.
       debugEnable : bool
          Enable logging of debug messages.  
+      dataColumns : tuple
+         (name, struct format) of each column logged with logData() 
+         (i.e. I_COLUMNS). Write data to the text log if None.
       """
       if(DinoLog.__instance is None):
          DinoLog.__instance = object.__new__(cls)
 
+         # Truncate archives left open by a power cut.
+         recovered = DinoSegmentIndex.recoverAll("Logs")
+
          # Generate filename for archive and create a new folder to store the data.
          timestamp = DinoTime.getTimestampStr()
          DinoLog.__folder = "Logs/" + archiveName + "_" + timestamp
-         DinoLog.__filepath = DinoLog.__folder + "/" + archiveName + "_" + timestamp + ".txt"
-         if(not os.path.exists(os.path.dirname(DinoLog.__filepath))):
-            os.mkdir(os.path.dirname(DinoLog.__filepath))
+         DinoLog.__basePath = DinoLog.__folder + "/" + archiveName + "_" + timestamp
+         if(not os.path.exists(DinoLog.__folder)):
+            os.mkdir(DinoLog.__folder)
+
+         # Segmented text log.
+         DinoLog.__index = DinoSegmentIndex(DinoLog.__basePath + INDEX_EXT)
+         DinoLog.__text  = DinoSegmentFile(DinoLog.__index, DinoLog.__basePath, ".txt")
+
+         # Binary data channel.
+         DinoLog.__data  = None
+         if(dataColumns is not None):
+            DinoLog.__columns  = tuple(dataColumns)
+            DinoLog.__record   = struct.Struct(DATA_RECORD_HEADER + \
+               "".join(fmt for (name, fmt) in dataColumns))
+            DinoLog.__nullValues  = tuple((b"\0" if (fmt == "c") else 0) for (name, fmt) in dataColumns)
+            DinoLog.__charColumns = tuple(i for i in range(len(dataColumns)) if (dataColumns[i][1] == "c"))
+            DinoLog.__data = DinoSegmentFile(DinoLog.__index, DinoLog.__basePath, ".bin", \
+               DinoLog.__instance.__getDataHeader())
+
+         # Initialize counters for logging. 
+         # next() on a counter is atomic such that threads get unique ids.
+         DinoLog.__msgIds  = itertools.count(1)
+         DinoLog.__dataIds = itertools.count(1)
+
+         # Start the writer thread.
+         DinoLog.__lock    = RLock()
+         DinoLog.__queue   = queue.SimpleQueue()
+         DinoLog.__running = True
+         DinoLog.__stopped = False
+         DinoLog.__writer  = Thread(target=DinoLog.__instance.__run, name="DinoLog", daemon=True)
+         DinoLog.__writer.start()
+         atexit.register(DinoLog.stop)
 
          # Log initial entry to the file.
-         DinoLog.__fp = None
-         DinoLog.__instance.__log(EVENT_ID + "0" + CSV_SEP + \
-             "Log file \"" + DinoLog.__filepath + "\" initialized.")
-
-         # Initialize counters for logging.
-         DinoLog.__msgId = 0
-         DinoLog.__dataId = 0         
+         DinoLog.__put((EVENT_ID, 0, DinoTime.getTime(), DinoTime.getMET(), \
+             "Log file \"" + DinoLog.__basePath + "\" initialized.", True))
+         for path in recovered:
+            DinoLog.logMsg("Recovered log=[" + path + "]")
       return DinoLog.__instance
    
    
@@ -87,18 +212,46 @@ class DinoLog(object):
 
    def getFilename(self):
       """
-      Returns the filename for the current log.
+      Returns the filename for the current log segment.
 
       Returns
       -------
       str
          Filename of current log
       """
-      return self.__filepath
+      return self.__text.getFilename()
+
+
+   def getDataFilename(self):
+      """
+      Returns the filename for the current binary data segment 
+      or None if disabled.
+      """
+      if(self.__data is None):
+         return None
+      return self.__data.getFilename()
 
 
    @staticmethod
-   def logMsg(msg):
+   def setSealedHandler(handler):
+      """
+      Set a function called (from the writer thread) with the filename of
+      each log segment once it is complete (see DinoSegmentFile).
+      """
+      for segments in (DinoLog.__text, DinoLog.__data):
+         if(segments is not None):
+            segments.setSealedHandler(handler)
+
+
+   def getIndexFilename(self):
+      """
+      Returns the filename of the index listing all segments.
+      """
+      return self.__index.getFilename()
+
+
+   @staticmethod
+   def logMsg(msg, flush=False):
       """
       Log status/warning/error messages from application. 
       
@@ -119,11 +272,88 @@ class DinoLog(object):
       ---------
       data : str
          String to print to the file.       
+      flush : bool
+         Write the entry to the file without waiting for the flush window
+         (i.e. state transitions). Messages starting with "ERROR" are
+         always flushed.
+      """
+      DinoLog.__put((EVENT_ID, next(DinoLog.__msgIds), DinoTime.getTime(), DinoTime.getMET(), \
+         msg, (flush == True) or msg.startswith("ERROR")))
+
+
+   @staticmethod
+   def setThrottle(key, window):
+      """
+      Set the throttle window of a message key (see logThrottled()).
+
+      Parameter
+      ---------
+      key : str
+         Message key.
+      window : float
+         Seconds (MET) during which repeats of the key are counted instead
+         of logged. Zero logs every message.
+      """
+      DinoLog.__throttleWindows[key] = window
+
+
+   @staticmethod
+   def logThrottled(msg, key=None, flush=False):
       """
-      DinoLog.__msgId = DinoLog.__msgId + 1
-      DinoLog.__log(DinoLog.__instance, \
-         EVENT_ID + str(DinoLog.__msgId) + CSV_SEP + \
-         msg.replace(CSV_SEP, SAFE_SEP))   
+      Log a message that may repeat on every loop (i.e. a sensor failure).
+
+      The first message with a key is logged immediately. Repeats within
+      the throttle window of the key (LOG_THROTTLE_WINDOW by default, see
+      setThrottle()) are only counted. The next message after the window
+      is logged with the number of repeats (see LOG_REPEAT_TEMPLATE) and 
+      starts a new window. Counts still pending are logged by stop().
+
+      Parameter
+      ---------
+      msg : str
+         Message to log (see logMsg()).
+      key : str
+         Key identifying repeats of the message. Defaults to the message.
+      flush : bool
+         See logMsg().
+
+      Returns
+      -------
+      bool
+         True if the message was logged, False if it was only counted.
+      """
+      if(key is None):
+         key = msg
+      met = DinoTime.getMET()
+      with DinoLog.__throttleLock:
+         state  = DinoLog.__throttle.get(key)
+         window = DinoLog.__throttleWindows.get(key, LOG_THROTTLE_WINDOW)
+         if((state is not None) and (met - state[0] < window)):
+            state[1] = state[1] + 1
+            state[2] = msg
+            return False
+         DinoLog.__throttle[key] = [met, 0, msg]
+
+      if((state is not None) and (state[1] > 0)):
+         DinoLog.logMsg(LOG_REPEAT_TEMPLATE % (msg, state[1] + 1, met - state[0]), flush)
+      else:
+         DinoLog.logMsg(msg, flush)
+      return True
+
+
+   @staticmethod
+   def logRepeats():
+      """
+      Log the number of repeats of each throttled message that were only
+      counted so far and reset the windows.
+      """
+      met = DinoTime.getMET()
+      with DinoLog.__throttleLock:
+         pending = [state for state in DinoLog.__throttle.values() if (state[1] > 0)]
+         DinoLog.__throttle = {}
+      for (start, repeats, msg) in pending:
+         DinoLog.logMsg(LOG_REPEAT_TEMPLATE % (msg, repeats, met - start))
+
 
    @staticmethod
    def logData(data):
@@ -142,66 +372,367 @@ class DinoLog(object):
       data : list
          List to conver to a comma separated format for logging.
       """
-      DinoLog.__dataId = DinoLog.__dataId + 1
-      
-      # Format data for the log
-      dataList = []
-      for i in data:
-         if(isinstance(i, float) == True):
-            dataList.append('{0:.4f}'.format(i))
-         else:
-            dataList.append(str(i))
-      
-      DinoLog.__log(DinoLog.__instance, \
-         DATA_ID + str(DinoLog.__dataId) + CSV_SEP + CSV_SEP.join(dataList))
+      # Copy the data since callers reuse the same list.
+      DinoLog.__put((DATA_ID, next(DinoLog.__dataIds), DinoTime.getTime(), DinoTime.getMET(), \
+         tuple(data), False))
+
+
+   @staticmethod
+   def flush():
+      """
+      Wait until all entries queued so far are written to the file.
+      """
+      DinoLog.__request(LOG_CTRL_FLUSH)
 
 
-   def __log(self, msg):
+   @staticmethod
+   def sync(timeout=None):
+      """
+      Write all entries queued so far and wait until they are on the
+      storage (fsync), such that they survive a power loss.
+
+      Parameter
+      ---------
+      timeout : float
+         Maximum time in seconds to wait (None waits until done).
+
+      Returns
+      -------
+      bool
+         True if the log was synced within the timeout.
       """
-      Log a message to the log. 
+      return DinoLog.__request(LOG_CTRL_SYNC, timeout)
+
+
+   @staticmethod
+   def stop():
+      """
+      Write all queued entries, close the file and terminate the writer 
+      thread. Entries logged afterwards are written by the caller. 
+      Called automatically when the application exits.
+      """
+      if(DinoLog.__running == True):
+         DinoLog.logRepeats()
+         DinoLog.logMsg("Log file \"" + DinoLog.__basePath + "\" closed.")
+         # Entries queued after the stop request are drained by the
+         # writer thread before it terminates.
+         with DinoLog.__lock:
+            if(DinoLog.__running == False):
+               return
+            DinoLog.__running = False
+            DinoLog.__queue.put((None, LOG_CTRL_STOP, Event()))
+         DinoLog.__writer.join()
+
+
+   @staticmethod
+   def __put(entry):
+      """
+      Queue an entry for the writer thread, or write it directly if the
+      writer thread was stopped.
+
+      Parameter
+      ---------
+      entry : tuple
+         (EVENT_ID or DATA_ID, id, time, MET, message or data, flush)
+      """
+      DinoLog.__queue.put(entry)
+      # The writer may have stopped before taking the entry.
+      if(DinoLog.__stopped == True):
+         DinoLog.__drain()
+
+
+   @staticmethod
+   def __request(ctrl, timeout=None):
+      """
+      Send a request (LOG_CTRL_*) to the writer thread and wait until 
+      all entries queued before it are written.
+
+      Returns
+      -------
+      bool
+         True if the request completed within the timeout.
+      """
+      done = Event()
+      DinoLog.__queue.put((None, ctrl, done))
+      if(DinoLog.__stopped == True):
+         DinoLog.__drain()
+      return done.wait(timeout)
+
+
+   @staticmethod
+   def __drain():
+      """
+      Write the entries and complete the requests left in the queue once
+      the writer thread stopped. Called by the writer thread on exit and
+      by any thread that queued an entry afterwards.
+      """
+      with DinoLog.__lock:
+         batch = []
+         while(True):
+            try:
+               entry = DinoLog.__queue.get_nowait()
+            except queue.Empty:
+               break
+            if(entry[0] is not None):
+               batch.append(entry)
+               continue
+            (none, ctrl, done) = entry
+            DinoLog.__instance.__write(batch)
+            batch = []
+            DinoLog.__instance.__flushFiles(ctrl != LOG_CTRL_FLUSH, ctrl == LOG_CTRL_SYNC)
+            done.set()
+         if(len(batch) > 0):
+            DinoLog.__instance.__write(batch)
+            DinoLog.__instance.__flushFiles(False)
+
+
+   @staticmethod
+   def formatEntry(entry):
+      """
+      Format an entry for the log. 
 
       The function will append a date/time and MET timestamps
-      separated by CSV_SEP for easy parsing. 
+      separated by CSV_SEP for easy parsing. Floats in data entries
+      are formatted with 4 decimals and other values with str().
 
-      Open the file if needed. Then log the message and flush
-      the data to the file in case the program is terminated abruptly. 
-      The function keeps the file opened for subsequent writes.
+      Each line is a single printf-style format with a template generated
+      once for each sequence of column types (see __getTemplate()). 
+      The date/time string is only generated once per second.
 
       Parameter
       ---------
-      msg : str
-         Message to log to the file.
+      entry : tuple
+         Entry queued by logMsg() or logData().
+
+      Returns
+      -------
+      str
+         Line to write to the file.
       """
+      (entryType, entryId, wallTime, met, payload, flush) = entry
+
       # Log entries include both the current time and the MET.
-      timeStr = DinoTime.getTimestampStr()
-      metStr  = format(DinoTime.getMET(), MET_STR_FORMAT)
+      second = int(wallTime)
+      (cachedSecond, timeStr) = DinoLog.__timeCache
+      if(second != cachedSecond):
+         timeStr = time.strftime(TIME_STR_FORMAT, time.localtime(wallTime))
+         DinoLog.__timeCache = (second, timeStr)
+
+      # MET_TEMPLATE only matches MET_STR_FORMAT for a positive MET.
+      if(met >= 0):
+         metStr = MET_TEMPLATE % met
+      else:
+         metStr = format(met, MET_STR_FORMAT)
+
+      if(entryType == DATA_ID):
+         template = DinoLog.__templates.get(tuple(map(type, payload)))
+         if(template is None):
+            template = DinoLog.__getTemplate(payload)
+         return template % ((timeStr, metStr, entryId) + tuple(payload))
+      return MSG_TEMPLATE % (timeStr, metStr, entryType, entryId, payload.replace(CSV_SEP, SAFE_SEP).replace("\n", SAFE_NEWLINE))
+
+
+   @staticmethod
+   def __getTemplate(payload):
+      """
+      Compile the format template for data entries with the same column
+      types as payload.
+
+      Returns
+      -------
+      str
+         Template for the time, MET, id and each column.
+      """
+      shape  = tuple(map(type, payload))
+      fields = ["%s", "%s", DATA_ID + "%s"]
+      for columnType in shape:
+         if(issubclass(columnType, float) == True):
+            fields.append(FLOAT_TEMPLATE)
+         else:
+            fields.append("%s")
+      template = CSV_SEP.join(fields) + "\n"
+
+      if(len(DinoLog.__templates) >= MAX_DATA_TEMPLATES):
+         DinoLog.__templates = {}
+      DinoLog.__templates[shape] = template
+      return template
+
+
+   def __packData(self, entry, vehicleTime=None):
+      """
+      Convert a logData() entry to a binary record. The vehicle time is
+      NaN if unknown.
+
+      Returns
+      -------
+      bytes
+         Record or None if the data does not match the columns.
+      """
+      (entryType, entryId, wallTime, met, payload, flush) = entry
+      try:
+         values = list(payload)
+         nulls  = 0
+         for i in range(len(values)):
+            if(values[i] is None):
+               nulls = nulls | (1 << i)
+               values[i] = self.__nullValues[i]
+         for i in self.__charColumns:
+            if(isinstance(values[i], str) == True):
+               values[i] = values[i].encode('ascii')
+         return self.__record.pack(entryId, wallTime, met, \
+            float("nan") if (vehicleTime is None) else vehicleTime, nulls, *values)
+      except:
+         return None
+
+
+   def __getDataHeader(self):
+      """
+      Return the header written at the start of each binary data segment.
+      """
+      header = json.dumps({ \
+         'record'  : self.__record.format, \
+         'fields'  : DATA_HEADER_FIELDS + [name for (name, fmt) in self.__columns], \
+         'formats' : [fmt for (name, fmt) in self.__columns], \
+         'log'     : os.path.basename(self.__basePath)}).encode('ascii')
+      return DATA_MAGIC + struct.pack(DATA_LENGTH, len(header)) + header
+
 
-      # Format for log messages
-      logEntry = timeStr + CSV_SEP + metStr + CSV_SEP + msg + "\n"
+   def __write(self, entries):
+      """
+      Write entries to the log. Data goes to the binary file if enabled.
+      The segments keep their files opened for subsequent writes.
 
-      # Log the message. Keep the file open. 
-      if(self.__fp is None):
-         self.__fp = open(self.__filepath, 'a')
-      self.__fp.write(logEntry)
-      self.__fp.flush()      
-      #print(logEntry)
+      Returns
+      -------
+      int
+         Number of bytes written.
+      """
+      lines   = []
+      lineMet = []
+      records = []
+      dataMet = []
+      for entry in entries:
+         if((entry[0] == DATA_ID) and (self.__data is not None)):
+            record = self.__packData(entry, DinoTime.getVehicleTime(entry[3]))
+            if(record is not None):
+               records.append(record)
+               dataMet.append(entry[3])
+               continue
+         lines.append(DinoLog.formatEntry(entry))
+         lineMet.append(entry[3])
+
+      size = 0
+      try:
+         if(len(lines) > 0):
+            size = size + self.__text.write("".join(lines).encode('utf-8'), lineMet[0], lineMet[-1])
+         if(len(records) > 0):
+            size = size + self.__data.write(b"".join(records), dataMet[0], dataMet[-1])
+      except:
+         print("ERROR - Could not write to log file.")
+      return size
+
+
+   def __flushFiles(self, close, sync=False):
+      """
+      Flush the text and binary files. Close them or sync them to the
+      storage (along with the index) if requested.
+      """
+      for segments in (self.__text, self.__data):
+         try:
+            if(segments is None):
+               continue
+            elif(close == True):
+               segments.close()
+            else:
+               segments.flush()
+            if(sync == True):
+               segments.sync()
+         except:
+            print("ERROR - Could not flush log file.")
+      if(sync == True):
+         try:
+            self.__index.sync()
+         except:
+            print("ERROR - Could not sync log index.")
+
+
+   def __run(self):
+      """
+      Writer thread. Take entries from the queue in batches, write them 
+      and flush the file when the size or time window is reached, when an
+      entry requires it or when requested through __request().
+      """
+      pending   = 0      # Characters written since the last flush.
+      flushTime = None   # Time (monotonic) when pending data must be flushed.
+      running   = True
+      while(running == True):
+         timeout = None if (flushTime is None) else max(flushTime - time.monotonic(), 0.0)
+         try:
+            entries = [DinoLog.__queue.get(timeout=timeout)]
+         except queue.Empty:
+            entries = []
+         while(len(entries) < LOG_BATCH_SIZE):
+            try:
+               entries.append(DinoLog.__queue.get_nowait())
+            except queue.Empty:
+               break
+
+         batch = []
+         flush = False
+         for entry in entries:
+            if(entry[0] is not None):
+               batch.append(entry)
+               flush = flush or entry[5]
+               continue
+
+            # Request from the application. Write everything before it.
+            (none, ctrl, done) = entry
+            with DinoLog.__lock:
+               self.__write(batch)
+               batch = []
+               self.__flushFiles(ctrl in (LOG_CTRL_CLOSE, LOG_CTRL_STOP), ctrl == LOG_CTRL_SYNC)
+               if(ctrl == LOG_CTRL_STOP):
+                  self.__index.close()
+                  running = False
+            pending   = 0
+            flushTime = None
+            done.set()
+
+         if(len(batch) > 0):
+            with DinoLog.__lock:
+               pending = pending + self.__write(batch)
+         now = time.monotonic()
+         if((pending > 0) and (flushTime is None)):
+            flushTime = now + LOG_FLUSH_PERIOD
+         if((pending > 0) and ((flush == True) or (pending >= LOG_FLUSH_SIZE) or (now >= flushTime))):
+            with DinoLog.__lock:
+               self.__flushFiles(False)
+            pending   = 0
+            flushTime = None
+
+      # Entries queued after the stop request are written by the caller
+      # from now on. Write those queued before that.
+      with DinoLog.__lock:
+         if(pending > 0):
+            self.__flushFiles(False)
+         DinoLog.__stopped = True
+      DinoLog.__drain()
 
 
    def __del__(self):
       """
       Destructor to ensure the log file is closed.
+      Does nothing if the writer thread was never started.
       """
-      self.logMsg("Log file \"" + DinoLog.__filepath + "\" closed.")
-      self.closeLog()
+      DinoLog.stop()
 
 
    def closeLog(self):
       """
-      Close the log file if it is still opened.
+      Write all queued entries and close the log files if they are still 
+      opened. They are re-opened by the next entry.
       """
-      if(self.__fp is not None):
-         self.__fp.close()
-         self.__fp = None
+      DinoLog.__request(LOG_CTRL_CLOSE)
 
 
 
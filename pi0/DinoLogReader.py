@@ -0,0 +1,205 @@
+import struct
+import json
+import heapq
+
+from DinoLog     import *
+from DinoSegment import *  # Segments listed in the index
+from DinoCompress import *  # Read compressed segments
+
+
+# Number of records read from the binary data file at a time.
+DATA_READ_RECORDS = 1024
+
+
+class DinoLogReader(object):
+   """
+   Class DinoLogReader - Read logs written by DinoLog.
+
+   The binary data file is self-describing (see DATA_MAGIC), such that it
+   can be read without knowing the columns used during the flight.
+   Records are read in chunks, such that files of any size can be read or
+   converted without loading them in memory. A record cut short by a
+   power loss at the end of the file is ignored.
+
+   Logs are split into segments (see DinoSegmentFile). Each function
+   accepts a single segment or a list of segments (see getSegments()),
+   and stops at the preallocated space at the end of a segment that is
+   still open. Segments compressed by DinoCompressor are read the same
+   way using their original filename.
+
+   This class was designed using static methods such that these methods
+   can be called from any part of the application or post-processing.
+   """
+
+   @staticmethod
+   def getSegments(indexPath, ext):
+      """
+      Return the segments of one type in an archive.
+
+      Parameters
+      ----------
+      indexPath : str
+         Filename of the index (see DinoLog.getIndexFilename()).
+      ext : str
+         ".txt" for the text log or ".bin" for the binary data.
+
+      Returns
+      -------
+      list
+         Filename of each segment in the order they were written.
+      """
+      return DinoSegmentIndex.getSegments(indexPath, ext)
+
+
+   @staticmethod
+   def readHeader(fp):
+      """
+      Read the header of a binary data file.
+
+      Parameters
+      ----------
+      fp : file
+         Binary data file opened in 'rb' mode at the start of the file.
+
+      Returns
+      -------
+      dict
+         'record' : struct format of each record.
+         'fields' : name of each field in a record.
+         'formats' : struct format of each column after the record header.
+         'log' : name of the text log written along with the data.
+      """
+      if(fp.read(len(DATA_MAGIC)) != DATA_MAGIC):
+         raise ValueError("Not a DinoLog data file.")
+      (length,) = struct.unpack(DATA_LENGTH, fp.read(struct.calcsize(DATA_LENGTH)))
+      return json.loads(fp.read(length).decode('ascii'))
+
+
+   @staticmethod
+   def readLog(logPaths):
+      """
+      Read the lines of a text log.
+
+      Parameters
+      ----------
+      logPaths : str or list
+         Filename of the text log segment(s).
+
+      Returns
+      -------
+      generator
+         Each line including the line terminator.
+      """
+      if(isinstance(logPaths, str) == True):
+         logPaths = [logPaths]
+      for logPath in logPaths:
+         with DinoCompressor.open(logPath, 'r') as fp:
+            for line in fp:
+               if("\0" in line):
+                  # Preallocated space of a segment that is still open.
+                  line = line[:line.index("\0")]
+                  if(line.endswith("\n") == True):
+                     yield line
+                  break
+               yield line
+
+
+   @staticmethod
+   def readData(dataPaths, vehicleTime=False):
+      """
+      Read the records of a binary data file.
+
+      Parameters
+      ----------
+      dataPaths : str or list
+         Filename of the binary data segment(s).
+      vehicleTime : bool
+         If True, the vehicle time of each record follows its MET.
+
+      Returns
+      -------
+      generator
+         (id, time, MET, values) of each record, where values is a list
+         of the columns with None for the ones that were not available.
+         The vehicle time is None if it was not known (or not recorded 
+         by an older DinoLog).
+      """
+      if(isinstance(dataPaths, str) == True):
+         dataPaths = [dataPaths]
+      for dataPath in dataPaths:
+         with DinoCompressor.open(dataPath, 'rb') as fp:
+            header  = DinoLogReader.readHeader(fp)
+            record  = struct.Struct(header['record'])
+            nulls   = header['fields'].index("nulls")
+            vtime   = header['fields'].index("vtime") if ("vtime" in header['fields']) else None
+            offset  = nulls + 1
+            columns = range(len(header['formats']))
+            chars   = [i for i in columns if (header['formats'][i] == "c")]
+            end     = False
+            while(end == False):
+               chunk = fp.read(record.size * DATA_READ_RECORDS)
+               chunk = chunk[:len(chunk) - (len(chunk) % record.size)]
+               if(len(chunk) == 0):
+                  break
+               for fields in record.iter_unpack(chunk):
+                  # Ids start at 1. Zero is the preallocated space.
+                  if(fields[0] == 0):
+                     end = True
+                     break
+                  values = list(fields[offset:])
+                  for i in chars:
+                     values[i] = values[i].decode('ascii')
+                  if(fields[nulls] != 0):
+                     for i in columns:
+                        if((fields[nulls] >> i) & 1):
+                           values[i] = None
+                  if(vehicleTime == False):
+                     yield (fields[0], fields[1], fields[2], values)
+                     continue
+                  value = None if (vtime is None) else fields[vtime]
+                  if(value != value):
+                     value = None  # NaN
+                  yield (fields[0], fields[1], fields[2], value, values)
+
+
+   @staticmethod
+   def convertData(dataPaths, csvPath, logPaths=None):
+      """
+      Convert a binary data file to the CSV layout of the text log.
+
+      If the text log is given, its entries are merged with the data
+      in MET order, such that the output matches a text log where
+      the data was logged with the messages.
+
+      Parameters
+      ----------
+      dataPaths : str or list
+         Filename of the binary data segment(s).
+      csvPath : str
+         Filename for the CSV output.
+      logPaths : str or list
+         Filename of the text log segment(s) (optional).
+
+      Returns
+      -------
+      int
+         Number of data entries converted.
+      """
+      count = [0]
+      def dataLines():
+         for (entryId, wallTime, met, values) in DinoLogReader.readData(dataPaths):
+            count[0] = count[0] + 1
+            yield (met, DinoLog.formatEntry((DATA_ID, entryId, wallTime, met, values, False)))
+
+      def logLines():
+         for line in DinoLogReader.readLog(logPaths):
+            yield (float(line.split(CSV_SEP, 2)[1]), line)
+
+      with open(csvPath, 'w') as out:
+         if(logPaths is None):
+            for (met, line) in dataLines():
+               out.write(line)
+         else:
+            for (met, line) in heapq.merge(logLines(), dataLines(), key=lambda item: item[0]):
+               out.write(line)
+      return count[0]
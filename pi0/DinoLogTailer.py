@@ -0,0 +1,254 @@
+import os
+import glob
+import struct
+
+from DinoLog       import *  # Entry types and CSV layout
+from DinoSegment   import *  # Index of the segments
+from DinoLogReader import *  # Header of binary data segments
+from DinoCompress  import *  # Read compressed segments
+
+
+# Maximum bytes read from the segments on each poll, such that attaching
+# to a long log from the start does not block the caller.
+TAIL_MAX_BYTES = 1024 * 1024
+
+
+class DinoLogTailer(object):
+   """
+   Class DinoLogTailer - Follow a DinoLog archive while it is written.
+
+   Each poll() reads the index (see DinoSegmentIndex), which records how
+   many bytes were flushed to each segment, and only reads the bytes
+   added since the previous poll. New segments are picked up as soon as
+   they appear in the index. The cost of a poll is proportional to the
+   new data, not to the size of the archive.
+
+   Records are published to subscribers as lists of
+   (type, id, MET, payload) sorted by MET, where type is EVENT_ID with
+   the message as payload or DATA_ID with the list of columns. Data can
+   be downsampled for display with a minimum period between records;
+   events are always published.
+   """
+
+   def __init__(self, indexPath, fromEnd=True, maxBytes=TAIL_MAX_BYTES):
+      """
+      Follow an archive.
+
+      Parameters
+      ----------
+      indexPath : str
+         Filename of the index (see DinoLog.getIndexFilename()).
+      fromEnd : bool
+         Skip the records already in the archive.
+      maxBytes : int
+         Maximum bytes read on each poll.
+      """
+      self.__indexPath   = indexPath
+      self.__folder      = os.path.dirname(indexPath)
+      self.__maxBytes    = maxBytes
+      self.__offsets     = {}  # Bytes of each segment already read.
+      self.__formats     = {}  # (record struct, header size, nulls field, char columns) of binary segments.
+      self.__subscribers = []  # [callback, period, MET of last data published]
+      self.__closed      = False
+      if(fromEnd == True):
+         for (name, (firstMet, lastMet, size)) in self.__readIndex().items():
+            self.__offsets[name] = size
+
+
+   @staticmethod
+   def findLatest(root="Logs"):
+      """
+      Return the index of the most recent archive in a folder.
+
+      Parameters
+      ----------
+      root : str
+         Folder that contains the archives.
+
+      Returns
+      -------
+      str
+         Filename of the index or None if there are no archives.
+      """
+      indexes = glob.glob(os.path.join(root, "*", "*" + INDEX_EXT))
+      if(len(indexes) == 0):
+         return None
+      return max(indexes, key=os.path.getmtime)
+
+
+   def getIndexFilename(self):
+      """
+      Return the filename of the index followed.
+      """
+      return self.__indexPath
+
+
+   def isClosed(self):
+      """
+      Return True once the archive was closed and every record was read.
+      """
+      return self.__closed
+
+
+   def subscribe(self, callback, period=None):
+      """
+      Publish new records to a function.
+
+      Parameters
+      ----------
+      callback : function
+         Called with the list of new records after each poll that found any.
+      period : float
+         Minimum MET in seconds between data records published (None
+         publishes every record).
+      """
+      self.__subscribers.append([callback, period, None])
+
+
+   def poll(self):
+      """
+      Read the records added since the last poll and publish them.
+
+      Returns
+      -------
+      int
+         Number of records read.
+      """
+      segments = self.__readIndex()
+      records  = []
+      budget   = self.__maxBytes
+      for (name, (firstMet, lastMet, size)) in segments.items():
+         offset = self.__offsets.get(name, 0)
+         if((offset >= size) or (budget <= 0)):
+            continue
+         try:
+            if(name.endswith(".bin") == True):
+               read = self.__readData(name, offset, min(size, offset + budget), records)
+            else:
+               read = self.__readText(name, offset, min(size, offset + budget), records)
+         except (OSError, EOFError):
+            # Segment is being compressed or was removed. Retry next poll.
+            continue
+         self.__offsets[name] = offset + read
+         budget = budget - read
+
+      self.__closed = (self.__indexClosed == True) and \
+         all((self.__offsets.get(name, 0) >= size) for (name, (firstMet, lastMet, size)) in segments.items())
+
+      if(len(records) > 0):
+         records.sort(key=lambda record: record[2])
+         for subscriber in self.__subscribers:
+            self.__publish(subscriber, records)
+      return len(records)
+
+
+   def __readIndex(self):
+      """
+      Return the segments listed in the index (empty until it exists).
+      """
+      try:
+         (segments, closed) = DinoSegmentIndex.read(self.__indexPath)
+      except:
+         (segments, closed) = ({}, False)
+      self.__indexClosed = closed
+      return segments
+
+
+   def __readText(self, name, offset, end, records):
+      """
+      Parse the complete lines of a text segment between two offsets.
+
+      Returns
+      -------
+      int
+         Number of bytes consumed (up to the last complete line).
+      """
+      with DinoCompressor.open(os.path.join(self.__folder, name), 'rb') as fp:
+         fp.seek(offset)
+         data = fp.read(end - offset)
+      data = data[:data.rfind(b"\n") + 1]
+      for line in data.decode('utf-8', 'replace').splitlines():
+         record = DinoLogTailer.__parseLine(line)
+         if(record is not None):
+            records.append(record)
+      return len(data)
+
+
+   @staticmethod
+   def __parseLine(line):
+      """
+      Convert a line of a text segment to a record.
+
+      Returns
+      -------
+      tuple
+         (type, id, MET, message or values). None if the line is not an
+         entry (i.e. corrupted), such that it is skipped.
+      """
+      fields = line.split(CSV_SEP, 3)
+      if((len(fields) < 4) or (fields[2][1:].isdigit() == False)):
+         return None
+      try:
+         met = float(fields[1])
+      except ValueError:
+         return None
+      entryType = fields[2][:1]
+      if(entryType == DATA_ID):
+         return (DATA_ID, int(fields[2][1:]), met, fields[3].split(CSV_SEP))
+      if(entryType == EVENT_ID):
+         return (EVENT_ID, int(fields[2][1:]), met, fields[3])
+      return None
+
+
+   def __readData(self, name, offset, end, records):
+      """
+      Unpack the complete records of a binary data segment between two
+      offsets. The header is read the first time the segment is used.
+
+      Returns
+      -------
+      int
+         Number of bytes consumed (including the header).
+      """
+      with DinoCompressor.open(os.path.join(self.__folder, name), 'rb') as fp:
+         if(name not in self.__formats):
+            header  = DinoLogReader.readHeader(fp)
+            columns = range(len(header['formats']))
+            self.__formats[name] = (struct.Struct(header['record']), fp.tell(), \
+               header['fields'].index("nulls"), [i for i in columns if (header['formats'][i] == "c")])
+         (record, headerSize, nullsIndex, chars) = self.__formats[name]
+         start = max(offset, headerSize)
+         fp.seek(start)
+         data = fp.read(max(end - start, 0))
+      data = data[:len(data) - (len(data) % record.size)]
+      for fields in record.iter_unpack(data):
+         values = list(fields[nullsIndex + 1:])
+         for i in chars:
+            values[i] = values[i].decode('ascii')
+         nulls = fields[nullsIndex]
+         if(nulls != 0):
+            for i in range(len(values)):
+               if((nulls >> i) & 1):
+                  values[i] = None
+         records.append((DATA_ID, fields[0], fields[2], values))
+      return min(start, end) - offset + len(data)
+
+
+   @staticmethod
+   def __publish(subscriber, records):
+      """
+      Call a subscriber with the records it should receive.
+      """
+      (callback, period, lastMet) = subscriber
+      if(period is not None):
+         selected = []
+         for record in records:
+            if(record[0] == DATA_ID):
+               if((lastMet is not None) and (record[2] - lastMet < period)):
+                  continue
+               lastMet = record[2]
+            selected.append(record)
+         subscriber[2] = lastMet
+         records = selected
+      if(len(records) > 0):
+         callback(records)
@@ -0,0 +1,204 @@
+from DinoLog import *  # File sink
+
+
+# Levels of the messages. A logger only emits messages at or above its level.
+LOGGER_DEBUG   = 10
+LOGGER_INFO    = 20
+LOGGER_WARNING = 30
+LOGGER_ERROR   = 40
+LOGGER_OFF     = 100
+
+# Name of each level used as a prefix (same layout as "ERROR - ..." messages).
+LOGGER_LEVEL_NAMES = {LOGGER_DEBUG   : "DEBUG", \
+                      LOGGER_INFO    : "INFO", \
+                      LOGGER_WARNING : "WARNING", \
+                      LOGGER_ERROR   : "ERROR"}
+
+# Destinations of the messages (bitmask).
+LOGGER_SINK_CONSOLE = 1 # Print to stdout. Slow on a serial console.
+LOGGER_SINK_FILE    = 2 # Write to the log through DinoLog.logMsg().
+
+# Defaults for loggers without their own level (see DinoLogger.setLevel()).
+LOGGER_LEVEL = LOGGER_INFO
+LOGGER_SINKS = LOGGER_SINK_FILE
+
+
+class DinoLogger(object):
+   """
+   Class DinoLogger - Leveled messages for each module.
+
+   Replaces print() calls with messages that can be disabled by level
+   and sent to the console and/or the log file. Each module gets its
+   own logger with DinoLogger.get(name), typically stored in a private
+   module constant (not exported by "from X import *"):
+
+      _LOGGER = DinoLogger.get("DinoMain")
+      _LOGGER.debug("Packet %s", packet)
+
+   The methods of disabled levels are replaced with a function that does
+   nothing, such that a disabled message only costs the attribute lookup
+   and the call. Messages are formatted with the % operator and only if
+   they are enabled, so callers pass the arguments instead of building
+   the string.
+   """
+
+   # Logger of each module.
+   __loggers = {}
+
+   # Level of each module set with setLevel().
+   __levels  = {}
+
+   # Level of the other modules.
+   __level   = LOGGER_LEVEL
+
+   # Destinations of the messages.
+   __sinks   = LOGGER_SINKS
+
+
+   @staticmethod
+   def get(name):
+      """
+      Return the logger of a module, creating it if needed.
+
+      Parameters
+      ----------
+      name : str
+         Name of the module (i.e. "DinoMain").
+
+      Returns
+      -------
+      DinoLogger
+         Logger added as a prefix to each message.
+      """
+      logger = DinoLogger.__loggers.get(name)
+      if(logger is None):
+         logger = DinoLogger(name)
+         DinoLogger.__loggers[name] = logger
+      return logger
+
+
+   @staticmethod
+   def setLevel(level, name=None):
+      """
+      Set the minimum level of the messages emitted.
+
+      Parameters
+      ----------
+      level : int
+         LOGGER_DEBUG, LOGGER_INFO, LOGGER_WARNING, LOGGER_ERROR or LOGGER_OFF.
+      name : str
+         Module to configure. Defaults to all modules without their own level.
+      """
+      if(name is None):
+         DinoLogger.__level = level
+      else:
+         DinoLogger.__levels[name] = level
+      for logger in DinoLogger.__loggers.values():
+         logger.__configure()
+
+
+   @staticmethod
+   def setSinks(sinks):
+      """
+      Set the destinations of the messages.
+
+      Parameters
+      ----------
+      sinks : int
+         Combination of LOGGER_SINK_CONSOLE and LOGGER_SINK_FILE (zero
+         disables all messages).
+      """
+      DinoLogger.__sinks = sinks
+      for logger in DinoLogger.__loggers.values():
+         logger.__configure()
+
+
+   def __init__(self, name):
+      """
+      Create the logger of a module. Use DinoLogger.get() instead.
+      """
+      self.__name = name
+      self.__configure()
+
+
+   def getName(self):
+      """
+      Return the name of the module.
+      """
+      return self.__name
+
+
+   def isEnabled(self, level):
+      """
+      Return True if messages at this level are emitted. Use it to skip
+      computing values that are only needed for the message.
+      """
+      return (DinoLogger.__sinks != 0) and \
+         (level >= DinoLogger.__levels.get(self.__name, DinoLogger.__level))
+
+
+   def __configure(self):
+      """
+      Bind the method of each level to __emit() or to a function that
+      does nothing, depending on the level and sinks.
+      """
+      for (level, method) in ((LOGGER_DEBUG, "debug"), (LOGGER_INFO, "info"), \
+                              (LOGGER_WARNING, "warning"), (LOGGER_ERROR, "error")):
+         if(self.isEnabled(level) == True):
+            setattr(self, method, self.__emitter(level))
+         else:
+            setattr(self, method, DinoLogger.__disabled)
+
+
+   @staticmethod
+   def __disabled(msg, *args):
+      """
+      Method of the disabled levels.
+      """
+      pass
+
+
+   def __emitter(self, level):
+      """
+      Return the method of an enabled level.
+      """
+      prefix = LOGGER_LEVEL_NAMES[level] + " - " + self.__name + ": "
+      def emit(msg, *args):
+         self.__emit(prefix, msg, args)
+      return emit
+
+
+   def __emit(self, prefix, msg, args):
+      """
+      Format a message and write it to each sink.
+      """
+      if(len(args) > 0):
+         msg = msg % args
+      else:
+         msg = str(msg)
+      if(DinoLogger.__sinks & LOGGER_SINK_CONSOLE):
+         print(prefix + msg)
+      if(DinoLogger.__sinks & LOGGER_SINK_FILE):
+         DinoLog.logMsg(prefix + msg)
+
+
+   # Replaced in __configure(). Listed for documentation.
+   def debug(self, msg, *args):
+      """
+      Log a debug message (i.e. every packet). Formatted as msg % args.
+      """
+
+   def info(self, msg, *args):
+      """
+      Log an informational message (i.e. device state).
+      """
+
+   def warning(self, msg, *args):
+      """
+      Log a warning.
+      """
+
+   def error(self, msg, *args):
+      """
+      Log an error. Errors are flushed to the log immediately.
+      """
@@ -2,7 +2,6 @@
 from time               import *  # Time library
 import os
 import sys
-import serial
 
 # Project interfaces
 from DinoConstants      import *  # Project constants
@@ -12,40 +11,45 @@ from DinoCamera         import *  # PiCamera interface
 from DinoEnvirophat     import *  # Envirophat interface
 from DinoServo          import *  # Servo interface
 from DinoSerial         import *  # Serial data interface
+from DinoPacket         import *  # Serial packet schema
+from DinoPacketView     import *  # Lazy packet access
 from DinoThermalControl import *  # GPIO interface for heater and cooler
 from DinoSpectrometer   import *  # Spectrometer interface
+from DinoProfiler       import *  # Loop instrumentation
+from DinoStateMachine   import *  # Experiment states
+from DinoStartup        import *  # Concurrent device initialization
+from DinoImport         import *  # Lazy import of hardware libraries
+from DinoCompress       import *  # Background compression of archives
+from DinoLogger         import *  # Leveled console/debug messages
+from DinoShutdown       import *  # Stop devices within a deadline
+from DinoScheduler      import *  # Periodic device jobs
+
+
+THERMAL_CONTROL_PERIOD = 1.1 # Unit: sec
+ENVIROPHAT_PERIOD      = 0.5 # Unit: sec. Only while no packets are received.
+PORTNAME = '/dev/serial0'
 
-try:
-   from gpiozero   import CPUTemperature
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - CPUTemperature library not loaded.")
-
+# The camera and spectrometer are only created when first used, or in the
+# background once the vehicle reaches this flight state such that they are
+# ready before the experiment starts. The camera then keeps the last
+# CAMERA_PREROLL seconds of video in memory until the experiment starts.
+# Set to None to disable.
+PREWARM_STATE = NR_STATE_LIFTOFF
 
-THERMAL_CONTROL_PERIOD = 10 # Unit: 1/10 sec 
-MAXBUFFER = 200
-NUMDATAFIELDS = 21
-PORTNAME = '/dev/serial0'
-BAUDRATE = 115200
-TIMEOUT = 0.02
+# Compression of complete log segments and spectra (COMPRESS_ZLIB or
+# COMPRESS_LZMA). Paused during the experiment. Set to None to disable.
+COMPRESS_METHOD = COMPRESS_ZLIB
 
 
-DINO_STATE_INIT       = 0
-DINO_STATE_START_EXP  = 1
-DINO_STATE_EXPERIMENT = 2
-DINO_STATE_END_EXP    = 3
-DINO_STATE_FINISHED   = 4
+# Layout of the packets received over the serial port.
+PACKET_LAYOUT = PACKET_NFF
 
+# Fields of each packet used by _readAllData(). Packets with any of these
+# fields corrupted are rejected.
+PACKET_FIELDS = (NR_ALTITUDE, NR_ACCELERATION)
 
-FLIGHT_DATA = {'flight_event': 0, 
-                'exptime': 0,
-                'altitude': 0,
-                'gps_altitude': 0,
-                'velocity': [0,0,0],
-                'acc_magnitude': 0,
-                'acceleration': [0,0,0],
-                'attitude': [0,0,0],
-                'angular_velocity': [0,0,0],
-                'warnings': [0,0,0,0]}
+# Messages of this module (see DinoLogger).
+_LOGGER = DinoLogger.get("DinoMain")
 
 class DinoMain(object):
 
@@ -60,30 +64,55 @@ class DinoMain(object):
 
          # Initialize time keeping functions + log
          DinoTime()
-         DinoLog(filename)   
-
-         # Initialize all other interfaces
-         DinoMain._dinoCamera  = DinoCamera("video")
-         DinoMain._dinoEnv     = DinoEnvirophat()
-         DinoMain._dinoThermal = DinoThermalControl(HEATER_PIN, COOLER_PIN)
-         DinoMain._dinoSerial  = DinoSerial('/dev/serial0')
-         DinoMain._dinoSpectrometer = DinoSpectrometer()
-         DinoMain._dinoServo   = DinoServo(SERVO_PIN)
-         DinoMain._dinoServo.hardStopServo()
+         DinoLog(filename, I_COLUMNS)
+         DinoProfiler()
+         if(COMPRESS_METHOD is not None):
+            DinoCompressor(COMPRESS_METHOD)
+
+         # Initialize all other interfaces concurrently. 
+         # Wait for serial and thermal control such that the main loop can
+         # start, while slower devices finish in the background.
+         # The camera and spectrometer are deferred until first use/prewarm.
+         DinoMain._startup     = DinoStartup()
+         DinoMain._startup.start("serial",       lambda: DinoSerial(PORTNAME, PACKET_LAYOUT))
+         DinoMain._startup.start("thermal",      lambda: DinoThermalControl(HEATER_PIN, COOLER_PIN))
+         DinoMain._startup.start("envirophat",   DinoEnvirophat)
+         DinoMain._startup.start("servo",        DinoMain.__instance._initServo)
+         DinoMain._startup.defer("camera",       DinoMain.__instance._initCamera)
+         DinoMain._startup.defer("spectrometer", DinoMain.__instance._initSpectrometer)
+         DinoMain._startup.get("serial")
+         DinoMain._startup.get("thermal")
+         DinoImport.logReport()
+
+         # Flight state bytes at or after PREWARM_STATE.
+         DinoMain._prewarmBytes = frozenset() if (PREWARM_STATE is None) else \
+            frozenset(ord(letter) for letter in NR_STATE_LETTERS[PREWARM_STATE:])
+         DinoMain._prewarmed    = (PREWARM_STATE is None)
 
-
-         #initialize the spectrometer
-         DinoMain._dinoSpectrometer.initialize()
-         
          # Initialize sensor data tuple
          DinoMain._data        = [None,] * I_SIZE
 
+         # View of the last packet received (defaults until one arrives).
+         defaultPacket         = PACKET_LAYOUT.encode(PACKET_LAYOUT.newRecord())
+         DinoMain._view        = DinoPacketView(PACKET_LAYOUT, defaultPacket.encode('ascii'))
+         DinoMain._numRejected = 0
+
+
          # Experiment state
          DinoMain._currState   = DINO_STATE_INIT
          DinoMain._prevState   = DINO_STATE_INIT
+         DinoMain._stateMachine = DinoStateMachine()
+         DinoMain.__instance._registerActions()
+
+         # Stop the devices and sync the log within SHUTDOWN_DEADLINE
+         # at the end of the experiment, the end of the test or on SIGTERM.
+         DinoMain._shutdown    = DinoShutdown(SHUTDOWN_DEADLINE)
+         DinoMain.__instance._registerShutdown()
 
-         # Flag to decimate thermal algorithm
-         DinoMain._thermalCount = 0
+         # Deadlines (MET) for periodic work in the main loop
+         DinoMain._nextThermal = 0.0
+         DinoMain._nextEnv     = 0.0
+         DinoMain._nextProfile = 0.0
 
          # Flag to terminate the test
          DinoMain._endTest     = False
@@ -92,22 +121,107 @@ class DinoMain(object):
       return DinoMain.__instance
 
 
+   @staticmethod
+   def _initSpectrometer():
+      """
+      Create the spectrometer and load its libraries.
+      """
+      spectrometer = DinoSpectrometer()
+      try:
+         spectrometer.initialize()
+      except:
+         DinoLog.logMsg("ERROR - Could not initialize the spectrometer.")
+      return spectrometer
+
+
+   @staticmethod
+   def _initCamera():
+      """
+      Create the camera and keep the last CAMERA_PREROLL seconds of video
+      in memory until the experiment starts (see DinoCamera.arm()).
+      """
+      camera = DinoCamera("video")
+      camera.arm(CAMERA_PREROLL)
+      return camera
+
+
+   @staticmethod
+   def _initServo():
+      """
+      Create the servo and release it until the experiment starts.
+      """
+      servo = DinoServo(SERVO_PIN)
+      servo.hardStopServo()
+      return servo
+
+
+   @staticmethod
+   def _logCompression():
+      """
+      Wait for files queued for compression and log the totals.
+      """
+      stats = DinoCompressor.waitAll()
+      if(stats is not None):
+         DinoLog.logMsg("COMPRESS files=[" + str(stats['files']) + \
+            "] in=[" + str(stats['bytesIn']) + "] out=[" + str(stats['bytesOut']) + \
+            "] cpu=[" + '{0:.2f}'.format(stats['cpu']) + "s]")
+
+
+   @staticmethod
+   def _logClock():
+      """
+      Log the estimate of the vehicle clock (see DinoTime.syncVehicle()).
+      """
+      offset = DinoTime.getVehicleOffset()
+      if(offset is not None):
+         stats = DinoTime.getDiscipline().getStats()
+         DinoLog.logMsg("CLOCK offset=[" + '{0:.3f}'.format(offset * 1000) + \
+            "ms] drift=[" + '{0:.1f}'.format(DinoTime.getVehicleDrift() * 1e6) + \
+            "ppm] samples=[" + str(stats['samples']) + "] rejected=[" + str(stats['rejected']) + \
+            "] resets=[" + str(stats['resets']) + "]")
+
+
+   # Devices are retrieved from the startup orchestrator the first time 
+   # they are used, waiting for them only if they are not ready yet.
+   @property
+   def _dinoCamera(self):
+      return self._startup.get("camera")
+
+   @property
+   def _dinoEnv(self):
+      return self._startup.get("envirophat")
+
+   @property
+   def _dinoThermal(self):
+      return self._startup.get("thermal")
+
+   @property
+   def _dinoSerial(self):
+      return self._startup.get("serial")
+
+   @property
+   def _dinoSpectrometer(self):
+      return self._startup.get("spectrometer")
+
+   @property
+   def _dinoServo(self):
+      return self._startup.get("servo")
+
+
    def _readAllData(self):
       """
       Read/parse serial data and all sensors from Envirophat.
       Store a tuple of sensor readings with "False" 
       for any fields that could not be read.
       """
-      flight_event = FLIGHT_DATA['flight_event']#self._dinoSerial.readData()
-      flight_altitude = FLIGHT_DATA['altitude']
-      flight_acceleration = FLIGHT_DATA['acceleration']
-      tempEnv    = self._dinoEnv.readData()
-      #print('flight_state =')
-      #print(flight_state)
-
-      self._data[I_FLIGHT_STATE]    = flight_event#tempSerial[NR_FLIGHT_STATE]
-      self._data[I_ALTITUDE]        = flight_altitude #tempSerial[NR_ALTITUDE]
-      self._data[I_ACCELERATION]    = flight_acceleration #tempSerial[NR_ACCELERATION]
+      tempSerial = self._view
+      tempEnv    = self._readEnvirophat()
+      start      = DinoProfiler.start()
+
+      self._data[I_FLIGHT_STATE]    = tempSerial.getState()
+      self._data[I_ALTITUDE]        = tempSerial.get(NR_ALTITUDE)
+      self._data[I_ACCELERATION]    = tempSerial.get(NR_ACCELERATION)
+      DinoProfiler.stop(PHASE_PARSE, start)
       self._data[I_LIGHT_RED]       = tempEnv[ENV_HAT_LIGHT_RED]
       self._data[I_LIGHT_GREEN]     = tempEnv[ENV_HAT_LIGHT_GREEN]
       self._data[I_LIGHT_BLUE]      = tempEnv[ENV_HAT_LIGHT_BLUE]
@@ -118,101 +232,113 @@ class DinoMain(object):
       self._data[I_ACCEL_Y]         = tempEnv[ENV_HAT_ACCEL_Y]
       self._data[I_ACCEL_Z]         = tempEnv[ENV_HAT_ACCEL_Z]
     
+   def _readEnvirophat(self):
+      """
+      Read all sensors from the Envirophat.
+      """
+      start   = DinoProfiler.start()
+      tempEnv = self._readEnvirophatData()
+      DinoProfiler.stop(PHASE_ENVIROPHAT, start)
+      return tempEnv
+
+
+   def _readEnvirophatData(self):
+      """
+      Return the Envirophat readings (None for each one if the
+      Envirophat could not be initialized).
+      """
+      env = self._dinoEnv
+      if(env is None):
+         return [None] * ENV_HAT_SIZE
+      return env.readData()
+
+
    def parse_serial_packet(self, incoming_data):
-    # Remove leading or trailing white space and separate the fields.
-    incoming_data = incoming_data.strip()
-    fields = incoming_data.split(',')
-
-    # Ensure that the appropriate number of data fields are present.
-    if len(fields) != NUMDATAFIELDS:
-        return False
-    else:
-        index = 0
-        for field in fields:
-            if index == 0:
-                FLIGHT_DATA['flight_event'] = field
-            elif index == 1:
-                FLIGHT_DATA['exptime'] = float(field)
-            elif index == 2:
-                FLIGHT_DATA['altitude'] = float(field)
-            elif index == 3:
-                FLIGHT_DATA['gps_altitude'] = float(field)
-            elif index == 4:
-                FLIGHT_DATA['velocity'][0] = float(field)
-            elif index == 5:
-                FLIGHT_DATA['velocity'][1] = float(field)
-            elif index == 6:
-                FLIGHT_DATA['velocity'][2] = float(field)
-            elif index == 7:
-                FLIGHT_DATA['acc_magnitude'] = float(field)
-            elif index == 8:
-                FLIGHT_DATA['acceleration'][0] = float(field)
-            elif index == 9:
-                FLIGHT_DATA['acceleration'][1] = float(field)
-            elif index == 10:
-                FLIGHT_DATA['acceleration'][2] = float(field)
-            elif index == 11:
-                FLIGHT_DATA['attitude'][0] = float(field)
-            elif index == 12:
-                FLIGHT_DATA['attitude'][1] = float(field)
-            elif index == 13:
-                FLIGHT_DATA['attitude'][2] = float(field)
-            elif index == 14:
-                FLIGHT_DATA['angular_velocity'][0] = float(field)
-            elif index == 15:
-                FLIGHT_DATA['angular_velocity'][1] = float(field)
-            elif index == 16:
-                FLIGHT_DATA['angular_velocity'][2] = float(field)
-            elif index == 17:
-                FLIGHT_DATA['warnings'][0] = int(field)
-            elif index == 18:
-                FLIGHT_DATA['warnings'][1] = int(field)
-            elif index == 19:
-                FLIGHT_DATA['warnings'][2] = int(field)
-            elif index == 20:
-                FLIGHT_DATA['warnings'][3] = int(field)
-            index = index + 1
-        return True
-    
-    
-  
-   def _determineState(self):
       """
-      Determine the state of the experiment.
+      Index a packet received over the serial port into self._view.
+      Fields are only converted when _readAllData() accesses them.
+
+      Parameters
+      ----------
+      incoming_data : bytes
+         Packet returned by the framer.
+
+      Returns
+      -------
+      bool
+         True if the packet had the expected fields. False otherwise.
       """
-      # Record previous state. 
-      self._prevState = self._currState
-      
-      
-      # Logic to determine the current experiment state
-      strState = self._data[I_FLIGHT_STATE]
-      try:
-       nrState = NR_STATE_LETTERS.index(strState)
-      except:
-        DinoLog.logMsg("Errpr in Conversion to String")
-        return self._prevState
+      view = DinoPacketView(PACKET_LAYOUT, incoming_data)
+      if(view.isValid() == False):
+         return False
+      self._view = view
+      return True
 
-      #print('strState = ',strState)
-      
-      
-      if(nrState < NR_STATE_COAST_START):          #NR_STATE_MECO
-         self._currState = DINO_STATE_INIT
-         
-      elif(nrState < NR_STATE_COAST_END):          #NR_STATE_DROGUE_CHUTES
-         if(self._currState == DINO_STATE_INIT):
-            self._currState = DINO_STATE_START_EXP
-         else:
-            self._currState = DINO_STATE_EXPERIMENT
-            
-      elif(nrState < NR_STATE_TOUCHDOWN):  
-         self._currState = DINO_STATE_END_EXP    
-         
-      else:
-         self._currState = DINO_STATE_FINISHED
 
-      # Capture state transitions in the log
-      if(self._prevState != self._currState):
-         DinoLog.logMsg("Transitioned to state=" + str(self._currState))
+   def _registerActions(self):
+      """
+      Register the actions run on each experiment state transition.
+      """
+      sm = self._stateMachine
+      sm.registerAction(DINO_STATE_INIT, DINO_STATE_START_EXP, self._startExperiment)
+      for state in (DINO_STATE_INIT, DINO_STATE_START_EXP, DINO_STATE_EXPERIMENT):
+         sm.registerAction(state, DINO_STATE_END_EXP, self._stopExperiment)
+      for state in (DINO_STATE_INIT, DINO_STATE_START_EXP, DINO_STATE_EXPERIMENT, DINO_STATE_END_EXP):
+         sm.registerAction(state, DINO_STATE_FINISHED, self._finishTest)
+
+      # Leave the CPU to the main loop for the duration of the experiment.
+      # The experiment can return to DINO_STATE_INIT once started, so the
+      # compression resumes on every transition that ends the experiment.
+      sm.registerAction(DINO_STATE_INIT, DINO_STATE_START_EXP, DinoCompressor.pause)
+      for state in (DINO_STATE_INIT, DINO_STATE_START_EXP, DINO_STATE_EXPERIMENT):
+         sm.registerAction(state, DINO_STATE_END_EXP, DinoCompressor.resume)
+         sm.registerAction(state, DINO_STATE_FINISHED, DinoCompressor.resume)
+
+
+   def _registerShutdown(self):
+      """
+      Register the devices stopped by the shutdown coordinator.
+      """
+      self._shutdown.register("camera", lambda timeout: \
+         self._stopDevice("camera", lambda camera: camera.stopRecording(timeout) == False))
+      self._shutdown.register("servo", lambda timeout: \
+         self._stopDevice("servo", lambda servo: servo.stopServo(timeout) == False))
+      self._shutdown.register("spectrometer", lambda timeout: \
+         self._stopDevice("spectrometer", lambda spectrometer: spectrometer.stopCapturing(timeout) == False))
+
+
+   def _stopDevice(self, name, stop):
+      """
+      Stop a device if it was created. Devices that are still being 
+      initialized or were never used have nothing to stop.
+
+      Returns
+      -------
+      bool
+         True if the device is stopped.
+      """
+      if(self._startup.isReady(name) == False):
+         return True
+      device = self._startup.get(name)
+      if(device is None):
+         return True
+      return stop(device)
+
+
+   def _onSignal(self):
+      """
+      End the main loop after a shutdown triggered by a signal.
+      """
+      self._endTest = True
+
+
+   def _determineState(self):
+      """
+      Determine the state of the experiment from the flight state
+      of the last packet and run the actions for any transition.
+      """
+      self._prevState = self._currState
+      self._currState = self._stateMachine.update(self._view.getStateByte())
       return self._currState
 
 
@@ -229,20 +355,15 @@ class DinoMain(object):
       
       This function serves as a wrapper for the DinoThermalControl.run()
       so that is can incorporate trending information if needed.
+      It is called by run() every THERMAL_CONTROL_PERIOD seconds.
       """
-      if(self._thermalCount > THERMAL_CONTROL_PERIOD):
-         self._thermalCount = 0
-      else:
-         self._thermalCount = self._thermalCount + 1
-         return False
-      
       # Determine temperature
 
       if (self._data[I_TEMPERATURE] is not None):
          # Read temperature from EnviroPHat
          temperature = self._data[I_TEMPERATURE]
          #temperature = TURN_ON_HEATER - 10 #test
-         print("EVPHAT:temperature = ", temperature)
+         _LOGGER.debug("EVPHAT:temperature = %s", temperature)
       elif(self._data[I_ALTITUDE] is not None):
 
          # Convert altitude to meters
@@ -270,14 +391,15 @@ class DinoMain(object):
             #print("Altitude = ", altitudeInMeters, "Temperature =", temperature)
       else:
          # Read CPU temperature and use that as an approximation
+        gpiozero = DinoImport.load("gpiozero", "CPUTemperature library")
         try:
-         cpu = CPUTemperature()
+         cpu = gpiozero.CPUTemperature()
          temperature = cpu.temperature + CPU_TEMP_OFFSET
          temperature = round(temperature,2)
-         print("CPU Temperature =", temperature)
+         _LOGGER.debug("CPU Temperature = %s", temperature)
         except:
-         DinoLog.logMsg("ERROR - Could Not Read CPU Temperature.")
-         print("Could not read CPU temperature")
+         DinoLog.logThrottled("ERROR - Could Not Read CPU Temperature.")
+         _LOGGER.debug("Could not read CPU temperature")
 
 
       # Control heater
@@ -294,88 +416,192 @@ class DinoMain(object):
 
       return True
 
+   def _processPacket(self, packet):
+      """
+      Log the data in a packet and run the actions for the 
+      experiment state.
+
+      Parameters
+      ----------
+      packet : DinoPacketView
+         Packet received by DinoSerial.
+
+      Returns
+      -------
+      bool
+         True if the packet was processed. False if it was rejected 
+         because a field in PACKET_FIELDS could not be converted.
+      """
+      for index in PACKET_FIELDS:
+         if(packet.get(index) is None):
+            self._numRejected = self._numRejected + 1
+            DinoLog.logThrottled("ERROR - Rejected packet with corrupted field=[" + str(index) + "].")
+            return False
+      self._view = packet
+      _LOGGER.debug("%s", packet.getBytes())
+      if((self._prewarmed == False) and (packet.getStateByte() in self._prewarmBytes)):
+         self._prewarm()
+      self._readAllData()
+      start = DinoProfiler.start()
+      DinoLog.logData(self._data)
+      start = DinoProfiler.stop(PHASE_LOG, start)
+      # Determine experiment state and run the actions for transitions.
+      self._determineState()
+      DinoProfiler.stop(PHASE_STATE, start)
+      return True
+
+
+   def _prewarm(self):
+      """
+      Start creating the deferred devices in the background.
+      """
+      self._prewarmed = True
+      DinoLog.logMsg("Prewarm camera and spectrometer.")
+      self._startup.prewarm("camera")
+      self._startup.prewarm("spectrometer")
+
+
+   def _getExperimentDevices(self):
+      """
+      Wait for the camera, servo and spectrometer and restart the servo.
+      DinoAsyncMain runs it in its executor.
+
+      Returns
+      -------
+      tuple
+         (camera, servo, spectrometer), None for a device that failed.
+      """
+      servo = self._dinoServo
+      if(servo is not None):
+         servo.restartServo()
+      return (self._dinoCamera, servo, self._dinoSpectrometer)
+
+
+   def _startExperiment(self):
+      """
+      Start the camera, servo and spectrometer jobs.
+      Devices that failed to initialize are skipped.
+      """
+      (camera, servo, spectrometer) = self._getExperimentDevices()
+      if(camera is not None):
+         camera.startRecording(duration=CAMERA_REC_DURATION, single=False)
+      if(servo is not None):
+         servo.startServo(SERVO_AGITATION_INTERVAL)
+      if(spectrometer is not None):
+         spectrometer.startCapturing(SPECTROMETER_CAPTURE_INTERVAL)
+
+
+   def _stopExperiment(self):
+      """
+      Stop the camera, servo and spectrometer jobs.
+      """
+      #stop the servo low level oscillation
+      servo = self._dinoServo
+      if(servo is not None):
+         servo.hardStopServo()
+      #stop the jobs
+      self._shutdown.run("END_EXP")
+
+
+   def _finishTest(self):
+      """
+      Terminate the main loop.
+      """
+      self._endTest = True
+      self._shutdown.run("FINISHED")
+
+
+   def _nextDeadline(self, deadline, period, now):
+      """
+      Compute the next deadline for periodic work.
+
+      Deadlines advance by a fixed period from the previous deadline such
+      that the cadence does not drift with the time spent in the loop. 
+      If the loop fell behind by more than a period, missed runs are
+      skipped instead of running back to back.
+
+      Parameters
+      ----------
+      deadline : float
+         Previous deadline (MET).
+      period : float
+         Period in seconds.
+      now : float
+         Current MET.
+
+      Returns
+      -------
+      float
+         Next deadline (MET).
+      """
+      deadline = deadline + period
+      if(deadline <= now):
+         deadline = now + period
+      return deadline
+
+
    def run(self):
-    try:
-      ser = serial.Serial(port=PORTNAME, baudrate=BAUDRATE, timeout=TIMEOUT)
-    except:
+    self._shutdown.installSignalHandler(self._onSignal)
+
+    # Start receiving packets in the background.
+    if(self._dinoSerial.startReading() == False):
       DinoLog.logMsg("ERROR - Failed To Open Serial Port.")
-      print("Failed To Open Serial Port")
-      #self._dinoSerial.openSerialPort()
+      _LOGGER.debug("Failed To Open Serial Port")
+    serialFd = self._dinoSerial.fileno()
+
+    self._nextThermal = DinoTime.getMET()
+    self._nextEnv     = self._nextThermal
+    self._nextProfile = self._nextThermal + PROFILE_PERIOD
     while(self._endTest == False):
-         #print("Reading the USB serial port")
-         #Read all sensor data and serial data
-
-          # Run thermal algorithm
-         try:
-          self._runThermalControl()  #need to run thermal control even before communication with NRFF
-         except:
-          DinoLog.logMsg("ERROR - Failed Thermal Control.")
-          print("Failed Thermal Control")
-
-         try:
-          currMet = DinoTime.getMET()
-         except:
-           DinoLog.logMsg("ERROR - Could Not Read MET")
-           print("Could Not Read MET")
-
-         try:
-          data_in = ser.read(MAXBUFFER)
-         except:
-          DinoLog.logMsg("ERROR - Could Not Read Serial Port")
-          print("Could Not Read Serial Port")
-
-         if (len(data_in) == 0):
-            #print("Waiting For Serial Data")
-            #print(currMet)
-            tempEnv    = self._dinoEnv.readData()
+         DinoProfiler.countLoop()
+         currMet = DinoTime.getMET()
+
+         # Write the loop timing to the log.
+         if(currMet >= self._nextProfile):
+            DinoProfiler.logSummary()
+            DinoMain._logClock()
+            DinoScheduler().logStats()
+            self._nextProfile = self._nextDeadline(self._nextProfile, PROFILE_PERIOD, currMet)
+
+         # Read the Envirophat while there are no packets. 
+         # Otherwise it is read along with each packet.
+         if(currMet >= self._nextEnv):
+            tempEnv    = self._readEnvirophat()
             self._data[I_TEMPERATURE]     = tempEnv[ENV_HAT_TEMPERATURE]
-            continue
-
-        # Check that packet was well formatted.
-         try:
-          if not self.parse_serial_packet(data_in.decode('utf-8')):
-            continue
-         except:
-             DinoLog.logMsg("ERROR - Could not decode serial data.")
-             continue
-        
-         print(data_in)
-         self._readAllData()
-         DinoLog.logData(self._data)
-         # Determine experiment state
-         self._determineState()
+            self._nextEnv = self._nextDeadline(self._nextEnv, ENVIROPHAT_PERIOD, currMet)
 
          # Run thermal algorithm
-         #self._runThermalControl()
-
-         if(self._currState == DINO_STATE_INIT):
-            pass
-
-         elif(self._currState == DINO_STATE_START_EXP):
-            self._dinoServo.restartServo()
-            self._dinoCamera.startRecording(duration=CAMERA_REC_DURATION)
-            self._dinoServo.startServo(SERVO_AGITATION_INTERVAL)
-            self._dinoSpectrometer.startCapturing(SPECTROMETER_CAPTURE_INTERVAL)
-
-            
-         elif(self._currState == DINO_STATE_EXPERIMENT):
-            pass
-            
-         elif(self._currState == DINO_STATE_END_EXP):
-            #stop the servo low level oscillation
-            self._dinoServo.hardStopServo()
-            #stop the threads
-            self._dinoCamera.stopRecording()
-            self._dinoServo.stopServo()
-            self._dinoSpectrometer.stopCapturing()
-                        
-         else:
-            self._endTest = True
-            self._dinoServo.stopServo()
-
-         
-         # Sleep for 0.05sec. By the time it wakes up, 
-         # there should be serial data readily available.
-         sleep(0.1)
-         
+         if(currMet >= self._nextThermal):
+            start = DinoProfiler.start()
+            try:
+               self._runThermalControl()  #need to run thermal control even before communication with NRFF
+            except:
+               DinoLog.logThrottled("ERROR - Failed Thermal Control.")
+               _LOGGER.debug("Failed Thermal Control")
+            DinoProfiler.stop(PHASE_THERMAL, start)
+            self._nextThermal = self._nextDeadline(self._nextThermal, THERMAL_CONTROL_PERIOD, currMet)
+
+         # Wait for packets from the serial thread until the next deadline,
+         # such that packets are handled as soon as they arrive.
+         timeout = min(self._nextThermal, self._nextEnv, self._nextProfile) - DinoTime.getMET()
+         ready = DinoTime.select([serialFd], max(timeout, 0.0))
+         if (len(ready) == 0):
+            continue
 
+         # Process every packet queued by the serial thread such that
+         # a backlog is drained in one pass instead of one packet per loop.
+         for packet in self._dinoSerial.getPackets():
+            start = DinoProfiler.start()
+            self._processPacket(packet)
+            DinoProfiler.stop(PHASE_PACKET, start)
+            if(self._endTest == True):
+               break
+         self._nextEnv = DinoTime.getMET() + ENVIROPHAT_PERIOD
+
+    self._dinoSerial.stopReading()
+    self._startup.waitAll()
+    DinoImport.logReport()
+    DinoProfiler.logSummary()
+    DinoMain._logClock()
+    DinoScheduler().logStats()
+    DinoMain._logCompression()
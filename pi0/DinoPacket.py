@@ -0,0 +1,273 @@
+from DinoConstants import *
+
+
+# Field names within the New Shepard packet received at 10Hz.
+# From: NR-BLUE-W0001 (RevA) Feather Frame Payload User's Guide (002).pdf
+# These indices are positions in a decoded packet record. They match the
+# wire order of the New Shepard layout. Other layouts (see PACKET_HAB) map
+# their wire fields onto the same record positions so that consumers do
+# not need to know which vehicle sent the data.
+NR_FLIGHT_STATE    = 0     # Current flight state as a single ASCII char.
+NR_EXP_TIME        = 1     # Current experiment time in seconds as decimal
+                           # number with 2 digits following the decimal point.
+NR_ALTITUDE        = 2     # Current vehicle altitude above ground level in feet as a
+                           # decimal number with 6 digits following the decimal point.
+NR_VELOCITY_X      = 3     # Current vehicle velocity in feet per second along the three
+NR_VELOCITY_Y      = 4     # axis of the capsule as a decimal number with 6 digits following
+NR_VELOCITY_Z      = 5     # the decimal point.
+NR_ACCELERATION    = 6     # Magnitude of the current vehicle acceleration in feet per
+                           # second squared as a decimal number with 6 digits
+                           # following the decimal point.
+NR_RESERVED_1      = 7     # Reserved for future use. Expect "0.000000".
+NR_RESERVED_2      = 8
+NR_ATTITUDE_X      = 9     # The current vehicle attitude in radians about the three axis
+NR_ATTITUDE_Y      = 10    # as a decimal number with 6 digits following the decimal point.
+NR_ATTITUDE_Z      = 11
+NR_ANG_VEL_X       = 12    # Current vehicle angular velocity in radians per second
+NR_ANG_VEL_Y       = 13    # about the three axis as a decimal number with 6 digits following
+NR_ANG_VEL_Z       = 14    # the decimal point.
+# Warnings triggered for different phases of the flight.
+# Single digit value set to 1 when the warning is TRUE and 0 when FALSE.
+NR_WARNING_LIFTOFF = 15    # Triggered on main engine ignition
+NR_WARNING_RCS     = 16    # Triggered during microgravity phase of flight to notify
+NR_WARNING_ESCAPE  = 17    # Triggered during the escape motor ignition process
+NR_WARNING_CHUTE   = 18    # Triggered shortly before drogue chute deployments
+NR_WARNING_LANDING = 19    # Triggered by altitude shortly before the capsule touches down
+NR_WARNING_FAULT   = 20    # Triggered in anticipation of an abnormally hard landing
+NR_SIZE            = 21
+
+# Positions within the record used by the HAB layout for sensors that
+# have no equivalent in the New Shepard packet.
+HAB_TEMPERATURE    = NR_RESERVED_1  # SenseHAT temperature in Celsius.
+HAB_HUMIDITY       = NR_RESERVED_2  # SenseHAT relative humidity in percent.
+
+# Marker for wire fields that do not map onto the record (padding).
+PAD_FIELD = None
+
+
+class DinoPacket(object):
+   """
+   Class DinoPacket - Declarative schema for serial packets.
+
+   A schema describes one version of one wire layout as a list of fields
+   in the order they are transmitted. Each field is a tuple of:
+      1) Record index (NR_*) where the value is stored, or PAD_FIELD.
+      2) Converter from the wire text to the stored value.
+      3) Format used to encode the stored value back to wire text.
+         For padding fields this is the literal text sent.
+
+   The decoder and encoder are generated once from that list when the
+   schema is created, such that decoding a packet is a single pass over
+   prebuilt converters rather than a branch per field.
+   """
+
+   def __init__(self, name, version, fields, sep=",", prefix="", suffix="", \
+                deleteChars="", terminator="\n"):
+      """
+      Create a packet schema and generate its decoder/encoder.
+
+      Parameters
+      ----------
+      name : str
+         Name of the layout (i.e. "NFF" or "HAB").
+      version : int
+         Version of the layout.
+      fields : list
+         List of (index, converter, format) tuples in wire order.
+      sep : str
+         Separator written between fields by the encoder.
+      prefix : str
+         Text written before the first field by the encoder.
+      suffix : str
+         Text written after the last field by the encoder.
+      deleteChars : str
+         Characters removed from the wire text before splitting it.
+      terminator : str
+         End of packet marker written by the transmitter.
+      """
+      self.name       = name
+      self.version    = version
+      self.size       = len(fields)
+      self.terminator = terminator
+      # Number of bytes before the flight state letter in a packet.
+      self.syncOffset = len(prefix) + fields[0][2].index("{")
+      self.__fields   = tuple(fields)
+      self.__splitSep = sep.strip(deleteChars) if (deleteChars != "") else sep
+      # Byte that separates fields on the wire.
+      self.fieldSep   = self.__splitSep.encode("ascii")
+
+      # Translation table applied once per packet to remove decoration.
+      self.__delete = None
+      if(deleteChars != ""):
+         self.__delete = str.maketrans("", "", deleteChars)
+
+      # Decoder: (record index, converter, wire position) for mapped fields.
+      self.__decoders = tuple( \
+         (index, convert, pos) for pos, (index, convert, fmt) in enumerate(fields) \
+         if index is not PAD_FIELD)
+
+      # Encoder: a single format string for the whole packet.
+      # Padding fields are embedded as literal text.
+      template = []
+      self.__encodeIndex = []
+      for (index, convert, fmt) in fields:
+         if(index is PAD_FIELD):
+            template.append(fmt.replace("{", "{{").replace("}", "}}"))
+         else:
+            template.append(fmt)
+            self.__encodeIndex.append(index)
+      self.__template = prefix + sep.join(template) + suffix
+      self.__encodeIndex = tuple(self.__encodeIndex)
+
+      # Record index to (wire position, converter) for lazy access.
+      fieldMap = [None] * NR_SIZE
+      for (index, convert, pos) in self.__decoders:
+         fieldMap[index] = (pos, convert)
+      self.__fieldMap = tuple(fieldMap)
+
+      # Scratch record such that a partially decoded packet
+      # never leaks into the caller's record.
+      self.__scratch  = self.newRecord()
+      self.__defaults = tuple(self.newRecord())
+
+
+   def newRecord(self):
+      """
+      Allocate a record with default values for every NR_* field.
+
+      Returns
+      -------
+      list
+         List of NR_SIZE values.
+      """
+      record = [0.0] * NR_SIZE
+      record[NR_FLIGHT_STATE] = "@"
+      for i in range(NR_WARNING_LIFTOFF, NR_SIZE):
+         record[i] = 0
+      return record
+
+
+   def decode(self, line, record):
+      """
+      Decode one packet into a preallocated record.
+
+      The record is only updated if every field was converted
+      successfully, otherwise it keeps its previous values.
+
+      Parameters
+      ----------
+      line : str
+         Packet as received, with or without the terminator.
+      record : list
+         Record created with newRecord() to store the values.
+
+      Returns
+      -------
+      bool
+         True if the packet was decoded. False otherwise.
+      """
+      if(self.__delete is not None):
+         line = line.translate(self.__delete)
+      fields = line.strip().split(self.__splitSep)
+      if(len(fields) != self.size):
+         return False
+
+      scratch = self.__scratch
+      try:
+         for (index, convert, pos) in self.__decoders:
+            scratch[index] = convert(fields[pos])
+      except ValueError:
+         return False
+      record[:] = scratch
+      return True
+
+
+   def encode(self, record):
+      """
+      Encode a record in this layout (without the terminator).
+
+      Parameters
+      ----------
+      record : list
+         Record with NR_SIZE values.
+
+      Returns
+      -------
+      str
+         Packet as it would be sent by the vehicle.
+      """
+      return self.__template.format(*[record[i] for i in self.__encodeIndex])
+
+
+   def getFields(self):
+      """
+      Return the list of (index, converter, format) tuples in wire order.
+      """
+      return self.__fields
+
+
+   def getFieldMap(self):
+      """
+      Return a tuple indexed by NR_* with the (wire position, converter)
+      for each field, or None for fields not sent in this layout.
+      """
+      return self.__fieldMap
+
+
+   def getDefaults(self):
+      """
+      Return the default value for each NR_* field as a tuple.
+      """
+      return self.__defaults
+
+
+# New Shepard Feather Frame packet (version 1).
+# From: NR-BLUE-W0001 (RevA) Feather Frame Payload User's Guide (002).pdf
+# Example: @,0.06,59.114758,-0.000678,...,0.000000,0,0,0,0,0,0
+PACKET_NFF = DinoPacket("NFF", 1, [
+   (NR_FLIGHT_STATE,    str,   "{}"),
+   (NR_EXP_TIME,        float, "{:.2f}"),
+   (NR_ALTITUDE,        float, "{:.6f}"),
+   (NR_VELOCITY_X,      float, "{:.6f}"),
+   (NR_VELOCITY_Y,      float, "{:.6f}"),
+   (NR_VELOCITY_Z,      float, "{:.6f}"),
+   (NR_ACCELERATION,    float, "{:.6f}"),
+   (NR_RESERVED_1,      float, "{:.6f}"),
+   (NR_RESERVED_2,      float, "{:.6f}"),
+   (NR_ATTITUDE_X,      float, "{:.6f}"),
+   (NR_ATTITUDE_Y,      float, "{:.6f}"),
+   (NR_ATTITUDE_Z,      float, "{:.6f}"),
+   (NR_ANG_VEL_X,       float, "{:.6f}"),
+   (NR_ANG_VEL_Y,       float, "{:.6f}"),
+   (NR_ANG_VEL_Z,       float, "{:.6f}"),
+   (NR_WARNING_LIFTOFF, int,   "{:d}"),
+   (NR_WARNING_RCS,     int,   "{:d}"),
+   (NR_WARNING_ESCAPE,  int,   "{:d}"),
+   (NR_WARNING_CHUTE,   int,   "{:d}"),
+   (NR_WARNING_LANDING, int,   "{:d}"),
+   (NR_WARNING_FAULT,   int,   "{:d}"),
+   ])
+
+# HAB packet sent by the pi3 (see pi3/HABSim08.py, version 1).
+# The pi3 transmits the Python representation of its transmit buffer,
+# so the brackets, quotes and spaces are removed before splitting.
+# Attitude is in degrees and acceleration is the z-axis in g.
+# Example: ['@', 12.34, 500, 1.234, 0.5, 270.0, 1.002, 24.1, 35.2, '0', ...]
+PACKET_HAB = DinoPacket("HAB", 1, [
+   (NR_FLIGHT_STATE,    str,   "'{}'"),
+   (NR_EXP_TIME,        float, "{!r}"),
+   (NR_ALTITUDE,        int,   "{:d}"),
+   (NR_ATTITUDE_Y,      float, "{!r}"),   # Pitch
+   (NR_ATTITUDE_X,      float, "{!r}"),   # Roll
+   (NR_ATTITUDE_Z,      float, "{!r}"),   # Yaw
+   (NR_ACCELERATION,    float, "{!r}"),
+   (HAB_TEMPERATURE,    float, "{!r}"),
+   (HAB_HUMIDITY,       float, "{!r}"),
+   ] + [(PAD_FIELD, None, "'0'")] * 12,
+   sep=", ", prefix="[", suffix="]", deleteChars="[]' ", terminator="\n\r")
+
+# All known layouts indexed by (name, version).
+PACKET_LAYOUTS = {
+   (PACKET_NFF.name, PACKET_NFF.version) : PACKET_NFF,
+   (PACKET_HAB.name, PACKET_HAB.version) : PACKET_HAB,
+   }
@@ -0,0 +1,129 @@
+from DinoPacket import *
+
+
+# Single character string for every byte value, such that reading the
+# flight state does not allocate a new string for every packet.
+BYTE_TO_CHAR = tuple(chr(i) for i in range(256))
+
+# Marker for fields in the cache that were not converted yet.
+NOT_CONVERTED = object()
+
+
+class DinoPacketView(object):
+   """
+   Class DinoPacketView - Lazy read-only view of a raw packet.
+
+   Decoding a packet up front costs a UTF-8 decode, a split and one
+   conversion per field, even though the main loop only needs a few of
+   them. The view instead keeps the raw bytes received and only converts
+   a field the first time it is accessed. The result is cached for later
+   accesses.
+
+   The flight state is read directly from the sync byte. Other fields
+   are located by splitting the bytes only up to the furthest field
+   accessed so far, and converted straight from bytes without decoding
+   the packet as text. Slicing a memoryview per field was measured to be
+   slower on CPython, since each separator then needs its own find() call
+   and float() copies the memoryview internally anyway.
+   """
+
+   def __init__(self, layout, buf):
+      """
+      Create a view of a packet.
+
+      Parameters
+      ----------
+      layout : DinoPacket
+         Layout used to interpret the packet (i.e. PACKET_NFF).
+      buf : bytes
+         Packet as returned by DinoFramer (without terminator).
+      """
+      self.__layout   = layout
+      self.__buf      = buf
+      self.__fieldMap = layout.getFieldMap()
+      self.__values   = [NOT_CONVERTED] * NR_SIZE
+
+      # Fields split so far. The last entry holds the rest of the packet.
+      self.__fields   = ()
+
+      self.__valid = ((buf.count(layout.fieldSep) == layout.size - 1) and \
+                      (len(buf) > layout.syncOffset))
+      if(self.__valid == True):
+         self.__values[NR_FLIGHT_STATE] = BYTE_TO_CHAR[buf[layout.syncOffset]]
+
+
+   def isValid(self):
+      """
+      Return True if the packet has the number of fields in the layout.
+      Individual fields are validated when they are converted.
+      """
+      return self.__valid
+
+
+   def getStateByte(self):
+      """
+      Return the flight state as a byte value (i.e. 64 for '@').
+      """
+      return self.__buf[self.__layout.syncOffset]
+
+
+   def getState(self):
+      """
+      Return the flight state as a single character string.
+      """
+      return self.__values[NR_FLIGHT_STATE]
+
+
+   def get(self, index):
+      """
+      Return a field from the packet, converting it on first access.
+
+      Parameters
+      ----------
+      index : int
+         NR_* index of the field.
+
+      Returns
+      -------
+      float, int or str
+         Converted value. The layout default for fields not sent in this
+         layout and None if the field could not be converted.
+      """
+      value = self.__values[index]
+      if(value is NOT_CONVERTED):
+         field = self.__fieldMap[index]
+         if(field is None):
+            value = self.__layout.getDefaults()[index]
+         else:
+            pos    = field[0]
+            fields = self.__fields
+            if(pos >= len(fields) - 1):
+               fields = self.__buf.split(self.__layout.fieldSep, pos + 1)
+               self.__fields = fields
+            try:
+               value = field[1](fields[pos])
+            except ValueError:
+               value = None
+         self.__values[index] = value
+      return value
+
+
+   def toRecord(self, record):
+      """
+      Convert every field into a record (i.e. to encode or log it).
+
+      Parameters
+      ----------
+      record : list
+         Record created with DinoPacket.newRecord().
+      """
+      for index in range(NR_SIZE):
+         record[index] = self.get(index)
+      return record
+
+
+   def getBytes(self):
+      """
+      Return the raw packet.
+      """
+      return self.__buf
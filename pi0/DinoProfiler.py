@@ -0,0 +1,235 @@
+import time
+from   bisect    import bisect_left
+from   threading import Lock  # Add phases while a summary is computed
+
+from DinoTime import *
+from DinoLog  import *
+
+
+# Upper limit (usec) of each histogram bucket.
+# Times above the last limit are counted in an extra bucket.
+PROFILE_BUCKETS = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, \
+                   10000, 20000, 50000, 100000, 200000)
+
+# Period in seconds between summaries written to the log.
+PROFILE_PERIOD = 10.0
+
+# Phases timed by the application.
+PHASE_SERIAL_READ  = "serial_read"  # Read bytes waiting in the serial port
+PHASE_SERIAL_FRAME = "serial_frame" # Frame and queue packets
+PHASE_THERMAL      = "thermal"      # DinoMain._runThermalControl()
+PHASE_ENVIROPHAT   = "envirophat"   # DinoEnvirophat.readData()
+PHASE_PARSE        = "parse"        # Convert the packet fields used
+PHASE_LOG          = "log"          # DinoLog.logData()
+PHASE_STATE        = "state"        # DinoMain._determineState()
+PHASE_PACKET       = "packet"       # Process a packet from start to end
+
+# Histograms created with the profiler. The serial thread times its phases
+# while the main loop computes the summary, so these are never added later.
+PROFILE_PHASES = (PHASE_SERIAL_READ, PHASE_SERIAL_FRAME, PHASE_THERMAL, PHASE_ENVIROPHAT, \
+                  PHASE_PARSE, PHASE_LOG, PHASE_STATE, PHASE_PACKET)
+
+
+class DinoProfiler(object):
+   """
+   Class DinoProfiler - Time each phase of the main loop.
+
+   Each phase is timed with perf_counter_ns() into a histogram with fixed
+   buckets (see PROFILE_BUCKETS), such that recording a sample is a
+   bisect and an increment regardless of how long the test runs.
+
+   Periodically, logSummary() writes the loop rate and the p50/p95/max
+   of each phase since the previous summary to the log. The same numbers
+   are available through getSummary(). Percentiles are reported as the
+   upper limit of the bucket that contains them.
+
+   Like DinoLog, the class uses static methods such that any class can
+   time a phase without first getting an instance. Calls made before the
+   profiler is created (or while it is disabled) are ignored. Each phase
+   must only be timed from one thread. Phases that are not in 
+   PROFILE_PHASES are added on their first sample.
+   """
+
+   # DinoProfiler Singleton instance
+   __instance = None
+
+   # Ignore samples until the profiler is created.
+   __enabled = False
+
+
+   def __new__(cls, enabled=True):
+      """
+      Create a singleton instance of the DinoProfiler class.
+
+      Parameters
+      ----------
+      enabled : bool
+         Record samples if True. Otherwise all calls are ignored.
+      """
+      if(DinoProfiler.__instance is None):
+         DinoProfiler.__instance = object.__new__(cls)
+         DinoProfiler.__limits    = tuple(limit * 1000 for limit in PROFILE_BUCKETS)
+         DinoProfiler.__phases    = {phase : DinoProfiler.__newHistogram() for phase in PROFILE_PHASES}
+         DinoProfiler.__lock      = Lock()
+         DinoProfiler.__loops     = 0
+         DinoProfiler.__lastLoops = 0
+         DinoProfiler.__lastTime  = time.perf_counter_ns()
+         DinoProfiler.__enabled   = enabled
+      return DinoProfiler.__instance
+
+
+   @staticmethod
+   def start():
+      """
+      Return the start time of a phase.
+
+      Returns
+      -------
+      int
+         Time in nsec to pass to stop().
+      """
+      return time.perf_counter_ns()
+
+
+   @staticmethod
+   def stop(phase, start):
+      """
+      Record the time elapsed since start for a phase.
+
+      The current time is returned, such that consecutive phases can be
+      timed without reading the clock twice.
+
+      Parameters
+      ----------
+      phase : str
+         Name of the phase (i.e. PHASE_THERMAL).
+      start : int
+         Time in nsec returned by start() or a previous stop().
+
+      Returns
+      -------
+      int
+         Time in nsec at the end of the phase.
+      """
+      now = time.perf_counter_ns()
+      if(DinoProfiler.__enabled == False):
+         return now
+
+      elapsed = now - start
+      hist = DinoProfiler.__phases.get(phase)
+      if(hist is None):
+         with DinoProfiler.__lock:
+            hist = DinoProfiler.__phases.setdefault(phase, DinoProfiler.__newHistogram())
+      hist['counts'][bisect_left(DinoProfiler.__limits, elapsed)] += 1
+      if(elapsed > hist['max']):
+         hist['max'] = elapsed
+      return now
+
+
+   @staticmethod
+   def countLoop():
+      """
+      Count one iteration of the main loop to compute the loop rate.
+      """
+      DinoProfiler.__loops = DinoProfiler.__loops + 1
+
+
+   @staticmethod
+   def __newHistogram():
+      """
+      Return an empty histogram for a phase.
+      """
+      return {'counts' : [0] * (len(PROFILE_BUCKETS) + 1), \
+              'last'   : [0] * (len(PROFILE_BUCKETS) + 1), \
+              'max'    : 0}
+
+
+   @staticmethod
+   def __getPhases():
+      """
+      Return a list of (phase, histogram) that other threads can extend.
+      """
+      with DinoProfiler.__lock:
+         return list(DinoProfiler.__phases.items())
+
+
+   @staticmethod
+   def __percentile(counts, total, fraction, maxTime):
+      """
+      Return the upper limit (usec) of the bucket containing a percentile,
+      or the maximum if it is in the last bucket or above the maximum.
+      """
+      target = total * fraction
+      cumulative = 0
+      for i in range(len(PROFILE_BUCKETS)):
+         cumulative = cumulative + counts[i]
+         if(cumulative >= target):
+            return min(PROFILE_BUCKETS[i], maxTime)
+      return maxTime
+
+
+   @staticmethod
+   def getSummary():
+      """
+      Return the statistics since the last summary written to the log.
+
+      Returns
+      -------
+      dict
+         'period' : seconds since the last summary.
+         'loopRate' : iterations per second of the main loop.
+         'phases' : dict with the 'count', 'p50', 'p95' and 'max' (usec)
+            of each phase timed at least once.
+      """
+      period = (time.perf_counter_ns() - DinoProfiler.__lastTime) / 1e9
+      loops  = DinoProfiler.__loops - DinoProfiler.__lastLoops
+      summary = {'period'   : period, \
+                 'loopRate' : (loops / period) if (period > 0) else 0.0, \
+                 'phases'   : {}}
+      for phase, hist in DinoProfiler.__getPhases():
+         if(sum(hist['counts']) == 0):
+            continue
+         counts  = [n - last for (n, last) in zip(hist['counts'], hist['last'])]
+         total   = sum(counts)
+         maxTime = hist['max'] / 1000
+         summary['phases'][phase] = { \
+            'count' : total, \
+            'p50'   : DinoProfiler.__percentile(counts, total, 0.50, maxTime), \
+            'p95'   : DinoProfiler.__percentile(counts, total, 0.95, maxTime), \
+            'max'   : maxTime}
+      return summary
+
+
+   @staticmethod
+   def logSummary():
+      """
+      Write the statistics since the last summary to the log and start
+      a new summary period.
+
+      Returns
+      -------
+      dict
+         Summary written to the log (see getSummary()).
+      """
+      if(DinoProfiler.__enabled == False):
+         return None
+
+      summary = DinoProfiler.getSummary()
+      DinoLog.logMsg("PROFILE loop rate=[" + '{0:.1f}'.format(summary['loopRate']) + \
+         "Hz] period=[" + '{0:.1f}'.format(summary['period']) + "sec]")
+      for phase in sorted(summary['phases']):
+         stats = summary['phases'][phase]
+         if(stats['count'] == 0):
+            continue
+         DinoLog.logMsg("PROFILE phase=[" + phase + "] count=[" + str(stats['count']) + \
+            "] p50=[" + '{0:.0f}'.format(stats['p50']) + \
+            "us] p95=[" + '{0:.0f}'.format(stats['p95']) + \
+            "us] max=[" + '{0:.0f}'.format(stats['max']) + "us]")
+
+      # Start a new summary period.
+      for phase, hist in DinoProfiler.__getPhases():
+         hist['last'] = list(hist['counts'])
+         hist['max']  = 0
+      DinoProfiler.__lastLoops = DinoProfiler.__loops
+      DinoProfiler.__lastTime  = time.perf_counter_ns()
+      return summary
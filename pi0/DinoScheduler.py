@@ -0,0 +1,383 @@
+import threading
+from   threading import Thread # Timing thread shared by all jobs
+from   threading import RLock  # Note re-entrant lock
+from   threading import Event  # Wake up the timing thread
+
+from DinoTime   import *
+from DinoLog    import *
+from DinoLogger import *  # Leveled console/debug messages
+
+# Messages of this module (see DinoLogger).
+_LOGGER = DinoLogger.get("DinoScheduler")
+
+# Timer wheel. A job is stored in the slot of its deadline tick, such
+# that adding or cancelling a job does not depend on the number of jobs.
+# Deadlines are not rounded to the tick, which only selects the slot.
+SCHED_TICK  = 0.01 # Unit: sec
+SCHED_SLOTS = 1024 # One revolution covers 10.24sec.
+
+
+class DinoJob(object):
+   """
+   Class DinoJob - Function run by DinoScheduler.
+
+   Returned by DinoScheduler.schedule(). The job keeps the statistics of
+   its runs:
+      1) Jitter - Delay between the deadline and the start of each run.
+      2) Overruns - Runs skipped because the previous one ended after
+         the next deadline (or the timing thread was busy).
+      3) Duration - Time spent in the function.
+   """
+
+   def __init__(self, scheduler, name, callback, period, deadlineNs):
+      """
+      Create a job. Use DinoScheduler.schedule() instead.
+      """
+      self.__scheduler   = scheduler
+      self.__name        = name
+      self.__callback    = callback
+      self.__periodNs    = None if (period is None) else int(round(period * 1e9))
+      self.__done        = Event() # Cleared while the function runs.
+      self.__done.set()
+      self.__cancelled   = False
+      self.__runs        = 0
+      self.__overruns    = 0
+      self.__jitterSum   = 0
+      self.__jitterMax   = 0
+      self.__durationMax = 0
+      self.deadlineNs    = deadlineNs # MET (ns) of the next run. Owned by the scheduler.
+
+
+   def getName(self):
+      """
+      Return the name of the job (i.e. "servo").
+      """
+      return self.__name
+
+
+   def isActive(self):
+      """
+      Return True while the job is scheduled or its function is running.
+      """
+      return (self.__cancelled == False) or (self.__done.is_set() == False)
+
+
+   def cancel(self, timeout=None):
+      """
+      Remove the job from the scheduler.
+
+      Parameters
+      ----------
+      timeout : float
+         Maximum time in seconds to wait for a run in progress to end
+         (None waits until done, 0 only removes the job).
+
+      Returns
+      -------
+      bool
+         True if the function is not running anymore.
+      """
+      self.__scheduler._remove(self)
+      if(threading.current_thread() is self.__scheduler._getThread()):
+         # Cancelled from its own function.
+         return True
+      return self.__done.is_set() or DinoTime.wait(self.__done, timeout)
+
+
+   def getStats(self):
+      """
+      Return the statistics of the runs.
+
+      Returns
+      -------
+      dict
+         runs, overruns, jitterMean, jitterMax and durationMax (sec).
+      """
+      runs = max(self.__runs, 1)
+      return {'runs'        : self.__runs, \
+              'overruns'    : self.__overruns, \
+              'jitterMean'  : self.__jitterSum / runs / 1e9, \
+              'jitterMax'   : self.__jitterMax / 1e9, \
+              'durationMax' : self.__durationMax / 1e9}
+
+
+   def _setCancelled(self):
+      """
+      Mark the job as removed. Called by the scheduler with its lock.
+      """
+      self.__cancelled = True
+
+
+   def _isCancelled(self):
+      """
+      Return True once the job was removed or ended.
+      """
+      return self.__cancelled
+
+
+   def _start(self):
+      """
+      Mark the function as running. Called by the scheduler with its lock.
+      """
+      self.__done.clear()
+
+
+   def _run(self):
+      """
+      Run the function once and compute the next deadline.
+
+      Returns
+      -------
+      bool
+         True if the job must run again.
+      """
+      startNs = DinoTime.getMETNs()
+      try:
+         status = (self.__callback() != False)
+      except:
+         DinoLog.logThrottled("ERROR - Scheduler job=[" + self.__name + "] failed.")
+         status = False
+      endNs = DinoTime.getMETNs()
+
+      jitter = max(startNs - self.deadlineNs, 0)
+      self.__runs        = self.__runs + 1
+      self.__jitterSum   = self.__jitterSum + jitter
+      self.__jitterMax   = max(self.__jitterMax, jitter)
+      self.__durationMax = max(self.__durationMax, endNs - startNs)
+
+      if((status == False) or (self.__periodNs is None)):
+         return False
+
+      # Next deadline from the previous deadline, such that the period
+      # does not drift with the duration of the function. Deadlines that
+      # already passed are skipped instead of running back to back.
+      skipped = max((endNs - self.deadlineNs) // self.__periodNs, 0)
+      self.__overruns = self.__overruns + skipped
+      self.deadlineNs = self.deadlineNs + (skipped + 1) * self.__periodNs
+      return True
+
+
+   def _end(self):
+      """
+      Mark the function as done. Called by the scheduler with its lock.
+      """
+      self.__done.set()
+
+
+class DinoScheduler(object):
+   """
+   Class DinoScheduler - Run periodic functions from a single thread.
+
+   Devices register a function (a job) with a period instead of running
+   their own thread that sleeps between runs. A single timing thread
+   sleeps until the earliest deadline of all jobs and runs the jobs that
+   are due one after the other:
+      1) Deadlines are absolute (MET), such that the period does not
+         drift with the time spent in the function.
+      2) The timing thread sleeps through DinoTime.wait(), such that a
+         new or cancelled job wakes it up immediately and a DinoSimClock
+         can replay the schedule faster than real time.
+      3) Cancelling a job only waits for a run in progress, instead of
+         the rest of the period.
+
+   The jobs are kept in a hashed timer wheel of SCHED_SLOTS slots of
+   SCHED_TICK seconds. Functions run in the timing thread, so a long
+   function delays the other jobs, which shows in their jitter (see
+   DinoJob.getStats() and DinoScheduler.logStats()). A forward jump of
+   the MET (see DinoTime.setTime()) is handled like a late run.
+   """
+
+   # DinoScheduler Singleton instance
+   __instance = None
+
+
+   def __new__(cls):
+      """
+      Create a singleton instance of the DinoScheduler class. The timing
+      thread starts with the first job.
+      """
+      if(DinoScheduler.__instance is None):
+         DinoScheduler.__instance = object.__new__(cls)
+         DinoScheduler.__tickNs  = int(round(SCHED_TICK * 1e9))
+         DinoScheduler.__wheel   = [[] for i in range(SCHED_SLOTS)]
+         DinoScheduler.__tick    = 0     # Earliest tick not processed yet.
+         DinoScheduler.__count   = 0     # Jobs in the wheel.
+         DinoScheduler.__jobs    = {}    # Last job of each name (for the stats).
+         DinoScheduler.__lock    = RLock()
+         DinoScheduler.__wake    = Event()
+         DinoScheduler.__thread  = None
+      return DinoScheduler.__instance
+
+
+   def schedule(self, name, callback, period=None, delay=0.0):
+      """
+      Run a function periodically or once.
+
+      Parameters
+      ----------
+      name : str
+         Name of the job in the log (i.e. "servo").
+      callback : function
+         Called without arguments from the timing thread. Returning
+         False (i.e. on a fault) ends the job.
+      period : float
+         Time in seconds between runs. None runs the function once.
+      delay : float
+         Time in seconds until the first run.
+
+      Returns
+      -------
+      DinoJob
+         Handle to cancel the job and read its statistics. None if the
+         timing thread could not be started.
+      """
+      job = DinoJob(self, name, callback, period, DinoTime.getMETNs() + int(round(delay * 1e9)))
+      with self.__lock:
+         if(self.__start() == False):
+            return None
+         self.__jobs[name] = job
+         self.__insert(job)
+      self.__wake.set()
+      return job
+
+
+   def getJobs(self):
+      """
+      Return the last job scheduled with each name.
+      """
+      with self.__lock:
+         return list(self.__jobs.values())
+
+
+   def logStats(self):
+      """
+      Log the statistics of the last job of each name.
+      """
+      for job in self.getJobs():
+         stats = job.getStats()
+         DinoLog.logMsg("SCHED job=[" + job.getName() + "] runs=[" + str(stats['runs']) + \
+            "] overruns=[" + str(stats['overruns']) + \
+            "] jitter=[" + '{0:.1f}'.format(stats['jitterMean'] * 1000) + \
+            "/" + '{0:.1f}'.format(stats['jitterMax'] * 1000) + \
+            "ms] duration=[" + '{0:.1f}'.format(stats['durationMax'] * 1000) + "ms]")
+
+
+   def _remove(self, job):
+      """
+      Remove a job from the wheel. Use DinoJob.cancel() instead.
+      """
+      with self.__lock:
+         if(job._isCancelled() == True):
+            return
+         job._setCancelled()
+         slot = self.__wheel[self.__getSlot(job)]
+         if(job in slot):
+            slot.remove(job)
+            self.__count = self.__count - 1
+      self.__wake.set()
+
+
+   def _getThread(self):
+      """
+      Return the timing thread (None until the first job).
+      """
+      return self.__thread
+
+
+   def __start(self):
+      """
+      Start the timing thread if needed. Called with the lock.
+      """
+      if((self.__thread is not None) and (self.__thread.is_alive() == True)):
+         return True
+      try:
+         self.__tick   = DinoTime.getMETNs() // self.__tickNs
+         self.__thread = Thread(target=self.__run, name="DinoScheduler", daemon=True)
+         self.__thread.start()
+      except:
+         DinoLog.logMsg("ERROR - Could not start scheduler thread.")
+         self.__thread = None
+         return False
+      return True
+
+
+   def __getSlot(self, job):
+      """
+      Return the slot of a job. A deadline that already passed goes in
+      the slot of the current tick, which is always processed next.
+      """
+      return max(job.deadlineNs // self.__tickNs, self.__tick) % SCHED_SLOTS
+
+
+   def __insert(self, job):
+      """
+      Add a job to the wheel. Called with the lock.
+      """
+      self.__wheel[self.__getSlot(job)].append(job)
+      self.__count = self.__count + 1
+
+
+   def __popDue(self, nowNs):
+      """
+      Remove the jobs due by nowNs from the slots of the ticks elapsed
+      since the last call. Called with the lock.
+      """
+      due     = []
+      nowTick = nowNs // self.__tickNs
+      for tick in range(self.__tick, min(nowTick + 1, self.__tick + SCHED_SLOTS)):
+         slot = self.__wheel[tick % SCHED_SLOTS]
+         for job in [job for job in slot if (job.deadlineNs <= nowNs)]:
+            slot.remove(job)
+            self.__count = self.__count - 1
+            job._start()
+            due.append(job)
+      self.__tick = max(self.__tick, nowTick)
+      due.sort(key=lambda job: job.deadlineNs)
+      return due
+
+
+   def __getNextDeadline(self):
+      """
+      Return the earliest deadline (MET in ns) or None without jobs.
+      Called with the lock.
+      """
+      if(self.__count == 0):
+         return None
+      # Jobs in the slot of a tick can belong to later revolutions.
+      for tick in range(self.__tick, self.__tick + SCHED_SLOTS):
+         deadlines = [job.deadlineNs for job in self.__wheel[tick % SCHED_SLOTS] \
+            if (job.deadlineNs // self.__tickNs <= tick)]
+         if(len(deadlines) > 0):
+            return min(deadlines)
+      # Only jobs more than a revolution away.
+      return min(job.deadlineNs for slot in self.__wheel for job in slot)
+
+
+   def __run(self):
+      """
+      Timing thread. Runs the jobs that are due and sleeps until the
+      next deadline or until a job is added or cancelled.
+      """
+      while(True):
+         with self.__lock:
+            self.__wake.clear()
+            due = self.__popDue(DinoTime.getMETNs())
+            if(len(due) == 0):
+               nextNs = self.__getNextDeadline()
+
+         if(len(due) == 0):
+            timeout = None if (nextNs is None) else (nextNs - DinoTime.getMETNs()) / 1e9
+            if((timeout is None) or (timeout > 0)):
+               DinoTime.wait(self.__wake, timeout)
+            continue
+
+         for job in due:
+            again = False
+            if(job._isCancelled() == False):
+               again = job._run()
+            with self.__lock:
+               if(again == False):
+                  job._setCancelled()
+               elif(job._isCancelled() == False):
+                  self.__insert(job)
+               job._end()
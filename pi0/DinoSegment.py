@@ -0,0 +1,428 @@
+import os
+import glob
+
+
+# Size of each segment. Segments are preallocated such that the file does
+# not grow (and fragment) a block at a time while writing.
+SEGMENT_SIZE   = 4 * 1024 * 1024 # Unit: bytes
+# Maximum MET covered by each segment.
+SEGMENT_PERIOD = 300.0           # Unit: sec
+
+# Index of the segments in an archive. Each line is
+# "segment,first MET,last MET,size" where size is the number of bytes
+# flushed to the segment. Numbers are fixed width such that the line of a
+# segment is updated in place. INDEX_CLOSED is appended once all segments
+# were closed cleanly.
+INDEX_EXT      = ".idx"
+INDEX_SEP      = ","
+INDEX_CLOSED   = "closed"
+INDEX_WIDTH    = 12
+
+# Bytes read at a time while recovering a segment.
+RECOVER_CHUNK  = 65536
+
+
+class DinoSegmentIndex(object):
+   """
+   Class DinoSegmentIndex - Index of the segments in a log archive.
+
+   The index lists each segment with the MET range it covers and the
+   number of bytes flushed to it. The line of a segment is rewritten in 
+   place every time the segment is flushed, such that the index stays
+   small and after a power cut each segment can be truncated back to the
+   last size known to be complete (see recover()).
+   """
+
+   def __init__(self, path):
+      """
+      Open the index for writing.
+
+      Parameters
+      ----------
+      path : str
+         Filename of the index.
+      """
+      self.__path  = path
+      self.__fp    = None
+      self.__slots = {}  # Offset of the line of each segment.
+      self.__end   = 0   # End of the segment lines.
+
+
+   def getFilename(self):
+      """
+      Return the filename of the index.
+      """
+      return self.__path
+
+
+   def update(self, segment, firstMet, lastMet, size):
+      """
+      Record the MET range and size flushed to a segment.
+
+      Parameters
+      ----------
+      segment : str
+         Filename of the segment (without folder).
+      firstMet : float
+         MET of the first entry in the segment.
+      lastMet : float
+         MET of the last entry in the segment.
+      size : int
+         Number of bytes flushed to the segment.
+      """
+      if(self.__fp is None):
+         # Re-opened after close(). Remove the closed marker.
+         self.__fp = open(self.__path, 'r+b' if os.path.exists(self.__path) else 'w+b')
+         self.__fp.truncate(self.__end)
+
+      line = (segment + INDEX_SEP + \
+         '{0:{1}.2f}'.format(firstMet, INDEX_WIDTH) + INDEX_SEP + \
+         '{0:{1}.2f}'.format(lastMet, INDEX_WIDTH) + INDEX_SEP + \
+         '{0:{1}d}'.format(size, INDEX_WIDTH) + "\n").encode('ascii')
+      offset = self.__slots.get(segment)
+      if(offset is None):
+         offset = self.__end
+         self.__slots[segment] = offset
+         self.__end = self.__end + len(line)
+      self.__fp.seek(offset)
+      self.__fp.write(line)
+      self.__fp.flush()
+
+
+   def sync(self):
+      """
+      Wait until the index is on the storage (fsync).
+      """
+      if(self.__fp is not None):
+         os.fsync(self.__fp.fileno())
+
+
+   def close(self):
+      """
+      Mark the archive as closed cleanly and close the index.
+      """
+      if(self.__fp is None):
+         self.__fp = open(self.__path, 'ab')
+      else:
+         self.__fp.seek(self.__end)
+      self.__fp.write((INDEX_CLOSED + "\n").encode('ascii'))
+      self.__fp.close()
+      self.__fp = None
+
+
+   @staticmethod
+   def read(path):
+      """
+      Read an index.
+
+      Parameters
+      ----------
+      path : str
+         Filename of the index.
+
+      Returns
+      -------
+      tuple
+         (segments, closed) where segments is a dict with the
+         (first MET, last MET, size) of each segment in the order
+         they were created and closed is True if the archive was
+         closed cleanly.
+      """
+      segments = {}
+      closed   = False
+      with open(path, 'r') as fp:
+         for line in fp:
+            fields = line.rstrip("\n").split(INDEX_SEP)
+            if(fields[0] == INDEX_CLOSED):
+               closed = True
+            elif(len(fields) == 4):
+               segments[fields[0]] = (float(fields[1]), float(fields[2]), int(fields[3]))
+      return (segments, closed)
+
+
+   @staticmethod
+   def getSegments(path, ext):
+      """
+      Return the filenames of the segments of one type in an archive.
+
+      Parameters
+      ----------
+      path : str
+         Filename of the index.
+      ext : str
+         Extension of the segments (i.e. ".txt").
+
+      Returns
+      -------
+      list
+         Filename of each segment in the order they were written.
+      """
+      (segments, closed) = DinoSegmentIndex.read(path)
+      folder = os.path.dirname(path)
+      return [os.path.join(folder, name) for name in segments if name.endswith(ext)]
+
+
+   @staticmethod
+   def recover(path):
+      """
+      Truncate the segments of an archive that was not closed cleanly.
+
+      Each segment is truncated to the size last recorded in the index,
+      which removes the preallocated space and any entry that was only
+      partially written. Text segments are also truncated after the last
+      complete line in case the index is ahead of the data.
+
+      Parameters
+      ----------
+      path : str
+         Filename of the index.
+
+      Returns
+      -------
+      int
+         Number of segments recovered. Zero if the archive was closed.
+      """
+      (segments, closed) = DinoSegmentIndex.read(path)
+      if(closed == True):
+         return 0
+      folder = os.path.dirname(path)
+      for (name, (firstMet, lastMet, size)) in segments.items():
+         segment = os.path.join(folder, name)
+         if(os.path.exists(segment) == False):
+            continue
+         with open(segment, 'r+b') as fp:
+            size = min(size, os.fstat(fp.fileno()).st_size)
+            if(name.endswith(".txt") == True):
+               size = DinoSegmentIndex.__lastLine(fp, size)
+            fp.truncate(size)
+      index = DinoSegmentIndex(path)
+      index.close()
+      return len(segments)
+
+
+   @staticmethod
+   def recoverAll(root):
+      """
+      Recover every archive in a folder that was not closed cleanly
+      (i.e. after a power cut).
+
+      Parameters
+      ----------
+      root : str
+         Folder that contains the archives (i.e. "Logs").
+
+      Returns
+      -------
+      list
+         Filename of the index of each archive recovered.
+      """
+      recovered = []
+      for path in sorted(glob.glob(os.path.join(root, "*", "*" + INDEX_EXT))):
+         try:
+            if(DinoSegmentIndex.recover(path) > 0):
+               recovered.append(path)
+         except:
+            pass
+      return recovered
+
+
+   @staticmethod
+   def __lastLine(fp, size):
+      """
+      Return the size of a text segment up to its last complete line.
+      """
+      end = size
+      while(end > 0):
+         start = max(end - RECOVER_CHUNK, 0)
+         fp.seek(start)
+         pos = fp.read(end - start).rfind(b"\n")
+         if(pos >= 0):
+            return start + pos + 1
+         end = start
+      return 0
+
+
+
+class DinoSegmentFile(object):
+   """
+   Class DinoSegmentFile - Log file split into preallocated segments.
+
+   Data is written to a sequence of segments named after the base path
+   with a sequence number (i.e. "results_000.txt"). Each segment is
+   preallocated with posix_fallocate() and a new one is started once it
+   is full or covers SEGMENT_PERIOD seconds of MET. Closing a segment
+   truncates the unused space. Each flush records the size of the segment
+   in the index, such that a power cut loses at most the data written
+   since the last flush.
+
+   A segment that is still open is followed by zeros up to its
+   preallocated size. Readers stop at the first NUL byte (text) or
+   record with id zero (binary).
+
+   Once a segment is full, it is passed to the handler given to
+   setSealedHandler() (i.e. to compress it).
+   """
+
+   def __init__(self, index, basePath, ext, header=b"", \
+                maxSize=SEGMENT_SIZE, maxPeriod=SEGMENT_PERIOD):
+      """
+      Create the segmented file. The first segment is created on the
+      first write.
+
+      Parameters
+      ----------
+      index : DinoSegmentIndex
+         Index of the archive.
+      basePath : str
+         Path and name of the segments without the sequence number.
+      ext : str
+         Extension of the segments (i.e. ".txt").
+      header : bytes
+         Data written at the start of each segment.
+      maxSize : int
+         Size in bytes preallocated for each segment.
+      maxPeriod : float
+         Maximum MET in seconds covered by each segment.
+      """
+      self.__index     = index
+      self.__basePath  = basePath
+      self.__ext       = ext
+      self.__header    = header
+      self.__maxSize   = maxSize
+      self.__maxPeriod = maxPeriod
+      self.__count     = 0
+      self.__path      = None
+      self.__fp        = None
+      self.__size      = 0
+      self.__flushed   = 0
+      self.__firstMet  = None
+      self.__lastMet   = None
+      self.__onSealed  = None
+
+
+   def setSealedHandler(self, handler):
+      """
+      Set a function called with the filename of each segment once it
+      is complete and will not be written again.
+      """
+      self.__onSealed = handler
+
+
+   def getFilename(self):
+      """
+      Return the filename of the current segment (None before the first write).
+      """
+      return self.__path
+
+
+   def write(self, data, firstMet, lastMet):
+      """
+      Write data to the current segment, starting a new segment first
+      if it would be full or cover too long a period.
+
+      Parameters
+      ----------
+      data : bytes
+         Data to write.
+      firstMet : float
+         MET of the first entry in data.
+      lastMet : float
+         MET of the last entry in data.
+
+      Returns
+      -------
+      int
+         Number of bytes written.
+      """
+      if(self.__path is not None):
+         full    = (self.__size + len(data) > self.__maxSize) and (self.__size > len(self.__header))
+         expired = (self.__firstMet is not None) and (lastMet - self.__firstMet >= self.__maxPeriod)
+         if((full == True) or (expired == True)):
+            self.close()
+            if(self.__onSealed is not None):
+               self.__onSealed(self.__path)
+            self.__path = None
+      if(self.__path is None):
+         self.__newSegment()
+      if(self.__fp is None):
+         self.__reopen()
+
+      self.__fp.write(data)
+      self.__size = self.__size + len(data)
+      if(self.__firstMet is None):
+         self.__firstMet = firstMet
+      self.__lastMet = lastMet
+      return len(data)
+
+
+   def flush(self):
+      """
+      Flush the current segment and record its size in the index.
+      """
+      if(self.__fp is None):
+         return
+      self.__fp.flush()
+      if(self.__flushed != self.__size):
+         self.__flushed = self.__size
+         self.__index.update(os.path.basename(self.__path), \
+            self.__firstMet, self.__lastMet, self.__size)
+
+
+   def sync(self):
+      """
+      Flush the current segment and wait until it is on the storage (fsync).
+      """
+      if(self.__fp is None):
+         return
+      self.flush()
+      os.fsync(self.__fp.fileno())
+
+
+   def close(self):
+      """
+      Flush and close the current segment, truncating its unused space.
+      The next write continues the same segment if it is not full.
+      """
+      if(self.__fp is None):
+         return
+      self.flush()
+      self.__fp.truncate(self.__size)
+      self.__fp.close()
+      self.__fp = None
+
+
+   def __newSegment(self):
+      """
+      Create and preallocate the next segment.
+      """
+      self.__path     = self.__basePath + "_" + '{0:03d}'.format(self.__count) + self.__ext
+      self.__count    = self.__count + 1
+      self.__size     = 0
+      self.__flushed  = 0
+      self.__firstMet = None
+      self.__lastMet  = None
+      self.__fp = open(self.__path, 'w+b')
+      self.__preallocate()
+      if(len(self.__header) > 0):
+         self.__fp.write(self.__header)
+         self.__size = len(self.__header)
+
+
+   def __reopen(self):
+      """
+      Re-open the current segment after close() to continue writing it.
+      """
+      self.__fp = open(self.__path, 'r+b')
+      self.__preallocate()
+      self.__fp.seek(self.__size)
+
+
+   def __preallocate(self):
+      """
+      Reserve the space for the segment if supported by the platform.
+      """
+      if(hasattr(os, "posix_fallocate") == True):
+         try:
+            os.posix_fallocate(self.__fp.fileno(), 0, self.__maxSize)
+         except:
+            pass
@@ -1,47 +1,18 @@
 from threading     import Thread # Thread to record continuously
 from threading     import RLock  # Note re-entrant lock
 from threading     import Event  # Events for communicating within threads
+import queue                     # Bounded queue of packets received
+import os
 
 from DinoConstants import *
 from DinoTime      import *
 from DinoLog       import *
+from DinoPacket    import *  # Packet schema and NR_* record fields
+from DinoPacketView import *  # Lazy packet access
+from DinoFramer    import *  # Serial stream framing
+from DinoProfiler  import *  # Loop instrumentation
+from DinoImport    import *  # Lazy import of pyserial
 
-try:
-   from serial     import *        # Serial communication
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - Serial interface not loaded.")
-
-
-# Field names within the New Shepard packet received at 10Hz.
-# From: NR-BLUE-W0001 (RevA) Feather Frame Payload User's Guide (002).pdf
-NR_FLIGHT_STATE    = 0     # Current flight state as a single ASCII char. 
-NR_EXP_TIME        = 1     # Current experiment time in seconds as decimal 
-                           # number with 2 digits following the decimal point.
-NR_ALTITUDE        = 2     # Current vehicle altitude above ground level in feet as a 
-                           # decimal number with 6 digits following the decimal point.
-NR_VELOCITY_X      = 3     # Current vehicle velocity in feet per second along the three          
-NR_VELOCITY_Y      = 4     # axis of the capsule as a decimal number with 6 digits following
-NR_VELOCITY_Z      = 5     # the decimal point.
-NR_ACCELERATION    = 6     # Magnitude of the current vehicle acceleration in feet per  
-                           # second squared as a decimal number with 6 digits 
-                           # following the decimal point.
-NR_RESERVED_1      = 7     # Reserved for future use. Expect "0.000000".
-NR_RESERVED_2      = 8 
-NR_ATTITUDE_X      = 9     # The current vehicle attitude in radians about the three axis 
-NR_ATTITUDE_Y      = 10    # as a decimal number with 6 digits following the decimal point.
-NR_ATTITUDE_Z      = 11  
-NR_ANG_VEL_X       = 12    # Current vehicle angular velocity in radians per second
-NR_ANG_VEL_Y       = 13    # about the three axis as a decimal number with 6 digits following
-NR_ANG_VEL_Z       = 14    # the decimal point.   
-# Warnings triggered for different phases of the flight. 
-# Single digit value set to 1 when the warning is TRUE and 0 when FALSE.
-NR_WARNING_LIFTOFF = 15    # Triggered on main engine ignition
-NR_WARNING_RCS     = 16    # Triggered during microgravity phase of flight to notify
-NR_WARNING_ESCAPE  = 17    # Triggered during the escape motor ignition process
-NR_WARNING_CHUTE   = 18    # Triggered shortly before drogue chute deployments
-NR_WARNING_LANDING = 19    # Triggered by altitude shortly before the capsule touches down
-NR_WARNING_FAULT   = 20    # Triggered in anticipation of an abnormally hard landing
-NR_SIZE            = 21  
 
 # Possible flight states sent by New Shepard vehicle to the payload.
 # From: NR-BLUE-W0001 (RevA) Feather Frame Payload User's Guide (002).pdf
@@ -75,7 +46,7 @@ NR_STATE_COAST_START = 6   # F  This event indicates the beginning of the cleane
                        
 NR_STATE_APOGEE = 7        # G  This state indicates that drogue parachutes have 
                            #    deployed and the capsule is in its final descent.
-NR_STATE_COST_END    = 8   # H  This event indicates the end of microgravity operations onboard the capsule, as 
+NR_STATE_COAST_END   = 8   # H  This event indicates the end of microgravity operations onboard the capsule, as 
                            #    it begins to experience atmospheric acceleration. Most experiments cease logging 
                            #    data at this time.
 NR_STATE_DROGUE_CHUTES = 9 # I  This event indicates that the drogue parachutes have been commanded to deploy. 
@@ -95,32 +66,70 @@ NR_STATE_LETTERS = "@ABCDEFGHIJKLM"
 
 
 class DinoSerial(object):
+   """
+   Class DinoSerial - Receive packets from the vehicle.
 
-   __instance = None
-   
+   A dedicated thread reads the serial port, splits the stream into
+   packets with DinoFramer and wraps each one in a DinoPacketView. Packets
+   are made available in two ways:
+      1) A bounded queue with every packet received, in order. 
+         If the consumer falls behind, the oldest packet is dropped 
+         such that the queue always holds the most recent data.
+      2) A snapshot of the latest packet. The reference is replaced 
+         in a single assignment, so readers never see a partial packet.
 
+   The main loop therefore never blocks on serial reads or timeouts.
+   The descriptor returned by fileno() becomes readable whenever packets 
+   are queued, such that the main loop can wait for packets with select()
+   alongside its own deadlines.
+   """
 
+   __instance = None
 
-   """
-   PORT_NAME = '/dev/ttyAMA0'
+   # Serial port settings.
+   # From: NR-BLUE-W0001 (RevA) Feather Frame Payload User's Guide (002).pdf
    BAUD_RATE = 115200
-   PARITY    = serial.PARITY_NONE
-   STOP_BITS = serial.STOPBITS_ONE
-   BYTE_SIZE = serial.EIGHTBITS
-   TIMEOUT   = 0.1 # 10 Hz packets 
-   """
+   PARITY    = 'N'   # serial.PARITY_NONE
+   STOP_BITS = 1     # serial.STOPBITS_ONE
+   BYTE_SIZE = 8     # serial.EIGHTBITS
+   TIMEOUT   = 0.1   # 10 Hz packets 
    
    # Maximum number of bytes/characters before a sync byte. 
    # If this is observed, then we have a communication problem. 
    MAX_MSG_LENGTH = 200
+
+   # Number of packets kept in the queue (5sec at 10Hz).
+   QUEUE_SIZE = 50
+
+   # Character sent to the HAB pi3 to start the transmissions.
+   HAB_START_CHAR = b"$"
+
+   # Time in seconds before re-opening the port after an error.
+   RETRY_PERIOD = 1.0
    
 
    """ Singleton instance. """
-   def __new__(cls, portName):
+   def __new__(cls, portName, layout=PACKET_NFF):
       if(DinoSerial.__instance is None):
          DinoSerial.__instance = object.__new__(cls)
+         DinoSerial.__portName   = portName
+         DinoSerial.__layout     = layout
          DinoSerial.__serialPort = None
-         DinoSerial.__data = [None] * NR_SIZE
+         DinoSerial.__thread     = None
+         DinoSerial.__latest     = None
+         DinoSerial.__framer     = DinoFramer(NR_STATE_LETTERS, layout.syncOffset, DinoSerial.MAX_MSG_LENGTH)
+         DinoSerial.__queue      = queue.Queue(DinoSerial.QUEUE_SIZE)
+         DinoSerial.__data       = layout.newRecord()
+
+         # Pipe used to wake up consumers waiting with select().
+         DinoSerial.__notifyRead, DinoSerial.__notifyWrite = os.pipe()
+         os.set_blocking(DinoSerial.__notifyRead, False)
+         os.set_blocking(DinoSerial.__notifyWrite, False)
+
+         # Counters for packets that did not reach the consumer.
+         DinoSerial.__numDropped   = 0   # Malformed packets
+         DinoSerial.__numOverflows = 0   # Discarded because the queue was full
+         DinoSerial.__numErrors    = 0   # Serial port errors
 
          # Create lock object to protect shared resources.
          try:
@@ -139,6 +148,14 @@ class DinoSerial(object):
             
       return DinoSerial.__instance
 
+
+   def __del__(self):
+      """
+      Destructor that stops the reading thread.
+      """
+      self.stopReading()
+
+
    def startReading(self, habFlight=False):
       """
       Start reading serial data. 
@@ -151,10 +168,68 @@ class DinoSerial(object):
       ----------
       habFlight : bool
          False for HAB flights only. 
+
+      Returns
+      -------
+      bool
+         True if the port was opened and the thread was started. 
+         False if it was already running or the port could not be opened
+         (in which case the thread keeps trying to open it).
       """
-      
-      if(habFlight == True):
-         pass
+      if(self.isReading() == True):
+         return False
+
+      # If the port cannot be opened, the thread keeps retrying.
+      isOpen = self.__openSerialPort()
+
+      if((habFlight == True) and (isOpen == True)):
+         try:
+            self.__serialPort.write(self.HAB_START_CHAR)
+         except:
+            DinoLog.logMsg("ERROR - Could not start HAB transmissions.")
+
+      # Start thread.
+      try:
+         self.__stop.clear()
+         self.__thread = Thread(target=self.__readSerialThread, args=(self.__stop,))
+         self.__thread.daemon = True
+         self.__thread.start()
+         status = isOpen
+      except:
+         DinoLog.logMsg("ERROR - Could not start serial thread.")
+         status = False
+      return status
+
+
+   def stopReading(self):
+      """
+      Stop the reading thread and close the serial port.
+
+      Return
+      ------
+      bool
+         True if the thread was stopped or was not running.
+      """
+      self.__stop.set()
+      status = True
+      if(self.__thread is not None):
+         try:
+            self.__thread.join()
+            self.__thread = None
+         except:
+            DinoLog.logMsg("ERROR - Could not stop serial thread.")
+            status = False
+      # The port is closed even if the thread did not start.
+      self.__closeSerialPort()
+      return status
+
+
+   def isReading(self):
+      """
+      Return True if the reading thread is active.
+      """
+      return ((self.__thread is not None) and (self.__thread.is_alive() == True))
+
       
    def __openSerialPort(self):
       """
@@ -167,9 +242,10 @@ class DinoSerial(object):
       """
       # Serial port settings. 
       # From: NR-BLUE-W0001 (RevA) Feather Frame Payload User's Guide (002).pdf
+      serial = DinoImport.load("serial", "Serial interface")
       try:
          self.__serialPort = serial.Serial(
-            port        = self.PORT_NAME,
+            port        = self.__portName,
             baudrate    = self.BAUD_RATE,
             parity      = self.PARITY,
             stopbits    = self.STOP_BITS,
@@ -179,67 +255,234 @@ class DinoSerial(object):
       except:
          self.__serialPort = None
          DinoLog.logMsg("ERROR - Could not open serial port.")
-      
+      return (self.__serialPort is not None)
+
+
+   def fileno(self):
+      """
+      Return a file descriptor that is readable while packets may be 
+      waiting in the queue. Used to wait for packets with select() or 
+      poll(). The descriptor is cleared by getPackets().
+
+      Returns
+      -------
+      int
+         File descriptor.
+      """
+      return self.__notifyRead
+
+
+   def getPacket(self, timeout=None):
+      """
+      Return the oldest packet in the queue.
+
+      Parameters
+      ----------
+      timeout : float
+         Maximum time in seconds to wait for a packet. 
+         None to wait until a packet is received.
+
+      Returns
+      -------
+      DinoPacketView
+         Oldest packet received or None if there was none before the timeout.
+      """
+      try:
+         return self.__queue.get(timeout=timeout)
+      except queue.Empty:
+         return None
+
+
+   def getPackets(self, timeout=0):
+      """
+      Return all packets in the queue.
+
+      Parameters
+      ----------
+      timeout : float
+         Maximum time in seconds to wait for the first packet. 
+
+      Returns
+      -------
+      list
+         Packets (DinoPacketView) in the order received. May be empty.
+      """
+      # Clear the notification before draining the queue, such that
+      # a packet queued after this point raises a new notification.
+      try:
+         while(len(os.read(self.__notifyRead, 64)) == 64):
+            pass
+      except BlockingIOError:
+         pass
+
+      packets = []
+      packet  = self.getPacket(timeout) if (timeout > 0) else None
+      while(True):
+         if(packet is not None):
+            packets.append(packet)
+         try:
+            packet = self.__queue.get_nowait()
+         except queue.Empty:
+            break
+      return packets
+
+
+   def getLatestPacket(self):
+      """
+      Return the most recent packet received regardless of the queue.
+
+      Returns
+      -------
+      DinoPacketView
+         Latest packet or None if nothing was received yet.
+      """
+      return self.__latest
+
+
    def readData(self):
-      self.__data[NR_FLIGHT_STATE]    = "@"
-      self.__data[NR_EXP_TIME]        = DinoTime.getMET()
-      self.__data[NR_ALTITUDE]        = 0.0
-      self.__data[NR_VELOCITY_X]      = 0.0      
-      self.__data[NR_VELOCITY_Y]      = 0.0     
-      self.__data[NR_VELOCITY_Z]      = 0.0      
-      self.__data[NR_ACCELERATION]    = 0.0      
-      self.__data[NR_RESERVED_1]      = 0.0      
-      self.__data[NR_RESERVED_2]      = 0.0     
-      self.__data[NR_ATTITUDE_X]      = 0.0     
-      self.__data[NR_ATTITUDE_Y]      = 0.0      
-      self.__data[NR_ATTITUDE_Z]      = 0.0      
-      self.__data[NR_ANG_VEL_X]       = 0.0      
-      self.__data[NR_ANG_VEL_Y]       = 0.0      
-      self.__data[NR_ANG_VEL_Z]       = 0.0      
-      self.__data[NR_WARNING_LIFTOFF] = 0     
-      self.__data[NR_WARNING_RCS]     = 0     
-      self.__data[NR_WARNING_ESCAPE]  = 0     
-      self.__data[NR_WARNING_CHUTE]   = 0     
-      self.__data[NR_WARNING_LANDING] = 0     
-      self.__data[NR_WARNING_FAULT]   = 0     
-      return self.__data
+      """
+      Return all fields in the latest packet received.
+
+      Returns
+      -------
+      list
+         List of NR_SIZE values indexed by the NR_* fields. 
+         Contains the layout defaults if nothing was received yet.
+      """
+      latest = self.__latest
+      self.__copyLock.acquire()
+      if(latest is not None):
+         latest.toRecord(self.__data)
+      data = list(self.__data)
+      self.__copyLock.release()
+      return data
+
+
+   def getStats(self):
+      """
+      Return counters for the data received.
+
+      Returns
+      -------
+      dict
+         Framer counters ('bytes', 'packets', 'resyncs', 'discarded') plus
+         'dropped' malformed packets, 'overflows' from the queue, 
+         'errors' reading the port and 'queued' packets not read yet.
+      """
+      stats = self.__framer.getStats()
+      stats['dropped']   = self.__numDropped
+      stats['overflows'] = self.__numOverflows
+      stats['errors']    = self.__numErrors
+      stats['queued']    = self.__queue.qsize()
+      return stats
 
       
    def __closeSerialPort(self):
-      pass
+      """
+      Close the serial port if it is opened.
+      """
+      try:
+         self.__serialPort.close()
+      except:
+         pass
+      self.__serialPort = None
       
    def __resetSerialPort(self):
       """
-      Flush serial port input buffer. 
+      Flush serial port input buffer and any partial packet.
       """
-      self.__serialPort.reset_input_buffer()
-      
+      try:
+         self.__serialPort.reset_input_buffer()
+      except:
+         pass
+      self.__framer.reset()
+
 
-   def __findSyncByte(self):
+   def __queuePacket(self, packet):
       """
-      Find the sync byte (a character A-J or @ that represents 
-      the state of the vehicle/hab and return it. Special cases:
-      - If this character is not found after MAX_MSG_LENGTH bytes, 
-        then reset the serial port and start again. 
-      - If there is no data available by the TIMEOUT period, 
-        then return None.
-      
-      Returns
-      -------
-      str 
-         Sync character of None if it failed to read a value.
-      """
-      countChars = 0
-      syncByte = serialPort.read()
-      while((syncByte is not None) and (syncByte not in HAB_STATES)):
-         countChars = countChars + 1
-         if(countChars > MAX_MSG_LENGTH):
-            countChars = 0
-            self.__resetSerialPort()
-         syncByte   = serialPort.read()
-      return syncByte
-      
+      Publish a packet as the latest snapshot and add it to the queue.
+      If the queue is full, discard the oldest packet.
+
+      Parameters
+      ----------
+      packet : DinoPacketView
+         Packet received.
+      """
+      self.__latest = packet
+      while(True):
+         try:
+            self.__queue.put_nowait(packet)
+            return
+         except queue.Full:
+            try:
+               self.__queue.get_nowait()
+               self.__numOverflows = self.__numOverflows + 1
+            except queue.Empty:
+               pass
       
-   def __readSerialThread():
-      pass
       
+   def __readSerialThread(self, stopEvent):
+      """
+      Thread to read the serial data. 
+
+      Block until at least one byte is available (or the port timeout 
+      expires), then read everything waiting in the port and pass it 
+      through the framer. Valid packets are queued and malformed 
+      packets are counted and discarded. The experiment time of the 
+      vehicle in the last packet is used to estimate the vehicle clock 
+      (see DinoTime.syncVehicle()).
+
+      If the port fails, close it and try to reopen it every RETRY_PERIOD
+      until the stopEvent flag is set through stopReading().
+
+      Parameter
+      ---------
+      stopEvent : threading.Event
+         Flag to stop this thread from the main application.
+      """
+      layout = self.__layout
+      while(stopEvent.is_set() == False):
+         if(self.__serialPort is None):
+            if(DinoTime.wait(stopEvent, self.RETRY_PERIOD) == False):
+               self.__openSerialPort()
+            continue
+
+         try:
+            data = self.__serialPort.read(1)
+            start = DinoProfiler.start()
+            waiting = self.__serialPort.in_waiting
+            if(waiting > 0):
+               data = data + self.__serialPort.read(waiting)
+         except:
+            self.__numErrors = self.__numErrors + 1
+            DinoLog.logThrottled("ERROR - Could not read serial port.")
+            self.__closeSerialPort()
+            self.__framer.reset()
+            continue
+
+         start = DinoProfiler.stop(PHASE_SERIAL_READ, start)
+         recvMet = DinoTime.getMET()
+         numQueued = 0
+         view = None
+         for packet in self.__framer.feed(data):
+            view = DinoPacketView(layout, packet)
+            if(view.isValid() == True):
+               self.__queuePacket(view)
+               numQueued = numQueued + 1
+            else:
+               self.__numDropped = self.__numDropped + 1
+
+         # Only the last packet ended when the data was received. 
+         # Packets before it in the same read arrived earlier.
+         if((numQueued > 0) and (view.isValid() == True)):
+            vehicleTime = view.get(NR_EXP_TIME)
+            if(vehicleTime is not None):
+               DinoTime.syncVehicle(vehicleTime, recvMet)
+
+         # Wake up consumers waiting on fileno().
+         if(numQueued > 0):
+            try:
+               os.write(self.__notifyWrite, b"!")
+            except BlockingIOError:
+               pass
+         DinoProfiler.stop(PHASE_SERIAL_FRAME, start)
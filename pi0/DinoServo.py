@@ -1,20 +1,14 @@
-from threading     import Thread # Thread to record continuously
 from threading     import RLock  # Note re-entrant lock
-from threading     import Event  # Events for communicating within threads
 
 from DinoConstants import *
 from DinoTime      import *
 from DinoLog       import *
+from DinoScheduler import *  # Periodic agitation
+from DinoImport    import *  # Lazy import of gpiozero
+from DinoLogger    import *  # Leveled console/debug messages
 
-try:
-   from gpiozero   import Servo
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - Servo library not loaded.")
-
-try:
-   from gpiozero   import LED
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - LED library not loaded.")
+# Messages of this module (see DinoLogger).
+_LOGGER = DinoLogger.get("DinoServo")
 
 class DinoServo(object):
 
@@ -30,32 +24,21 @@ class DinoServo(object):
    def __new__(cls, servoPin):
       if(DinoServo.__instance is None):
          DinoServo.__instance = object.__new__(cls)
-         DinoServo.__isAgitating = False
          DinoServo.__servo       = None
-         DinoServo.__thread      = None
+         DinoServo.__job         = None
          DinoServo.__lock        = None
-         DinoServo.__stop        = None
 
          # Create lock object to protect shared resources.
          try:
             DinoServo.__lock = RLock()
          except:
-            DinoLog.logMsg("ERROR - Could not create lock for servo thread.")
-
-         # Create event to notify servo thread when to stop.
-         # While this could have been done with a lock, the event 
-         # has built in functions for checking if a flag is set.
-         try:
-            DinoServo.__stop = Event()
-            DinoServo.__stop.set()
-         except:
-            DinoLog.logMsg("ERROR - Could not create event for servo.")
+            DinoLog.logMsg("ERROR - Could not create lock for servo job.")
 
          # Create a Servo object.
          # Change configuration parameters as needed for the
-
+         gpiozero = DinoImport.load("gpiozero", "Servo library")
          try:
-            DinoServo.__servo = Servo(servoPin, \
+            DinoServo.__servo = gpiozero.Servo(servoPin, \
                initial_value   = 0, \
                min_pulse_width = 1/1000, \
                max_pulse_width = 2/1000, \
@@ -69,15 +52,15 @@ class DinoServo(object):
 
    def isAgitating(self):
       """
-      Return True if thread is active and the servo is agitating.
+      Return True if the agitation job is scheduled or running.
 
       Return
       ------
       bool
-         True if the thread to control the servo is running.
+         True if the job to control the servo is active.
       """
       self.__lock.acquire()
-      isAgitating = self.__isAgitating
+      isAgitating = (self.__job is not None) and (self.__job.isActive() == True)
       self.__lock.release()
       return isAgitating
 
@@ -95,9 +78,9 @@ class DinoServo(object):
       -------
       bool
          True if it successfully started the agitations.
-         False if it was already running the thread.
+         False if the agitation was already in progress.
       """
-      # Ensure there is no servo agitation thread in progress.
+      # Ensure there is no servo agitation in progress.
       if(self.isAgitating() == True):
          return False
       
@@ -106,19 +89,15 @@ class DinoServo(object):
          DinoLog.logMsg("ERROR - Invalid servo agitation period=[" + str(period) + "].")
          return False
 
-      # Record settings and start thread
+      # Record settings and schedule the first agitation now.
+      # The job ends if the servo fails to move.
       self.__period  = float(period)
-      self.__stop.set()
-   
-      # Start thread.
-      try:
-         self.__stop.clear()
-         self.__thread = Thread(target=self.__run, args=(self.__stop, self.__lock, period,))
-         self.__thread.start()
-         status = (self.__thread is not None)
-      except:
-         DinoLog.logMsg("ERROR - Could not start servo agitation thread.")
-         status = False
+      self.__lock.acquire()
+      self.__job = DinoScheduler().schedule("servo", self.agitate, self.__period)
+      status = (self.__job is not None)
+      self.__lock.release()
+      if(status == False):
+         DinoLog.logMsg("ERROR - Could not start servo agitation.")
       return status
 
    def hardStopServo(self):
@@ -134,84 +113,55 @@ class DinoServo(object):
     except:
        DinoLog.logMsg("ERROR - Could not restart servo motor")
 
-   def stopServo(self):
+   def stopServo(self, timeout=None):
       """ 
-      Stop thread to agitate the servo. 
+      Stop the agitation job. 
+
+      Parameters
+      ----------
+      timeout : float
+         Maximum time in seconds to wait for an agitation in progress
+         (None waits until done, 0 only cancels the job).
 
       Return
       ------
       bool
-         True if the agitation thread was stopped.
+         True if an agitation is still in progress.
       """
-      self.__stop.set()
-      try:
-         self.__thread.join()
-         self.__thread = None
-      except:
+      self.__lock.acquire()
+      job = self.__job
+      self.__lock.release()
+      if(job is None):
          return False
+      job.cancel(timeout)
       return self.isAgitating()
 
 
-   def __run(self, stopEvent, lock, period):
-      """ 
-      Thread for Servo. 
-
-      The thread runs once for a single agitation (for testing) or
-      continuosly for a stream of agitations separated by a known period. 
-      If run continuosuly, the application must call stopServo() to 
-      terminate the thread.
-
-      Exit the loop if an error is encountered when commanding the servo
-      or when the stopEvent flag is set through the stopServo() function.
-
-      Parameter
-      ---------
-      stopEvent : threading.Event
-         Flag to stop this thread from the main application.
-         Set by calling the function stopServo()
-      lock : threading.RLock
-         Re-entrant safe lock to edit self.__isAgitating variable.
-         This is set when the thread starts and cleared when the thread ends.
-         Used by the application to check whether the thread is started 
-         to agitate the dinos on a regular schedule.
-      period : float
-         Time in seconds between agitations.
+   def agitate(self):
       """
-      # Set protected flag to show thread has started
-      lock.acquire()
-      self.__isAgitating = True
-      lock.release()
-
-      # Run main loop for a single or continuous mode.
-      faultFound = False
-      while((stopEvent.isSet() == False) and (faultFound == False)):
-
-         try:
-            if(self.__servo.value is None):
-               DinoLog.logMsg("ERROR - Servo is uncontrolled.")
-               faultFound = True
-            elif(self.__servo.value > 0):
-               self.__servo.min()
-               print("Servo moved to min position.")
-               #DinoLog.logMsg("Servo moved to min position.")
-            else:
-               self.__servo.max()
-               print("Servo moved to max position.")
-               #DinoLog.logMsg("Servo moved to max position.")
-               
-         except:
-            DinoLog.logMsg("ERROR - Failed to move servo.")
-            faultFound = True
-
-         # Wait until it is time to agitate again.
-         # Unlike the Camera, the agitation period is very short and there is no risk
-         # of not saving data, so there is no risk if it gets abruptly terminated. 
-         time.sleep(period)
+      Move the servo once to the opposite end of its range.
 
-      # Clear protected flag to show thread has started
-      lock.acquire()
-      self.__isAgitating = False
-      lock.release()
-      stopEvent.set()
+      Used by the agitation job (see DinoScheduler) and by DinoAsyncMain,
+      which schedules each agitation as a task.
 
-   
+      Returns
+      -------
+      bool
+         True if the servo moved. False if it is uncontrolled or failed.
+      """
+      try:
+         if(self.__servo.value is None):
+            DinoLog.logMsg("ERROR - Servo is uncontrolled.")
+            return False
+         elif(self.__servo.value > 0):
+            self.__servo.min()
+            _LOGGER.debug("Servo moved to min position.")
+            #DinoLog.logMsg("Servo moved to min position.")
+         else:
+            self.__servo.max()
+            _LOGGER.debug("Servo moved to max position.")
+            #DinoLog.logMsg("Servo moved to max position.")
+      except:
+         DinoLog.logThrottled("ERROR - Failed to move servo.")
+         return False
+      return True
@@ -0,0 +1,160 @@
+import time
+import signal
+from   threading import Lock  # Single shutdown at a time
+
+from DinoTime   import *
+from DinoLog    import *
+from DinoLogger import *  # Leveled console/debug messages
+
+
+# Time allowed for the whole shutdown including syncing the log.
+# After NR_STATE_MISSION_END, there may be less than a second before
+# power is lost.
+SHUTDOWN_DEADLINE = 0.2 # Unit: sec
+
+# Messages of this module (see DinoLogger).
+_LOGGER = DinoLogger.get("DinoShutdown")
+
+
+class DinoShutdown(object):
+   """
+   Class DinoShutdown - Stop all components within a deadline.
+
+   Each component registers a stop function that signals its thread to
+   stop and waits at most a given time for it to finish. On run(), every
+   stop function is first called with a timeout of zero, such that all
+   components wind down at the same time, and then called again in order
+   with the time left until the deadline. The log is synced to the
+   storage (fsync) last.
+
+   Components that did not stop within the deadline are logged as errors
+   and returned to the caller. run() never waits past the deadline except
+   for the final fsync of the log.
+   """
+
+   def __init__(self, deadline=SHUTDOWN_DEADLINE):
+      """
+      Create the coordinator.
+
+      Parameters
+      ----------
+      deadline : float
+         Default time in seconds allowed for each shutdown.
+      """
+      self.__deadline   = deadline
+      self.__components = []
+      self.__lock       = Lock()
+
+
+   def register(self, name, stop):
+      """
+      Register a component to stop.
+
+      Parameters
+      ----------
+      name : str
+         Name used in the log (i.e. "camera").
+      stop : function
+         stop(timeout) signals the component and waits at most timeout
+         seconds for it to finish. Returns True once it is stopped.
+      """
+      self.__components.append((name, stop))
+
+
+   def run(self, reason, deadline=None):
+      """
+      Stop every component and sync the log within the deadline.
+
+      Parameters
+      ----------
+      reason : str
+         Cause of the shutdown for the log (i.e. "END_EXP" or "SIGTERM").
+      deadline : float
+         Time in seconds allowed. Defaults to the deadline of the coordinator.
+
+      Returns
+      -------
+      list
+         Name of each component that missed the deadline (empty if all
+         stopped in time). None if a shutdown was already in progress.
+      """
+      # A signal can arrive while a shutdown is in progress.
+      if(self.__lock.acquire(blocking=False) == False):
+         return None
+      try:
+         deadline = self.__deadline if (deadline is None) else deadline
+         start    = time.monotonic()
+         end      = start + deadline
+
+         # Signal all components at once, then wait for each of them.
+         status = {}
+         for (name, stop) in self.__components:
+            status[name] = self.__stop(name, stop, 0.0)
+         for (name, stop) in self.__components:
+            if(status[name] == False):
+               status[name] = self.__stop(name, stop, max(end - time.monotonic(), 0.0))
+
+         missed  = [name for (name, stop) in self.__components if (status[name] == False)]
+         elapsed = time.monotonic() - start
+         DinoLog.logMsg("SHUTDOWN reason=[" + reason + "] time=[" + '{0:.1f}'.format(elapsed * 1000) + \
+            "ms] deadline=[" + '{0:.0f}'.format(deadline * 1000) + "ms]")
+         for name in missed:
+            DinoLog.logMsg("ERROR - Shutdown component=[" + name + "] missed deadline=[" + \
+               '{0:.0f}'.format(deadline * 1000) + "ms].")
+
+         # Sync the log last with the time left.
+         if(DinoLog.sync(max(end - time.monotonic(), 0.0)) == False):
+            missed.append("log")
+            _LOGGER.error("Shutdown component=[log] missed deadline.")
+         return missed
+      finally:
+         self.__lock.release()
+
+
+   def installSignalHandler(self, callback=None, signum=signal.SIGTERM, loop=None):
+      """
+      Run the shutdown when the process receives a signal (i.e. SIGTERM).
+      Must be called from the main thread.
+
+      Parameters
+      ----------
+      callback : function
+         Called without arguments after the shutdown (i.e. to end the
+         main loop).
+      signum : int
+         Signal to handle.
+      loop : asyncio event loop
+         Run the handler from the event loop instead of interrupting
+         the main thread (see DinoAsyncMain).
+
+      Returns
+      -------
+      bool
+         True if the handler was installed.
+      """
+      def handler(num=signum, frame=None):
+         self.run(signal.Signals(num).name)
+         if(callback is not None):
+            callback()
+      try:
+         if(loop is None):
+            signal.signal(signum, handler)
+         else:
+            loop.add_signal_handler(signum, handler)
+      except:
+         DinoLog.logMsg("ERROR - Could not install handler for signal=[" + str(signum) + "].")
+         return False
+      return True
+
+
+   @staticmethod
+   def __stop(name, stop, timeout):
+      """
+      Call a stop function. A component that raises is considered stopped
+      since there is nothing left to wait for.
+      """
+      try:
+         return (stop(timeout) == True)
+      except:
+         DinoLog.logMsg("ERROR - Shutdown component=[" + name + "] failed.")
+         return True
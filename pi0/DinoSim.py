@@ -16,11 +16,11 @@ class DinoSim(DinoMain):
       for any fields that could not be read.
       """
       line = self.__fp.readline()
-      parts = line.split(CSV_SEP)
+      self.parse_serial_packet(line.strip().encode('utf-8'))
 
-      self._data[I_FLIGHT_STATE]    = parts[NR_FLIGHT_STATE]
-      self._data[I_ALTITUDE]        = float(parts[NR_ALTITUDE])
-      self._data[I_ACCELERATION]    = float(parts[NR_ACCELERATION])
+      self._data[I_FLIGHT_STATE]    = self._view.getState()
+      self._data[I_ALTITUDE]        = self._view.get(NR_ALTITUDE)
+      self._data[I_ACCELERATION]    = self._view.get(NR_ACCELERATION)
       self._data[I_LIGHT_RED]       = 0
       self._data[I_LIGHT_GREEN]     = 0
       self._data[I_LIGHT_BLUE]      = 0
@@ -1,6 +1,4 @@
-from threading     import Thread # Thread to record continuously
 from threading     import RLock  # Note re-entrant lock
-from threading     import Event  # Events for communicating within threads
 import time
 from DinoConstants import *
 from DinoTime      import *
@@ -8,20 +6,20 @@ from DinoLog       import *
 import sys
 import csv
 sys.path.append("../../DinoLambda/wrappers/python")
-from threading     import Thread # Thread to record continuously
-from threading     import RLock  # Note re-entrant lock
-from threading     import Event  # Events for communicating within threads
 
-from wrapper_python3 import *
-from wrapper_python3.core import *
-from wrapper_python3.device import *
-from wrapper_python3.color import *
+from DinoImport    import *  # Lazy import of the spectrometer wrappers
+from DinoCompress  import *  # Compress complete spectra
+from DinoLogger    import *  # Leveled console/debug messages
+from DinoScheduler import *  # Periodic captures
+
+# Spectrometer wrappers loaded into this module on first use.
+SPECTROMETER_MODULES = ("wrapper_python3", "wrapper_python3.core", \
+                        "wrapper_python3.device", "wrapper_python3.color")
+
+# Messages of this module (see DinoLogger).
+_LOGGER = DinoLogger.get("DinoSpectrometer")
 
 
-try:
-   pass   
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - Spectrometer interface not loaded.")
 class DinoSpectrometer(object):
    __instance = None
    # Constants for validating period between captures.
@@ -34,11 +32,9 @@ class DinoSpectrometer(object):
       #print"Create the Spectrometer Object")
       if(DinoSpectrometer.__instance is None):
          DinoSpectrometer.__instance = object.__new__(self)
-         DinoSpectrometer.__isCapturing = False
          DinoSpectrometer.__servo       = None
-         DinoSpectrometer.__thread      = None
+         DinoSpectrometer.__job         = None
          DinoSpectrometer.__lock        = None
-         DinoSpectrometer.__stop        = None
          # Create lock object to protect shared resources
          # between the spectrometer object and the main thread.
          # Note that these are separate such that they reduce
@@ -47,31 +43,22 @@ class DinoSpectrometer(object):
          try:
             DinoSpectrometer.__lock = RLock()
          except:
-            DinoLog.logMsg("ERROR - Could not create lock for the spectrometer thread.")
-
-         # Create event to notify capturing thread when to stop.
-         # While this could have been done with a lock, the event
-         # has built in functions for checking if a flag is set.
-         try:
-            DinoSpectrometer.__stop = Event()
-            DinoSpectrometer.__stop.set()
-         except:
-            DinoLog.logMsg("ERROR - Could not create event for Spectrometer.")
+            DinoLog.logMsg("ERROR - Could not create lock for the spectrometer job.")
       return DinoSpectrometer.__instance
 
 
    def __del__(self):
       """
-      Destructor that stops the active capturing and terminates the thread.
+      Destructor that stops the active capturing.
       """
       self.stopCapturing()
 
    def isCapturing(self):
       """
-      Return True if thread is active and Spectrometer is capturing.
+      Return True if the capture job is scheduled or running.
       """
       self.__lock.acquire()
-      isCapturing = self.__isCapturing
+      isCapturing = (self.__job is not None) and (self.__job.isActive() == True)
       self.__lock.release()
       return isCapturing
 
@@ -89,7 +76,7 @@ class DinoSpectrometer(object):
       -------
       bool
          True if it successfully started the spectrum capture.
-         False if it was already running the thread.
+         False if the captures were already in progress.
       """
       # Ensure there is no capture is in progress.
       if(self.isCapturing() == True):
@@ -101,43 +88,43 @@ class DinoSpectrometer(object):
          DinoLog.logMsg("ERROR - Invalid spectrometer period=[" + str(period) + "].")
          return False
 
-      # Capture settings and start thread
+      # Capture settings and schedule the first capture now.
+      # The job ends if a capture fails.
       self.__period  = float(period)
-      self.__stop.set()
-    
-
-      # Start thread.
-      try:
-         self.__stop.clear()
-         self.__thread = Thread(target=self.__run, args=(self.__stop, self.__lock, self.__period,))
-         self.__thread.start()
-         status = (self.__thread is not None)
-      except:
-         DinoLog.logMsg("ERROR - Could not start Spectrometer thread.")
-         status = False
+      self.__lock.acquire()
+      self.__job = DinoScheduler().schedule("spectrometer", self.captureOnce, self.__period)
+      status = (self.__job is not None)
+      self.__lock.release()
+      if(status == False):
+         DinoLog.logMsg("ERROR - Could not start Spectrometer captures.")
       return status
 
-   def stopCapturing(self):
+   def stopCapturing(self, timeout=None):
       """
-      Stop spectrometer capturing and terminate thread.
-      Terminates the ongoing capture even if it has not finished
-      the desired spectrum capture. This will also stop terminate
-      continuous capture in order to end the thread.
+      Stop spectrometer capturing by cancelling the capture job.
+      A capture in progress is not interrupted.
+      Parameters
+      ----------
+      timeout : float
+         Maximum time in seconds to wait for the current capture to be
+         saved (None waits until done, 0 only cancels the job).
       Return
       ------
       bool
-         True if the capture was stopped or there was nothing running.
+         True if a capture is still in progress.
       """
-      self.__stop.set()
-      try:
-         self.__thread.join()
-         self.__thread = None
-      except:
+      self.__lock.acquire()
+      job = self.__job
+      self.__lock.release()
+      if(job is None):
          return False
+      job.cancel(timeout)
       return self.isCapturing()
 
    def initialize(object):
-      print("initializing DinoSpectrometer......")
+      _LOGGER.info("initializing DinoSpectrometer......")
+      for name in SPECTROMETER_MODULES:
+         DinoImport.load(name, "Spectrometer interface", globals())
       initialize("/home/pi/DinoLambda/Libs/libCrystalBase_RPi.so")
       object.pSpecCore      = initialize_core_api("/home/pi/DinoLambda/Libs/libCrystalCore_RPi.so")
       object.pSpecDevice    = initialize_device_api("/home/pi/DinoLambda/Libs/libCrystalPort_RPi.so")
@@ -203,7 +190,7 @@ class DinoSpectrometer(object):
                       writer.writerow(line)
                   csv_file.close()
                else:
-                  localtime = time.localtime(time.time())
+                  localtime = time.localtime(DinoTime.getTime())
                   completetime = str(localtime.tm_year) + \
                                  str(localtime.tm_mon) + \
                                  str(localtime.tm_mday) + \
@@ -225,70 +212,34 @@ class DinoSpectrometer(object):
                      for line in data:
                         filewriter.writerow(line)
                   csvfile.close()
+                  # Each capture has its own file, which is now complete.
+                  if(object.fileName == ""):
+                     DinoCompressor.submit(fileName)
          else:
-            print ("**********************************************************************")
-            print ("[PrismError] Sensor Calibration File Not Present in Config Foler. Please copy Sensor Calibration File in Config file and execute again.")
-            print ("**********************************************************************")
+            _LOGGER.error("[PrismError] Sensor Calibration File Not Present in Config Foler. Please copy Sensor Calibration File in Config file and execute again.")
       else:
-            print ("**********************************************************************")
-            print ("[PrismError]Device Not Connected. Please connect Device and try again.")
-            print ("**********************************************************************")
+            _LOGGER.error("[PrismError]Device Not Connected. Please connect Device and try again.")
       close_color_api(object.pSpecCore)
       close_core_object(object.pSpecCore)
       disconnect_device(object.pSpecDevice)
       DinoLog.logMsg("Success - Captured Spectrum.")
-      print("Captured Spectrum")
-   def __run(self, stopEvent, lock, period):
+      _LOGGER.debug("Captured Spectrum")
+   def captureOnce(self):
       """
-      Thread for Spectrometer.
-
-      The thread runs once for a single capture (for testing) or
-      continuosly for a stream of captures separated by a known period.
-      If run continuosuly, the application must call stopCapture() to
-      terminate the thread.
+      Connect to the spectrometer and capture a single spectrum.
 
-      Exit the loop if an error is encountered when commanding the spectrometer
-      or when the stopEvent flag is set through the stopCapture() function.
+      Used by the capture job (see DinoScheduler) and by DinoAsyncMain,
+      which schedules each capture as a task.
 
-      Parameter
-      ---------
-      stopEvent : threading.Event
-         Flag to stop this thread from the main application.
-         Set by calling the function stopCapture()
-      lock : threading.RLock
-         Re-entrant safe lock to edit self.__isCapturing variable.
-         This is set when the thread starts and cleared when the thread ends.
-         Used by the application to check whether the thread is started
-         to capture the spectrum of light from the dinos on a regular schedule.
-      period : float
-         Time in seconds between spectrum captures.
+      Returns
+      -------
+      bool
+         True if the capture completed. False otherwise.
       """
-      # Set protected flag to show thread has started
-      print("Capturing spectrum")
-
-     # Set protected flag to show thread has started
-      lock.acquire()
-      self.__isCapturing = True
-      lock.release()
-
-      # Run main loop for a single or continuous mode.
-      faultFound = False
-      while((stopEvent.isSet() == False) and (faultFound == False)):
-
-         try:
-            self.initialize()
-            self.captureSpectrum()
-         except:
-            DinoLog.logMsg("ERROR - Failed to capture spectrum.")
-            faultFound = True
-         # Wait until it is time to capture again.
-         print("Sleep until period")
-         time.sleep(period)
-         print("Capture Period Expired")
-      # Clear protected flag to show thread has started
-      lock.acquire()
-      self.__isCapturing = False
-      lock.release()
-      stopEvent.set()
-      print("Stopping")
-
+      try:
+         self.initialize()
+         self.captureSpectrum()
+      except:
+         DinoLog.logThrottled("ERROR - Failed to capture spectrum.")
+         return False
+      return True
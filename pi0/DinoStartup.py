@@ -0,0 +1,195 @@
+import time
+from   concurrent.futures import ThreadPoolExecutor
+from   threading          import RLock  # Note re-entrant lock
+
+from DinoTime import *
+from DinoLog  import *
+
+
+# Maximum number of devices initialized at the same time.
+STARTUP_WORKERS = 6
+
+# Marker for devices not retrieved from their future yet.
+NOT_READY = object()
+
+
+class DinoStartup(object):
+   """
+   Class DinoStartup - Initialize devices concurrently.
+
+   Most of the cold start time is spent waiting on hardware: loading the
+   spectrometer libraries and connecting to it, opening the camera, etc.
+   These devices do not depend on each other, so each one is created on
+   a thread pool as soon as start() is called. The application then calls
+   get() for a device the first time it needs it, which only blocks if
+   that device is not ready yet. This allows the main loop to start as
+   soon as the devices it needs first are available while the slower
+   ones finish in the background.
+
+   Devices that are not needed until later in the flight can be deferred
+   with defer() instead. They are only created on the first get(), or 
+   earlier if the application calls prewarm() (i.e. at liftoff) such
+   that they are ready by the time they are needed.
+
+   The time each device takes to initialize is logged and available
+   through getInitTimes().
+   """
+
+   def __init__(self, numWorkers=STARTUP_WORKERS):
+      """
+      Create the thread pool for initializing devices.
+
+      Parameters
+      ----------
+      numWorkers : int
+         Maximum number of devices initialized at the same time.
+      """
+      self.__executor  = ThreadPoolExecutor(max_workers=numWorkers)
+      self.__futures   = {}
+      self.__deferred  = {}
+      self.__devices   = {}
+      self.__initTimes = {}
+      self.__lock      = RLock() # Devices are retrieved from several threads.
+      self.__lastReady = 0.0
+      self.__startTime = time.perf_counter()
+
+
+   def start(self, name, factory):
+      """
+      Start initializing a device in the background.
+
+      Parameters
+      ----------
+      name : str
+         Name used to retrieve the device with get().
+      factory : function
+         Function without arguments that creates and returns the device.
+      """
+      with self.__lock:
+         try:
+            self.__futures[name] = self.__executor.submit(self.__init, name, factory)
+         except RuntimeError:
+            # Thread pool already released by waitAll().
+            DinoLog.logMsg("ERROR - Could not initialize device=[" + name + "] after startup.")
+
+
+   def defer(self, name, factory):
+      """
+      Register a device that is only initialized on its first get() 
+      or when prewarm() is called.
+
+      Parameters
+      ----------
+      name : str
+         Name used to retrieve the device with get().
+      factory : function
+         Function without arguments that creates and returns the device.
+      """
+      with self.__lock:
+         self.__deferred[name] = factory
+
+
+   def prewarm(self, name):
+      """
+      Start initializing a deferred device in the background.
+      Does nothing if it was already started.
+
+      Parameters
+      ----------
+      name : str
+         Name given to defer().
+      """
+      with self.__lock:
+         factory = self.__deferred.pop(name, None)
+         if(factory is not None):
+            self.start(name, factory)
+
+
+   def get(self, name):
+      """
+      Return a device, waiting until it is initialized if needed.
+
+      Parameters
+      ----------
+      name : str
+         Name given to start().
+
+      Returns
+      -------
+      object
+         Device returned by the factory. None if the factory failed, the
+         name is unknown or a deferred device is first used after waitAll().
+      """
+      with self.__lock:
+         device = self.__devices.get(name, NOT_READY)
+         if(device is not NOT_READY):
+            return device
+         if((name not in self.__futures) and (name not in self.__deferred)):
+            DinoLog.logMsg("ERROR - Unknown device=[" + name + "].")
+            return None
+         self.prewarm(name)
+         future = self.__futures.get(name)
+         if(future is None):
+            self.__devices[name] = None
+            return None
+
+      # Wait without the lock such that other devices can be retrieved.
+      device = future.result()
+      with self.__lock:
+         self.__devices[name] = device
+      return device
+
+
+   def isReady(self, name):
+      """
+      Return True if a device finished its initialization.
+      """
+      future = self.__futures.get(name)
+      return (future is not None) and future.done()
+
+
+   def waitAll(self):
+      """
+      Wait until all devices are initialized and release the thread pool.
+      Deferred devices that were never used are not created.
+
+      Returns
+      -------
+      float
+         Time in seconds from the creation of the orchestrator 
+         until the last device was ready.
+      """
+      self.__executor.shutdown(wait=True)
+      DinoLog.logMsg("All devices initialized in " + '{0:.3f}'.format(self.__lastReady) + "sec")
+      return self.__lastReady
+
+
+   def getInitTimes(self):
+      """
+      Return the time in seconds each device took to initialize
+      for the devices that are ready.
+
+      Returns
+      -------
+      dict
+         Time in seconds indexed by device name.
+      """
+      return dict(self.__initTimes)
+
+
+   def __init(self, name, factory):
+      """
+      Create a device and record how long it took (runs on the pool).
+      """
+      start = time.perf_counter()
+      try:
+         device = factory()
+      except:
+         DinoLog.logMsg("ERROR - Could not initialize device=[" + name + "].")
+         device = None
+      end     = time.perf_counter()
+      elapsed = end - start
+      self.__initTimes[name] = elapsed
+      self.__lastReady = max(self.__lastReady, end - self.__startTime)
+      DinoLog.logMsg("Initialized device=[" + name + "] in " + '{0:.3f}'.format(elapsed) + "sec")
+      return device
@@ -0,0 +1,235 @@
+from DinoLog      import *
+from DinoSerial   import *  # NR_STATE_* flight states
+from DinoProfiler import *  # Loop instrumentation
+
+
+# Experiment states.
+DINO_STATE_INIT       = 0
+DINO_STATE_START_EXP  = 1
+DINO_STATE_EXPERIMENT = 2
+DINO_STATE_END_EXP    = 3
+DINO_STATE_FINISHED   = 4
+DINO_STATE_SIZE       = 5
+
+# Flight zones that drive the experiment states.
+ZONE_PRE_COAST = 0    # @ to E - Before microgravity.
+ZONE_COAST     = 1    # F to G - Microgravity.
+ZONE_DESCENT   = 2    # H to J - End of microgravity until touchdown.
+ZONE_LANDED    = 3    # K to M - Touchdown and safing.
+ZONE_SIZE      = 4
+
+# Flight zone for each byte value of the flight state letter.
+# None for bytes that are not a flight state.
+BYTE_TO_ZONE = [None] * 256
+for nrState, letter in enumerate(NR_STATE_LETTERS):
+   if(nrState < NR_STATE_COAST_START):
+      BYTE_TO_ZONE[ord(letter)] = ZONE_PRE_COAST
+   elif(nrState < NR_STATE_COAST_END):
+      BYTE_TO_ZONE[ord(letter)] = ZONE_COAST
+   elif(nrState < NR_STATE_TOUCHDOWN):
+      BYTE_TO_ZONE[ord(letter)] = ZONE_DESCENT
+   else:
+      BYTE_TO_ZONE[ord(letter)] = ZONE_LANDED
+BYTE_TO_ZONE = tuple(BYTE_TO_ZONE)
+
+# Experiment state transitions as (from state, flight zone, to state).
+# The experiment stays in its current state for any pair not listed.
+DINO_TRANSITIONS = [
+   (DINO_STATE_INIT,       ZONE_COAST,     DINO_STATE_START_EXP),
+   (DINO_STATE_INIT,       ZONE_DESCENT,   DINO_STATE_END_EXP),
+   (DINO_STATE_INIT,       ZONE_LANDED,    DINO_STATE_FINISHED),
+   (DINO_STATE_START_EXP,  ZONE_PRE_COAST, DINO_STATE_INIT),
+   (DINO_STATE_START_EXP,  ZONE_COAST,     DINO_STATE_EXPERIMENT),
+   (DINO_STATE_START_EXP,  ZONE_DESCENT,   DINO_STATE_END_EXP),
+   (DINO_STATE_START_EXP,  ZONE_LANDED,    DINO_STATE_FINISHED),
+   (DINO_STATE_EXPERIMENT, ZONE_PRE_COAST, DINO_STATE_INIT),
+   (DINO_STATE_EXPERIMENT, ZONE_DESCENT,   DINO_STATE_END_EXP),
+   (DINO_STATE_EXPERIMENT, ZONE_LANDED,    DINO_STATE_FINISHED),
+   (DINO_STATE_END_EXP,    ZONE_PRE_COAST, DINO_STATE_INIT),
+   (DINO_STATE_END_EXP,    ZONE_COAST,     DINO_STATE_EXPERIMENT),
+   (DINO_STATE_END_EXP,    ZONE_LANDED,    DINO_STATE_FINISHED),
+   ]
+
+# Phase name used to time transitions with DinoProfiler.
+PHASE_TRANSITION = "transition"
+
+
+class DinoStateMachine(object):
+   """
+   Class DinoStateMachine - Table driven experiment state machine.
+
+   Transitions are declared between experiment states and flight zones
+   (see DINO_TRANSITIONS). When the state machine is created, they are
+   expanded into one 256 entry table per experiment state, indexed by the
+   byte value of the flight state letter, such that evaluating a packet is
+   a single lookup without string searches or exceptions. Actions and
+   logging only run when the state changes. replay() evaluates a sequence
+   of flight states without a method call per packet.
+
+   Actions are registered on a transition (from state, to state) and
+   fire the first time that transition is taken. They do not fire again
+   if the experiment re-enters the same state later (i.e. after a
+   corrupted flight state). The time taken by the actions of each
+   transition is logged and kept for getTransitions().
+   """
+
+   def __init__(self, transitions=DINO_TRANSITIONS, initialState=DINO_STATE_INIT):
+      """
+      Create a state machine and generate its transition table.
+
+      Parameters
+      ----------
+      transitions : list
+         List of (from state, flight zone, to state) tuples.
+      initialState : int
+         Experiment state before any packet is received.
+      """
+      zones = [[state] * ZONE_SIZE for state in range(DINO_STATE_SIZE)]
+      for (fromState, zone, toState) in transitions:
+         zones[fromState][zone] = toState
+
+      # Next state for each (state, byte). None for invalid bytes.
+      self.__table = tuple( \
+         tuple((None if (zone is None) else zones[state][zone]) for zone in BYTE_TO_ZONE) \
+         for state in range(DINO_STATE_SIZE))
+      self.__state       = initialState
+      self.__prevState   = initialState
+      self.__actions     = {}
+      self.__transitions = []
+      self.__numInvalid  = 0
+
+
+   def registerAction(self, fromState, toState, action):
+      """
+      Register an action to run the first time a transition is taken.
+
+      Parameters
+      ----------
+      fromState : int
+         Experiment state before the transition (DINO_STATE_*).
+      toState : int
+         Experiment state after the transition (DINO_STATE_*).
+      action : function
+         Function called without arguments.
+      """
+      self.__actions.setdefault((fromState, toState), []).append(action)
+
+
+   def update(self, stateByte):
+      """
+      Update the experiment state with the flight state of a packet.
+
+      Parameters
+      ----------
+      stateByte : int
+         Byte value of the flight state letter (see DinoPacketView).
+
+      Returns
+      -------
+      int
+         Current experiment state (DINO_STATE_*).
+      """
+      prevState = self.__state
+      self.__prevState = prevState
+      state = self.__table[prevState][stateByte]
+      if(state == prevState):
+         return state
+      return self.__transition(prevState, state)
+
+
+   def replay(self, stateBytes):
+      """
+      Update the experiment state with a sequence of flight states 
+      (i.e. to replay a recorded flight).
+
+      Parameters
+      ----------
+      stateBytes : bytes
+         Byte value of the flight state letter of each packet.
+
+      Returns
+      -------
+      int
+         Current experiment state (DINO_STATE_*).
+      """
+      table = self.__table
+      state = self.__state
+      prevState = state
+      for stateByte in stateBytes:
+         prevState = state
+         nextState = table[state][stateByte]
+         if(nextState != state):
+            state = self.__transition(state, nextState)
+      self.__prevState = prevState
+      return state
+
+
+   def __transition(self, prevState, state):
+      """
+      Change state and run the actions registered for this transition
+      the first time it is taken. 
+
+      Parameters
+      ----------
+      prevState : int
+         Current experiment state.
+      state : int
+         Next experiment state or None for an invalid flight state.
+
+      Returns
+      -------
+      int
+         Current experiment state (DINO_STATE_*).
+      """
+      if(state is None):
+         self.__numInvalid = self.__numInvalid + 1
+         return prevState
+      self.__state = state
+
+      start = DinoProfiler.start()
+      for action in self.__actions.pop((prevState, state), ()):
+         try:
+            action()
+         except:
+            DinoLog.logMsg("ERROR - Failed action for transition from state=" + \
+               str(prevState) + " to state=" + str(state) + ".")
+      elapsed = (DinoProfiler.stop(PHASE_TRANSITION, start) - start) / 1000
+
+      self.__transitions.append((prevState, state, DinoTime.getMET(), elapsed))
+      DinoLog.logMsg("Transitioned to state=" + str(state) + \
+         " from state=" + str(prevState) + " in " + '{0:.0f}'.format(elapsed) + "us", flush=True)
+      return state
+
+
+   def getState(self):
+      """
+      Return the current experiment state (DINO_STATE_*).
+      """
+      return self.__state
+
+
+   def getPrevState(self):
+      """
+      Return the experiment state before the last update().
+      """
+      return self.__prevState
+
+
+   def getTransitions(self):
+      """
+      Return the transitions taken so far.
+
+      Returns
+      -------
+      list
+         List of (from state, to state, MET, usec) tuples, where usec is
+         the time taken by the actions of that transition.
+      """
+      return self.__transitions
+
+
+   def getNumInvalid(self):
+      """
+      Return the number of updates with a byte that is not a flight state.
+      """
+      return self.__numInvalid
@@ -12,11 +12,23 @@ import csv
 import glob
 import os.path
 
+from DinoConstants import *
+from DinoLogTailer import *
+
 #import matplotlib.pyplot as plt
 
 
 app = App(title="DinoLab Tester")
 
+# Seconds between polls of the log and minimum MET between data shown.
+MONITOR_POLL_PERIOD = 0.5
+MONITOR_DATA_PERIOD = 1.0
+# Number of events listed in the monitor.
+MONITOR_NUM_EVENTS  = 10
+
+tailer = None
+events = []
+
 
 
 def test_servo():
@@ -66,6 +78,33 @@ def test_calibrate():
 def test_simulation():
   print("Testing the Serial Port")
   os.system("sudo python3 test.py DinoSim")
+
+def show_records(records):
+  for (entryType, entryId, met, payload) in records:
+    if(entryType == DATA_ID):
+      monitor_data.value = ("MET " + '{0:.1f}'.format(met) + \
+        "  state " + str(payload[I_FLIGHT_STATE]) + \
+        "  altitude " + str(payload[I_ALTITUDE]) + \
+        "  temperature " + str(payload[I_TEMPERATURE]))
+    else:
+      events.append('{0:.2f}'.format(met) + "  " + payload)
+  del events[:-MONITOR_NUM_EVENTS]
+  monitor_events.value = "\n".join(events)
+
+def poll_log():
+  if(tailer is not None):
+    tailer.poll()
+
+def monitor_log():
+  global tailer
+  indexPath = DinoLogTailer.findLatest("Logs")
+  if(indexPath is None):
+    warn("Error", "No log found in Logs/")
+    return
+  print("Monitoring " + indexPath)
+  tailer = DinoLogTailer(indexPath)
+  tailer.subscribe(show_records, MONITOR_DATA_PERIOD)
+  monitor_log_name.value = os.path.basename(indexPath)
   
 if(os.path.isfile("calib_wavelength.txt")):  
  file = open("calib_wavelength.txt", "r")
@@ -82,6 +121,11 @@ button4 = PushButton(app, command=test_servo, text="Servo       ")
 button5 = PushButton(app, command=test_heater, text="Thermal Control")
 button6 = PushButton(app, command=test_serial, text="Serial         ")
 button7 = PushButton(app, command=test_simulation, text="Run Simulation")
+button8 = PushButton(app, command=monitor_log, text="Monitor Log")
+
+monitor_log_name = Text(app, text="")
+monitor_data     = Text(app, text="")
+monitor_events   = TextBox(app, text="", multiline=True, width=60, height=MONITOR_NUM_EVENTS)
 
 
 button1.width = 12
@@ -91,6 +135,7 @@ button4.width = 12
 button5.width = 12
 button6.width = 12
 button7.width = 12
+button8.width = 12
 
 
 button1.padding(5,5)
@@ -100,5 +145,7 @@ button4.padding(5,5)
 button5.padding(5,5)
 button6.padding(5,5)
 button7.padding(5,5)
+button8.padding(5,5)
 
+app.repeat(int(MONITOR_POLL_PERIOD * 1000), poll_log)
 app.display()
\ No newline at end of file
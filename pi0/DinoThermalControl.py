@@ -1,11 +1,7 @@
 from DinoConstants import *
 from DinoTime      import *
 from DinoLog       import *
-
-try:
-   from gpiozero   import LED        # GPIO interface
-except:
-   print(COLORS['TEST_FAIL'] + "ERROR" + COLORS['NORMAL'] + " - GPIO for heater/cooler not loaded.")
+from DinoImport    import *  # Lazy import of gpiozero (GPIO interface)
 
 
 # Indeces into __state array to store whether the units are on/off.
@@ -24,10 +20,11 @@ class DinoThermalControl(object):
       if(DinoThermalControl.__instance is None):
          DinoThermalControl.__instance = object.__new__(cls)
          DinoThermalControl.__state = [False, False]
+         gpiozero = DinoImport.load("gpiozero", "GPIO for heater/cooler")
 
          # Initialize heater control through GPIO pin. 
          try:
-            DinoThermalControl.__heater = LED(heaterPin)
+            DinoThermalControl.__heater = gpiozero.LED(heaterPin)
             DinoThermalControl.__heater.off()
          except:
             DinoLog.logMsg("ERROR - Could not initialize GPIO for heater.")
@@ -35,7 +32,7 @@ class DinoThermalControl(object):
 
          # Initialize cooler control through GPIO pin.
          try:
-            DinoThermalControl.__cooler = LED(coolerPin)
+            DinoThermalControl.__cooler = gpiozero.LED(coolerPin)
             DinoThermalControl.__cooler.off()
          except:
             DinoLog.logMsg("ERROR - Could not initialize GPIO for cooler.")
@@ -94,7 +91,7 @@ class DinoThermalControl(object):
             self.__heater.off()
          self.__state[STATE_HEATER] = self.__heater.is_lit
       except:
-         DinoLog.logMsg("ERROR - Heater set(" + str(turnOn) + ") failed.")
+         DinoLog.logThrottled("ERROR - Heater set(" + str(turnOn) + ") failed.")
          self.__state[STATE_HEATER] = False
       return self.__state[STATE_HEATER]
      
@@ -126,7 +123,7 @@ class DinoThermalControl(object):
          self.__state[STATE_COOLER] = self.__cooler.is_lit
       except:
          
-         DinoLog.logMsg("ERROR - Cooler set(" + str(turnOn) + ") failed.")
+         DinoLog.logThrottled("ERROR - Cooler set(" + str(turnOn) + ") failed.")
          self.__state[STATE_COOLER] = False
       return self.__state[STATE_COOLER]
       
@@ -1,4 +1,513 @@
 import time
+import math
+import heapq
+import select as _select # Not exported, such that it does not hide select.select()
+import threading
+from   collections import deque # Samples of the vehicle clock
+
+
+# Real time without progress after which a simulated clock assumes the
+# threads that are not sleeping are blocked (i.e. reading a serial port)
+# and advances to the next wake up time anyway.
+SIM_IDLE_PERIOD = 0.02 # Unit: sec
+
+# Vehicle clock discipline (see DinoClockDiscipline).
+DISCIPLINE_WINDOW       = 600  # Samples in the fit (60sec of packets at 10Hz).
+DISCIPLINE_MIN_SAMPLES  = 20   # Samples before estimating the drift.
+DISCIPLINE_MAX_RESIDUAL = 0.1  # Unit: sec. Samples further from the fit are rejected.
+DISCIPLINE_MAX_REJECTS  = 10   # Consecutive rejects that restart the fit (clock step).
+
+
+class DinoClock(object):
+   """
+   Class DinoClock - Real time clock used by DinoTime (default).
+
+   Every timestamp and every sleep of the application goes through the
+   clock of DinoTime, such that the clock can be replaced (see
+   DinoTime.setClock()). Each clock has a date/time (for timestamps) 
+   and a monotonic time in nanoseconds (for the MET):
+      1) DinoClock - Date/time of the system (time.time()).
+      2) DinoMonotonicClock - Immune to changes of the system time.
+      3) DinoSimClock - Virtual time that advances instantly on sleeps,
+         used to replay a flight faster than real time.
+   """
+
+   def getTime(self):
+      """
+      Return the date/time in seconds since the epoch.
+      """
+      return time.time()
+
+
+   def getMonotonicNs(self):
+      """
+      Return a time in nanoseconds that never jumps (arbitrary origin).
+      """
+      return time.monotonic_ns()
+
+
+   def sleep(self, seconds):
+      """
+      Suspend the calling thread.
+      """
+      time.sleep(seconds)
+
+
+   def wait(self, event, timeout):
+      """
+      Wait until an event is set or the timeout expires.
+
+      Returns
+      -------
+      bool
+         True if the event is set.
+      """
+      return event.wait(timeout)
+
+
+   def select(self, fds, timeout):
+      """
+      Wait until a file descriptor is ready to read or the timeout expires.
+
+      Returns
+      -------
+      list
+         File descriptors ready to read (empty on timeout).
+      """
+      return _select.select(fds, [], [], timeout)[0]
+
+
+   async def sleepAsync(self, seconds):
+      """
+      Suspend the calling coroutine.
+      """
+      import asyncio
+      await asyncio.sleep(seconds)
+
+
+class DinoMonotonicClock(DinoClock):
+   """
+   Class DinoMonotonicClock - Real time clock that does not jump when
+   the system time is changed (i.e. by NTP after a reboot). The date/time
+   is the system time when the clock was created plus the time elapsed.
+   """
+
+   def __init__(self):
+      self.__startTime      = time.time()
+      self.__startMonotonic = time.monotonic_ns()
+
+
+   def getTime(self):
+      """
+      Return the date/time in seconds since the epoch.
+      """
+      return self.__startTime + (time.monotonic_ns() - self.__startMonotonic) / 1e9
+
+
+class DinoSimClock(DinoClock):
+   """
+   Class DinoSimClock - Virtual clock for faster than real time runs.
+
+   Time only moves when the threads are idle. It then jumps to the 
+   earliest wake up time, such that the threads wake up in the same 
+   order as in real time but without waiting. A thread is idle while:
+      1) It sleeps through the clock (sleep(), wait() or select()).
+      2) It never used the clock and has existed for SIM_IDLE_PERIOD of
+         real time (i.e. the log writer blocked on its queue).
+   If no thread starts or stops sleeping for SIM_IDLE_PERIOD of real 
+   time (i.e. a thread blocked on a join()), the clock advances anyway.
+
+   Events and file descriptors are polled while sleeping, such that a
+   wait() or select() returns early like with the real clock.
+   """
+
+   def __init__(self, startTime=None, idlePeriod=SIM_IDLE_PERIOD):
+      """
+      Create a virtual clock.
+
+      Parameters
+      ----------
+      startTime : float
+         Initial date/time in seconds since the epoch. Defaults to now.
+      idlePeriod : float
+         Real time in seconds without progress before advancing anyway.
+      """
+      self.__startTime  = time.time() if (startTime is None) else float(startTime)
+      self.__ns         = 0   # Virtual time elapsed since startTime.
+      self.__idlePeriod = idlePeriod
+      self.__cond       = threading.Condition()
+      self.__wakeTimes  = []  # Heap with the wake up time (ns) of each sleeper.
+      self.__clockUsers = set() # Threads that used the clock.
+      self.__sleepers   = set() # Threads currently sleeping.
+      self.__others     = {}  # Real time when other threads were first seen.
+      self.__changes    = 0   # Number of times a thread started or stopped sleeping.
+
+
+   def getTime(self):
+      """
+      Return the virtual date/time in seconds since the epoch.
+      """
+      return self.__startTime + self.__ns / 1e9
+
+
+   def getMonotonicNs(self):
+      """
+      Return the virtual time in nanoseconds since the clock was created.
+      """
+      return self.__ns
+
+
+   def advance(self, seconds):
+      """
+      Move the virtual time forward (i.e. from a replay script).
+      """
+      with self.__cond:
+         self.__ns = self.__ns + self.__toNs(seconds)
+         self.__cond.notify_all()
+
+
+   def sleep(self, seconds):
+      """
+      Suspend the calling thread until the virtual time has advanced.
+      """
+      self.__sleepUntil(seconds, lambda: False)
+
+
+   def wait(self, event, timeout):
+      """
+      Wait until an event is set or the virtual timeout expires.
+      """
+      return self.__sleepUntil(timeout, event.is_set)
+
+
+   def select(self, fds, timeout):
+      """
+      Wait until a file descriptor is ready or the virtual timeout expires.
+      """
+      ready = []
+      def isReady():
+         ready[:] = _select.select(fds, [], [], 0)[0]
+         return len(ready) > 0
+      self.__sleepUntil(timeout, isReady)
+      return ready
+
+
+   async def sleepAsync(self, seconds):
+      """
+      Suspend the calling coroutine until the virtual time has advanced.
+      The event loop keeps running the other coroutines in the meantime.
+      """
+      import asyncio
+      with self.__cond:
+         wakeTime = self.__getWakeTime(seconds)
+         heapq.heappush(self.__wakeTimes, wakeTime)
+      try:
+         # Let the other coroutines that are ready run first.
+         delay = 0
+         while(True):
+            await asyncio.sleep(delay)
+            with self.__cond:
+               if(self.__ns >= wakeTime):
+                  return
+               # The event loop thread is idle while this coroutine waits.
+               advanced = (self.__isIdle(threading.get_ident()) == True) and (self.__advance() == True)
+            delay = 0 if (advanced == True) else self.__idlePeriod
+      finally:
+         with self.__cond:
+            self.__removeWakeTime(wakeTime)
+
+
+   def __sleepUntil(self, timeout, isReady):
+      """
+      Block the calling thread until the timeout expires in virtual time
+      or isReady() returns True.
+
+      Returns
+      -------
+      bool
+         Last value returned by isReady().
+      """
+      if(isReady() == True):
+         return True
+      ident = threading.get_ident()
+      with self.__cond:
+         wakeTime = self.__getWakeTime(math.inf if (timeout is None) else timeout)
+         heapq.heappush(self.__wakeTimes, wakeTime)
+         self.__clockUsers.add(ident)
+         self.__sleepers.add(ident)
+         self.__changed()
+      try:
+         stalled = False
+         while(True):
+            if(isReady() == True):
+               return True
+            with self.__cond:
+               if(self.__ns >= wakeTime):
+                  return False
+               if((self.__isIdle(ident) == True) and (self.__advance() == True)):
+                  continue
+               # Other threads are blocked outside the clock.
+               if((stalled == True) and (self.__advance() == True)):
+                  stalled = False
+                  continue
+               changes = self.__changes
+               stalled = (self.__cond.wait(self.__idlePeriod) == False) and (changes == self.__changes)
+      finally:
+         with self.__cond:
+            self.__sleepers.discard(ident)
+            self.__removeWakeTime(wakeTime)
+            self.__changed()
+
+
+   def __getWakeTime(self, timeout):
+      """
+      Return the virtual time (ns) after a timeout.
+      """
+      if(timeout == math.inf):
+         return math.inf
+      return self.__ns + self.__toNs(timeout)
+
+
+   @staticmethod
+   def __toNs(seconds):
+      """
+      Convert seconds to nanoseconds. A positive time shorter than 1ns 
+      still advances the clock, otherwise a loop waiting for a deadline
+      would never reach it.
+      """
+      if(seconds <= 0):
+         return 0
+      return max(int(math.ceil(seconds * 1e9)), 1)
+
+
+   def __isIdle(self, caller):
+      """
+      Return True if every thread other than the caller is idle.
+      """
+      now     = time.monotonic()
+      threads = set(thread.ident for thread in threading.enumerate())
+      self.__clockUsers.intersection_update(threads)
+      self.__others = {ident : self.__others.get(ident, now) for ident in threads \
+         if (ident not in self.__clockUsers)}
+      for ident in threads:
+         if((ident == caller) or (ident in self.__sleepers)):
+            continue
+         if((ident in self.__clockUsers) or (now - self.__others[ident] < self.__idlePeriod)):
+            return False
+      return True
+
+
+   def __changed(self):
+      """
+      Wake up the sleepers after a thread started or stopped sleeping.
+      """
+      self.__changes = self.__changes + 1
+      self.__cond.notify_all()
+
+
+   def __advance(self):
+      """
+      Jump to the earliest wake up time. Returns True if time moved.
+      """
+      if((len(self.__wakeTimes) == 0) or (self.__wakeTimes[0] <= self.__ns) or \
+         (self.__wakeTimes[0] == math.inf)):
+         return False
+      self.__ns = self.__wakeTimes[0]
+      self.__cond.notify_all()
+      return True
+
+
+   def __removeWakeTime(self, wakeTime):
+      """
+      Remove a wake up time from the heap.
+      """
+      self.__wakeTimes.remove(wakeTime)
+      heapq.heapify(self.__wakeTimes)
+
+
+class DinoClockDiscipline(object):
+   """
+   Class DinoClockDiscipline - Estimate the vehicle clock from the MET.
+
+   Each packet from the vehicle carries its experiment time (NR_EXP_TIME).
+   The pairs (MET when the packet was received, vehicle time) of the last
+   DISCIPLINE_WINDOW packets are fit with a least squares line:
+      vehicle time = MET + offset + drift * (MET - reference MET)
+   The offset includes the mean delay of the packets on the serial link.
+   The vehicle time is sent with a 10ms resolution; the fit averages the
+   rounding over the window. 
+
+   The sums of the fit are updated incrementally, such that each sample
+   costs the same regardless of the window. Samples further than
+   DISCIPLINE_MAX_RESIDUAL from the fit are rejected. After 
+   DISCIPLINE_MAX_REJECTS consecutive rejects one of the clocks stepped
+   (i.e. a reboot) and the fit restarts from the new samples.
+
+   The estimate is replaced as a whole, such that it can be read from
+   any thread while the serial thread adds samples.
+   """
+
+   def __init__(self, window=DISCIPLINE_WINDOW):
+      """
+      Create an estimator without samples.
+
+      Parameters
+      ----------
+      window : int
+         Number of samples in the fit.
+      """
+      self.__window   = window
+      self.__lock     = threading.Lock()
+      self.__samples  = deque()
+      self.__estimate = None  # (reference MET, offset, drift)
+      self.__rejected = 0     # Total samples rejected.
+      self.__rejects  = 0     # Consecutive samples rejected.
+      self.__resets   = 0     # Number of clock steps detected.
+      self.__clear()
+
+
+   def update(self, vehicleTime, met):
+      """
+      Add a sample.
+
+      Parameters
+      ----------
+      vehicleTime : float
+         Experiment time sent by the vehicle (NR_EXP_TIME).
+      met : float
+         MET when the packet was received.
+
+      Returns
+      -------
+      bool
+         True if the sample was used, False if it was rejected.
+      """
+      with self.__lock:
+         offset = vehicleTime - met
+         if((self.__estimate is not None) and \
+            (abs(vehicleTime - self.getVehicleTime(met)) > DISCIPLINE_MAX_RESIDUAL)):
+            self.__rejected = self.__rejected + 1
+            self.__rejects  = self.__rejects + 1
+            if(self.__rejects < DISCIPLINE_MAX_REJECTS):
+               return False
+            self.__resets = self.__resets + 1
+            self.__clear()
+         self.__rejects = 0
+
+         if(len(self.__samples) == 0):
+            self.__metRef = met
+         self.__samples.append((met, offset))
+         self.__add(met, offset, 1)
+         if(len(self.__samples) > self.__window):
+            (oldMet, oldOffset) = self.__samples.popleft()
+            self.__add(oldMet, oldOffset, -1)
+
+         # Recompute the sums from time to time with a recent reference, 
+         # such that rounding errors do not accumulate.
+         self.__updates = self.__updates + 1
+         if(self.__updates >= self.__window):
+            self.__rebase()
+         self.__estimate = self.__fit()
+         return True
+
+
+   def getVehicleTime(self, met):
+      """
+      Return the estimated vehicle time at a MET or None without samples.
+      """
+      estimate = self.__estimate
+      if(estimate is None):
+         return None
+      (metRef, offset, drift) = estimate
+      return met + offset + drift * (met - metRef)
+
+
+   def getOffset(self, met):
+      """
+      Return the estimated vehicle time minus the MET at a MET (seconds)
+      or None without samples.
+      """
+      vehicleTime = self.getVehicleTime(met)
+      return None if (vehicleTime is None) else (vehicleTime - met)
+
+
+   def getDrift(self):
+      """
+      Return the rate of the vehicle clock relative to the MET minus one
+      (i.e. 1e-6 if the vehicle clock gains 1us per second) or None
+      without samples.
+      """
+      estimate = self.__estimate
+      return None if (estimate is None) else estimate[2]
+
+
+   def getStats(self):
+      """
+      Return the number of samples in the fit, rejected and clock steps.
+      """
+      return {'samples'  : len(self.__samples), \
+              'rejected' : self.__rejected, \
+              'resets'   : self.__resets}
+
+
+   def reset(self):
+      """
+      Discard the samples (i.e. after the MET was changed).
+      """
+      with self.__lock:
+         self.__clear()
+
+
+   def __clear(self):
+      """
+      Discard the samples and the estimate.
+      """
+      self.__samples.clear()
+      self.__estimate = None
+      self.__rejects  = 0
+      self.__updates  = 0
+      self.__metRef   = 0.0
+      self.__sums     = [0.0, 0.0, 0.0, 0.0]  # x, y, x*x, x*y
+
+
+   def __add(self, met, offset, sign):
+      """
+      Add (sign=1) or remove (sign=-1) a sample from the sums.
+      """
+      x    = met - self.__metRef
+      sums = self.__sums
+      sums[0] = sums[0] + sign * x
+      sums[1] = sums[1] + sign * offset
+      sums[2] = sums[2] + sign * x * x
+      sums[3] = sums[3] + sign * x * offset
+
+
+   def __rebase(self):
+      """
+      Recompute the sums relative to the oldest sample.
+      """
+      self.__updates = 0
+      self.__metRef  = self.__samples[0][0]
+      self.__sums    = [0.0, 0.0, 0.0, 0.0]
+      for (met, offset) in self.__samples:
+         self.__add(met, offset, 1)
+
+
+   def __fit(self):
+      """
+      Return the least squares estimate (mean MET, mean offset, drift).
+      The drift is zero until there are DISCIPLINE_MIN_SAMPLES samples.
+      """
+      n = len(self.__samples)
+      (sumX, sumY, sumXX, sumXY) = self.__sums
+      meanX = sumX / n
+      meanY = sumY / n
+      drift = 0.0
+      if(n >= DISCIPLINE_MIN_SAMPLES):
+         varX = sumXX / n - meanX * meanX
+         if(varX > 1e-6):
+            drift = (sumXY / n - meanX * meanY) / varX
+      return (self.__metRef + meanX, meanY, drift)
 
 
 class DinoTime(object):
@@ -14,17 +523,34 @@ class DinoTime(object):
       2) Mission Elapsed Time (MET) in seconds
          This variable starts counting from 0 when the software
          initializes and can be used to measure the time elapsed 
-         between events.  
+         between events. It is based on a monotonic clock in 
+         nanoseconds, such that changes of the system time (i.e. NTP)
+         do not affect it.
+
+      3) Vehicle time 
+         Experiment time of the vehicle estimated from the MET (see
+         DinoTime.syncVehicle() and DinoClockDiscipline).
 
    This class was designed using static methods such that these methods
    can be called from any part of the application. 
+
+   Timestamps and sleeps go through a clock (DinoClock by default) that
+   can be replaced with DinoTime.setClock(), i.e. with a DinoSimClock to
+   replay a flight in seconds with the same sequence of events. Use 
+   DinoTime.sleep(), wait() and select() instead of the time module.
    """
 
    # DinoTime Singleton instance 
    __instance = None
 
-   # Reference timestamp for calculating MET.
-   __startTime = 0
+   # Reference monotonic time (ns) for calculating MET.
+   __startNs = 0
+
+   # Source of the date/time and of every sleep.
+   __clock = DinoClock()
+
+   # Estimate of the vehicle clock.
+   __discipline = DinoClockDiscipline()
 
    # Minimum time difference to cause the time sync.
    SYNC_TIME_MIN_THRESHOLD = 1
@@ -38,7 +564,7 @@ class DinoTime(object):
          DinoTime.__instance = object.__new__(cls)
          
          # Initialize MET. 
-         DinoTime.__startTime = time.time()
+         DinoTime.__startNs = DinoTime.__clock.getMonotonicNs()
       return DinoTime.__instance
 
 
@@ -54,6 +580,7 @@ class DinoTime(object):
       
       Assume that the system can only jump the time forward.
       If a backwards time jump is requested, return False.
+      The estimate of the vehicle clock restarts after a jump.
             
       Parameter
       ---------
@@ -71,7 +598,8 @@ class DinoTime(object):
       # Validate jump in forward direction and greater
       # than some minimum threshold.
       if((newMet - currMet) > DinoTime.SYNC_TIME_MIN_THRESHOLD):
-         DinoTime.__startTime = time.time() - newMet
+         DinoTime.__startNs = DinoTime.__clock.getMonotonicNs() - int(round(newMet * 1e9))
+         DinoTime.__discipline.reset()
          status = True
       return status
       
@@ -86,7 +614,16 @@ class DinoTime(object):
       float
          Mission elapsed time (MET) in seconds.
       """
-      return float(time.time() - DinoTime.__startTime)
+      return (DinoTime.__clock.getMonotonicNs() - DinoTime.__startNs) / 1e9
+
+
+   @staticmethod
+   def getMETNs():
+      """
+      Static method to return the MET as an integer number of 
+      nanoseconds (for latency measurements).
+      """
+      return DinoTime.__clock.getMonotonicNs() - DinoTime.__startNs
 
 
    @staticmethod 
@@ -101,6 +638,152 @@ class DinoTime(object):
       str
          String containing timestamp.
       """
-      return time.strftime("%Y%m%d-%H%M%S")
+      return time.strftime("%Y%m%d-%H%M%S", time.localtime(DinoTime.__clock.getTime()))
+
+
+   @staticmethod
+   def setClock(clock):
+      """
+      Static method that replaces the clock. The MET continues from its
+      current value.
+
+      Parameters
+      ----------
+      clock : DinoClock
+         DinoClock, DinoMonotonicClock or DinoSimClock.
+      """
+      metNs = DinoTime.getMETNs()
+      DinoTime.__clock   = clock
+      DinoTime.__startNs = clock.getMonotonicNs() - metNs
+
+
+   @staticmethod
+   def syncVehicle(vehicleTime, met=None):
+      """
+      Static method that adds a sample of the vehicle clock.
+      Called by DinoSerial for each packet received.
+
+      Parameters
+      ----------
+      vehicleTime : float
+         Experiment time in the packet (NR_EXP_TIME).
+      met : float
+         MET when the packet was received. Defaults to now.
+
+      Returns
+      -------
+      bool
+         True if the sample was used, False if it was rejected.
+      """
+      if(met is None):
+         met = DinoTime.getMET()
+      return DinoTime.__discipline.update(vehicleTime, met)
+
+
+   @staticmethod
+   def getVehicleTime(met=None):
+      """
+      Static method that returns the estimated vehicle time at a MET
+      (defaults to now) or None before the first packet.
+      """
+      if(met is None):
+         met = DinoTime.getMET()
+      return DinoTime.__discipline.getVehicleTime(met)
+
+
+   @staticmethod
+   def getVehicleOffset():
+      """
+      Static method that returns the estimated vehicle time minus the 
+      MET (seconds) or None before the first packet.
+      """
+      return DinoTime.__discipline.getOffset(DinoTime.getMET())
+
+
+   @staticmethod
+   def getVehicleDrift():
+      """
+      Static method that returns the estimated drift of the vehicle 
+      clock relative to the MET (seconds per second) or None before 
+      the first packet.
+      """
+      return DinoTime.__discipline.getDrift()
+
+
+   @staticmethod
+   def getDiscipline():
+      """
+      Static method that returns the estimator of the vehicle clock.
+      """
+      return DinoTime.__discipline
+
+
+   @staticmethod
+   def getClock():
+      """
+      Static method that returns the clock in use.
+      """
+      return DinoTime.__clock
+
+
+   @staticmethod
+   def getTime():
+      """
+      Static method that returns the date/time in seconds since the
+      epoch (replaces time.time()).
+      """
+      return DinoTime.__clock.getTime()
+
+
+   @staticmethod
+   def sleep(seconds):
+      """
+      Static method that suspends the calling thread (replaces time.sleep()).
+      """
+      DinoTime.__clock.sleep(seconds)
+
+
+   @staticmethod
+   def wait(event, timeout):
+      """
+      Static method that waits until an event is set or the timeout
+      expires (replaces event.wait(timeout)).
+
+      Parameters
+      ----------
+      event : threading.Event
+         Event to wait for (i.e. request to stop a thread).
+      timeout : float
+         Maximum time in seconds to wait.
+
+      Returns
+      -------
+      bool
+         True if the event is set.
+      """
+      return DinoTime.__clock.wait(event, timeout)
+
+
+   @staticmethod
+   def select(fds, timeout):
+      """
+      Static method that waits until a file descriptor is ready to read
+      or the timeout expires (replaces select.select(fds, [], [], timeout)).
+
+      Returns
+      -------
+      list
+         File descriptors ready to read.
+      """
+      return DinoTime.__clock.select(fds, timeout)
+
+
+   @staticmethod
+   def sleepAsync(seconds):
+      """
+      Static method that returns a coroutine that suspends the caller
+      (replaces asyncio.sleep()).
+      """
+      return DinoTime.__clock.sleepAsync(seconds)
 
 
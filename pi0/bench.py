@@ -0,0 +1,612 @@
+from   time import *
+from   select import select
+from   threading import Thread
+import os
+import sys
+import random
+import struct
+import resource
+import subprocess
+
+from DinoConstants import *  # Project constants
+from DinoTestUtils import *  # Test utilities
+from DinoPacket    import *  # Serial packet schema
+from DinoPacketView import *  # Lazy packet access
+from DinoTime      import *  # Time keeping (Real-time + MET)
+from DinoLog       import *  # Logging features
+from DinoSerial    import *  # Serial data interface
+from DinoProfiler  import *  # Loop instrumentation
+from DinoStateMachine import *  # Experiment states
+from DinoArchive   import *  # NumPy archive loader
+
+# Recorded New Shepard packets used as input for all benchmarks.
+SCENARIO_FILE = "scenario/nff-packets.txt"
+
+# Number of passes over the scenario for each benchmark.
+NUM_PASSES = 5
+
+# Number of packets replayed at 10Hz through a pseudo-terminal.
+NUM_REPLAY_PACKETS = 100
+
+# Number of packets replayed at 10Hz into main.py and mainasync.py. The 
+# flight states are replaced to go through the whole experiment.
+NUM_FLIGHT_PACKETS = 300
+
+# Run main.py or mainasync.py with the serial port given as argument.
+MAIN_LAUNCHER = "import sys, runpy, DinoMain; DinoMain.PORTNAME = sys.argv[1]; " + \
+   "runpy.run_path(sys.argv[2], run_name='__main__')"
+
+# Number of packets in the soak log loaded by benchDinoArchive() (6h at 10Hz).
+NUM_SOAK_PACKETS = 216000
+
+# Upper limit (msec) of each bucket in latency histograms.
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def loadScenario():
+   """
+   Read all packets in the scenario file.
+
+   Returns
+   -------
+   list
+      List of packets (str) including the line terminator.
+   """
+   with open(SCENARIO_FILE, "r") as fp:
+      return fp.readlines()
+
+
+def printRate(testName, testDesc, count, elapsed):
+   """
+   Print the cost per item of a benchmark.
+   """
+   usec = elapsed / count * 1e6
+   print(testName + " - " + testDesc + " " + \
+      formatValue(usec) + " usec/packet (" + formatValue(count) + " packets)")
+   return usec
+
+
+def printHistogram(testName, testDesc, latencies):
+   """
+   Print a histogram and percentiles of latencies in msec.
+   """
+   latencies = sorted(latencies)
+   count = len(latencies)
+   if(count == 0):
+      print(testName + " - " + testDesc + " no samples")
+      return
+   print(testName + " - " + testDesc + \
+      " p50=" + formatValue(latencies[count // 2]) + \
+      " p95=" + formatValue(latencies[min(count - 1, (count * 95) // 100)]) + \
+      " max=" + formatValue(latencies[-1]) + " msec")
+   lower = 0
+   for upper in LATENCY_BUCKETS + (None,):
+      num = len([x for x in latencies if (x >= lower) and ((upper is None) or (x < upper))])
+      label = ("   " + str(lower) + "-" + str(upper)) if (upper is not None) else ("   >" + str(lower))
+      print(label.ljust(12) + " msec " + ("#" * ((num * 50) // count)).ljust(50) + " " + str(num))
+      lower = upper
+
+
+def legacyParse(incoming_data, flightData):
+   """
+   Copy of the if/elif parser used by DinoMain before DinoPacket.
+   Kept as a reference for benchmarking only.
+   """
+   incoming_data = incoming_data.strip()
+   fields = incoming_data.split(',')
+   if len(fields) != 21:
+      return False
+   index = 0
+   for field in fields:
+      if index == 0:
+         flightData['flight_event'] = field
+      elif index == 1:
+         flightData['exptime'] = float(field)
+      elif index == 2:
+         flightData['altitude'] = float(field)
+      elif index == 3:
+         flightData['gps_altitude'] = float(field)
+      elif index == 4:
+         flightData['velocity'][0] = float(field)
+      elif index == 5:
+         flightData['velocity'][1] = float(field)
+      elif index == 6:
+         flightData['velocity'][2] = float(field)
+      elif index == 7:
+         flightData['acc_magnitude'] = float(field)
+      elif index == 8:
+         flightData['acceleration'][0] = float(field)
+      elif index == 9:
+         flightData['acceleration'][1] = float(field)
+      elif index == 10:
+         flightData['acceleration'][2] = float(field)
+      elif index == 11:
+         flightData['attitude'][0] = float(field)
+      elif index == 12:
+         flightData['attitude'][1] = float(field)
+      elif index == 13:
+         flightData['attitude'][2] = float(field)
+      elif index == 14:
+         flightData['angular_velocity'][0] = float(field)
+      elif index == 15:
+         flightData['angular_velocity'][1] = float(field)
+      elif index == 16:
+         flightData['angular_velocity'][2] = float(field)
+      elif index == 17:
+         flightData['warnings'][0] = int(field)
+      elif index == 18:
+         flightData['warnings'][1] = int(field)
+      elif index == 19:
+         flightData['warnings'][2] = int(field)
+      elif index == 20:
+         flightData['warnings'][3] = int(field)
+      index = index + 1
+   return True
+
+
+def benchDinoPacket():
+   testName = "DinoPacket"
+   lines = loadScenario()
+   count = len(lines) * NUM_PASSES
+
+   printSubheading(testName, "Decode " + SCENARIO_FILE)
+
+   flightData = {'flight_event': 0, 'velocity': [0,0,0], 'acceleration': [0,0,0], 'attitude': [0,0,0],
+                 'angular_velocity': [0,0,0], 'warnings': [0,0,0,0]}
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      for line in lines:
+         legacyParse(line, flightData)
+   legacy = printRate(testName, "if/elif parser", count, perf_counter() - start)
+
+   record = PACKET_NFF.newRecord()
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      for line in lines:
+         PACKET_NFF.decode(line, record)
+   schema = printRate(testName, "schema decoder", count, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(legacy / schema) + "x")
+
+   printSubheading(testName, "Encode " + SCENARIO_FILE)
+   records = []
+   for line in lines:
+      record = PACKET_NFF.newRecord()
+      PACKET_NFF.decode(line, record)
+      records.append(record)
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      for record in records:
+         PACKET_NFF.encode(record)
+   printRate(testName, "schema encoder", count, perf_counter() - start)
+
+
+def benchDinoPacketView():
+   testName = "DinoPacketView"
+   lines = [line.rstrip("\n").encode("ascii") for line in loadScenario()]
+   count = len(lines) * NUM_PASSES
+
+   printSubheading(testName, "Read state, altitude and acceleration")
+
+   record = PACKET_NFF.newRecord()
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      for line in lines:
+         PACKET_NFF.decode(line.decode("utf-8"), record)
+         state = record[NR_FLIGHT_STATE]
+         altitude = record[NR_ALTITUDE]
+         acceleration = record[NR_ACCELERATION]
+   decode = printRate(testName, "decode all fields", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      for line in lines:
+         view = DinoPacketView(PACKET_NFF, line)
+         state = view.getState()
+         altitude = view.get(NR_ALTITUDE)
+         acceleration = view.get(NR_ACCELERATION)
+   lazy = printRate(testName, "lazy view", count, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(decode / lazy) + "x")
+
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      for line in lines:
+         view = DinoPacketView(PACKET_NFF, line)
+         state = view.getState()
+   printRate(testName, "lazy view (state only)", count, perf_counter() - start)
+
+
+def legacyDetermineState(strState, currState):
+   """
+   Copy of DinoMain._determineState() before DinoStateMachine.
+   Kept as a reference for benchmarking only.
+   """
+   try:
+    nrState = NR_STATE_LETTERS.index(strState)
+   except:
+     return currState
+   if(nrState < NR_STATE_COAST_START):
+      currState = DINO_STATE_INIT
+   elif(nrState < NR_STATE_COAST_END):
+      if(currState == DINO_STATE_INIT):
+         currState = DINO_STATE_START_EXP
+      else:
+         currState = DINO_STATE_EXPERIMENT
+   elif(nrState < NR_STATE_TOUCHDOWN):
+      currState = DINO_STATE_END_EXP
+   else:
+      currState = DINO_STATE_FINISHED
+   return currState
+
+
+def benchDinoStateMachine():
+   testName = "DinoStateMachine"
+   views = [DinoPacketView(PACKET_NFF, line.rstrip("\n").encode("ascii")) for line in loadScenario()]
+   count = len(views) * NUM_PASSES
+
+   printSubheading(testName, "Determine experiment state for " + SCENARIO_FILE)
+
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      state = DINO_STATE_INIT
+      for view in views:
+         state = legacyDetermineState(view.getState(), state)
+   legacy = printRate(testName, "index() + if/elif", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      sm = DinoStateMachine()
+      for view in views:
+         sm.update(view.getStateByte())
+   table = printRate(testName, "transition table", count, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(legacy / table) + "x")
+
+   stateBytes = bytes(view.getStateByte() for view in views)
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      DinoStateMachine().replay(stateBytes)
+   table = printRate(testName, "transition table (replay)", count, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(legacy / table) + "x")
+
+
+def benchDinoProfiler():
+   testName = "DinoProfiler"
+   count = 100000
+
+   printSubheading(testName, "Overhead of timing one phase")
+
+   start = perf_counter()
+   for i in range(count):
+      t = perf_counter_ns()
+   printRate(testName, "perf_counter_ns()", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(count):
+      DinoProfiler.stop(PHASE_PARSE, DinoProfiler.start())
+   printRate(testName, "start() + stop()", count, perf_counter() - start)
+   DinoProfiler.logSummary()
+
+
+def legacyFormatEntry(entry):
+   """
+   Previous implementation of DinoLog.formatEntry().
+   """
+   (entryType, entryId, wallTime, met, payload, flush) = entry
+   timeStr = strftime("%Y%m%d-%H%M%S", localtime(wallTime))
+   metStr  = format(met, MET_STR_FORMAT)
+   if(entryType == DATA_ID):
+      dataList = []
+      for i in payload:
+         if(isinstance(i, float) == True):
+            dataList.append('{0:.4f}'.format(i))
+         else:
+            dataList.append(str(i))
+      msg = CSV_SEP.join(dataList)
+   else:
+      msg = payload.replace(CSV_SEP, SAFE_SEP)
+   return timeStr + CSV_SEP + metStr + CSV_SEP + entryType + str(entryId) + CSV_SEP + msg + "\n"
+
+
+def scenarioEntries():
+   """
+   Generate the log entries of a flight replaying the scenario at 10Hz: 
+   one data entry per packet (see DinoMain._readAllData()) with one 
+   message every 10 packets.
+   """
+   entries = []
+   wallTime = 1700000000.0
+   for line in loadScenario():
+      view = DinoPacketView(PACKET_NFF, line.rstrip("\n").encode("ascii"))
+      row  = (view.getState(), view.get(NR_ALTITUDE), view.get(NR_ACCELERATION), \
+              1021, 873, 512, 2406, 21.8125, 101283.3828, 0.0123, None, 0.9812)
+      met  = len(entries) * 0.1
+      entries.append((DATA_ID, len(entries) + 1, wallTime + met, met, row, False))
+      if((len(entries) % 10) == 0):
+         entries.append((EVENT_ID, len(entries) + 1, wallTime + met, met, "Thermal control, heater=[on]", False))
+   return entries
+
+
+def benchDinoLog():
+   testName = "DinoLog"
+   count = 20000
+   data = [1.5] * 20   # Similar to the data logged for each packet
+
+   printSubheading(testName, "Cost to the caller of each entry")
+
+   start = perf_counter()
+   for i in range(count):
+      DinoLog.logMsg("Benchmark message " + str(i))
+   printRate(testName, "logMsg()", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(count):
+      DinoLog.logData(data)
+   printRate(testName, "logData()", count, perf_counter() - start)
+
+   start = perf_counter()
+   DinoLog.flush()
+   printRate(testName, "flush() of the queued entries", 2 * count, perf_counter() - start)
+
+   printSubheading(testName, "Writer cost and size of each data entry")
+
+   # Typical data entry for a packet (see DinoMain._readAllData()).
+   row = ["F", 76500.25, -0.125, 1021, 873, 512, 2406, 21.8125, 101283.3828, 0.0123, -0.0145, 0.9812]
+   entry = (DATA_ID, 123456, 1700000000.0, 1234.56, tuple(row), False)
+   record = struct.Struct(DATA_RECORD_HEADER + "".join(fmt for (name, fmt) in I_COLUMNS))
+
+   start = perf_counter()
+   for i in range(count):
+      line = DinoLog.formatEntry(entry)
+   textTime = printRate(testName, "text (" + str(len(line)) + " bytes)", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(count):
+      values = list(row)
+      values[I_FLIGHT_STATE] = values[I_FLIGHT_STATE].encode('ascii')
+      data = record.pack(123456, 1700000000.0, 1234.56, 1235.01, 0, *values)
+   binTime = printRate(testName, "binary (" + str(len(data)) + " bytes)", count, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(textTime / binTime) + "x, " + \
+      formatValue(len(line) / len(data)) + "x less data")
+
+   entries = scenarioEntries()
+   count = len(entries) * NUM_PASSES
+   printSubheading(testName, "Format " + str(len(entries)) + " entries replaying the scenario")
+
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      legacy = [legacyFormatEntry(entry) for entry in entries]
+   legacyTime = printRate(testName, "strftime() + dataList", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(NUM_PASSES):
+      lines = [DinoLog.formatEntry(entry) for entry in entries]
+   fastTime = printRate(testName, "templates + cached timestamp", count, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(legacyTime / fastTime) + "x")
+   testIsTrue(testName, "Output is identical", lines == legacy)
+
+
+def replayPackets(master, lines, sent):
+   """
+   Write packets to a pseudo-terminal at 10Hz with up to 20msec of jitter.
+   Record the time each packet was written indexed by experiment time.
+   """
+   start = perf_counter()
+   for i in range(len(lines)):
+      delay = start + i * 0.1 + random.uniform(0.0, 0.02) - perf_counter()
+      if(delay > 0):
+         sleep(delay)
+      sent[float(lines[i].split(b",")[NR_EXP_TIME])] = perf_counter()
+      os.write(master, lines[i])
+
+
+def benchMainLoop():
+   testName = "MainLoop"
+   lines = loadScenario()[:NUM_REPLAY_PACKETS]
+   lines = [line.encode("ascii") for line in lines]
+
+   master, slave = os.openpty()
+   dinoSerial = DinoSerial(os.ttyname(slave))
+   dinoSerial.startReading()
+
+   printSubheading(testName, "Packet-to-action latency replaying " + \
+      str(len(lines)) + " packets through a pseudo-terminal")
+
+   # Previous loop: poll the serial data and sleep(0.1) after each packet.
+   sent = {}
+   latencies = []
+   writer = Thread(target=replayPackets, args=(master, lines, sent))
+   writer.start()
+   while((writer.is_alive() == True) or (len(latencies) < len(sent))):
+      packets = dinoSerial.getPackets(0.02)
+      now = perf_counter()
+      for packet in packets:
+         latencies.append((now - sent[packet.get(NR_EXP_TIME)]) * 1000)
+      if(len(packets) > 0):
+         sleep(0.1)
+   printHistogram(testName, "poll + sleep(0.1)", latencies)
+
+   # Current loop: wait on the serial notification with a deadline.
+   sent = {}
+   latencies = []
+   writer = Thread(target=replayPackets, args=(master, lines, sent))
+   writer.start()
+   while((writer.is_alive() == True) or (len(latencies) < len(sent))):
+      select([dinoSerial.fileno()], [], [], 1.0)
+      packets = dinoSerial.getPackets()
+      now = perf_counter()
+      for packet in packets:
+         latencies.append((now - sent[packet.get(NR_EXP_TIME)]) * 1000)
+   printHistogram(testName, "select() on deadline", latencies)
+
+   dinoSerial.stopReading()
+   os.close(master)
+   os.close(slave)
+
+
+def flightPackets():
+   """
+   Scenario packets with the flight state replaced: pre-coast, coast
+   (START_EXP), descent (END_EXP) and landed (FINISHED).
+   """
+   lines  = [line.encode("ascii") for line in loadScenario()[:NUM_FLIGHT_PACKETS]]
+   states = b"@" * (len(lines) // 5) + b"F" * (len(lines) * 3 // 5)
+   states = states + b"I" * (len(lines) - len(states) - 1) + b"K"
+   return [states[i:i + 1] + lines[i][1:] for i in range(len(lines))]
+
+
+def replayMain(script, lines):
+   """
+   Run an experiment script in a child process and replay the packets
+   through a pseudo-terminal until the landed state ends the test.
+
+   Returns
+   -------
+   tuple
+      (CPU time in sec, voluntary, involuntary context switches) of the child.
+   """
+   folder = os.path.dirname(os.path.abspath(__file__))
+   master, slave = os.openpty()
+   before = resource.getrusage(resource.RUSAGE_CHILDREN)
+   child  = subprocess.Popen([sys.executable, "-c", MAIN_LAUNCHER, os.ttyname(slave), \
+      os.path.join(folder, script)], env=dict(os.environ, PYTHONPATH=folder + os.pathsep + os.environ.get("PYTHONPATH", "")), \
+      stdout=subprocess.DEVNULL)
+   # The serial port is flushed when it is opened.
+   sleep(3.0)
+   replayPackets(master, lines, {})
+   try:
+      child.wait(10.0)
+   except subprocess.TimeoutExpired:
+      child.terminate()
+      child.wait()
+   after = resource.getrusage(resource.RUSAGE_CHILDREN)
+   os.close(master)
+   os.close(slave)
+   return ((after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime), \
+      after.ru_nvcsw - before.ru_nvcsw, after.ru_nivcsw - before.ru_nivcsw)
+
+
+def benchMainAsync():
+   testName = "MainAsync"
+   lines    = flightPackets()
+
+   printSubheading(testName, "CPU time and context switches replaying " + \
+      str(len(lines)) + " packets through a pseudo-terminal")
+
+   results = {}
+   for script in ("main.py", "mainasync.py"):
+      (cpu, voluntary, involuntary) = replayMain(script, lines)
+      results[script] = (cpu, voluntary)
+      print(testName + " - " + script + " cpu=[" + formatValue(cpu) + "sec] voluntary=[" + \
+         formatValue(voluntary) + "] involuntary=[" + formatValue(involuntary) + "] context switches")
+   print(testName + " - mainasync.py uses " + \
+      formatValue(results["mainasync.py"][0] / max(results["main.py"][0], 1e-6)) + "x the CPU time and " + \
+      formatValue(results["mainasync.py"][1] / max(results["main.py"][1], 1)) + "x the voluntary context switches")
+
+
+def legacyLoad(logPath):
+   """
+   Parse a text log by hand into data rows and events.
+   """
+   data   = []
+   events = []
+   with open(logPath, "r") as fp:
+      for line in fp:
+         fields = line.rstrip("\n").split(CSV_SEP)
+         if(fields[2].startswith(DATA_ID) == True):
+            row = [fields[0], float(fields[1]), fields[3]]
+            for value in fields[4:]:
+               row.append(None if (value == "None") else float(value))
+            data.append(row)
+         else:
+            events.append(fields)
+   return (data, events)
+
+
+def benchDinoArchive():
+   testName = "DinoArchive"
+   entries  = scenarioEntries()
+   rows     = [entry[4] for entry in entries if (entry[0] == DATA_ID)]
+
+   printSubheading(testName, "Load a soak log of " + str(NUM_SOAK_PACKETS) + " packets")
+
+   # Same entries as text (legacy) and through DinoLog (binary data).
+   logPath = DinoLog.getFolder() + "/soak.txt"
+   with open(logPath, "w") as fp:
+      for i in range(NUM_SOAK_PACKETS):
+         entry = entries[i % len(entries)]
+         fp.write(DinoLog.formatEntry((entry[0], i + 1, entry[2], i * 0.1, entry[4], False)))
+   for i in range(NUM_SOAK_PACKETS):
+      DinoLog.logData(rows[i % len(rows)])
+   DinoLog.flush()
+   indexPath = DinoLog("bench").getIndexFilename()
+
+   start = perf_counter()
+   (data, events) = legacyLoad(logPath)
+   legacyTime = printRate(testName, "parse text log", NUM_SOAK_PACKETS, perf_counter() - start)
+
+   start = perf_counter()
+   archive = DinoArchive(indexPath)
+   loadTime = printRate(testName, "load binary segments", NUM_SOAK_PACKETS, perf_counter() - start)
+
+   start = perf_counter()
+   archive = DinoArchive(indexPath)
+   cacheTime = printRate(testName, "load " + ARCHIVE_CACHE_EXT + " cache", NUM_SOAK_PACKETS, perf_counter() - start)
+   print(testName + " - Speedup " + formatValue(legacyTime / loadTime) + "x (binary), " + \
+      formatValue(legacyTime / cacheTime) + "x (cache)")
+   testIsTrue(testName, "Loaded from cache", archive.isCached())
+   testGreaterThanOrEquals(testName, "Every packet loaded", len(archive.getData()), NUM_SOAK_PACKETS)
+
+   printSubheading(testName, "Queries")
+
+   count = 1000
+   start = perf_counter()
+   for i in range(count):
+      archive.getRange(i, i + 60.0)
+   printRate(testName, "getRange() of 60s", count, perf_counter() - start)
+
+   start = perf_counter()
+   for i in range(count):
+      archive.getState("F")
+   printRate(testName, "getState()", count, perf_counter() - start)
+
+
+if(__name__ == "__main__"):
+   # Initialize time system
+   DinoTime()
+   DinoLog("bench", I_COLUMNS)
+   DinoProfiler()
+
+   printHeading("Start benchmark (" + strftime("%Y%m%d-%H%M%S") + ")")
+
+   if((len(sys.argv) == 1) or ("DinoLog" in sys.argv)):
+      printHeading("Benchmark DinoLog class")
+      benchDinoLog()
+
+   if((len(sys.argv) == 1) or ("DinoArchive" in sys.argv)):
+      printHeading("Benchmark DinoArchive class")
+      benchDinoArchive()
+
+   if((len(sys.argv) == 1) or ("DinoPacket" in sys.argv)):
+      printHeading("Benchmark DinoPacket class")
+      benchDinoPacket()
+
+   if((len(sys.argv) == 1) or ("DinoPacketView" in sys.argv)):
+      printHeading("Benchmark DinoPacketView class")
+      benchDinoPacketView()
+
+   if((len(sys.argv) == 1) or ("DinoStateMachine" in sys.argv)):
+      printHeading("Benchmark DinoStateMachine class")
+      benchDinoStateMachine()
+
+   if((len(sys.argv) == 1) or ("DinoProfiler" in sys.argv)):
+      printHeading("Benchmark DinoProfiler class")
+      benchDinoProfiler()
+
+   if((len(sys.argv) == 1) or ("MainLoop" in sys.argv)):
+      printHeading("Benchmark main loop")
+      benchMainLoop()
+
+   if((len(sys.argv) == 1) or ("MainAsync" in sys.argv)):
+      printHeading("Benchmark main.py against mainasync.py")
+      benchMainAsync()
+
+   printHeading("End benchmark (" + strftime("%Y%m%d-%H%M%S") + ")")
@@ -1,4 +1,7 @@
+import time
+startImport = time.perf_counter()
 from DinoMain import *
+DinoImport.record("DinoMain", time.perf_counter() - startImport)
 
 if(__name__ == "__main__"):
    print("Start Dino Experiment.")
@@ -0,0 +1,9 @@
+import time
+startImport = time.perf_counter()
+from DinoAsyncMain import *
+DinoImport.record("DinoAsyncMain", time.perf_counter() - startImport)
+
+if(__name__ == "__main__"):
+   print("Start Dino Experiment (asyncio).")
+   DinoAsyncMain().run()
+   print("End Dino Experiment.")
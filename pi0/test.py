@@ -1,7 +1,10 @@
 from   time import *
+from   select import select
 import os
 import sys
 import csv
+import random
+import asyncio
 sys.path.append("../NanoLambda/wrappers/python")
 
 from DinoConstants import *  # Project constants
@@ -11,12 +14,28 @@ printHeading("Start initialization (" + strftime("%Y%m%d-%H%M%S") + ")")
 
 from DinoTime           import *  # Time keeping (Real-time + MET)
 from DinoLog            import *  # Logging features
+from DinoLogReader      import *  # Read binary data logs
+from DinoSegment        import *  # Preallocated log segments
+from DinoCompress       import *  # Background compression
 from DinoCamera         import *  # PiCamera interface
 from DinoEnvirophat     import *  # Envirophat interface
 from DinoServo          import *  # Servo interface
 from DinoSerial         import *  # Serial data interface
 from DinoThermalControl import *  # GPIO interface for heater and cooler
 from DinoSpectrometer   import *  # Spectrometer interface
+from DinoPacket         import *  # Serial packet schema
+from DinoFramer         import *  # Serial stream framing
+from DinoPacketView     import *  # Lazy packet access
+from DinoProfiler       import *  # Loop instrumentation
+from DinoStateMachine   import *  # Experiment states
+from DinoStartup        import *  # Concurrent device initialization
+from DinoImport         import *  # Lazy import of hardware libraries
+from DinoLogger         import *  # Leveled console/debug messages
+from DinoArchive        import *  # NumPy archive loader
+from DinoLogTailer      import *  # Follow a log while it is written
+from DinoShutdown       import *  # Stop devices within a deadline
+from DinoScheduler      import *  # Periodic jobs on a timing thread
+from DinoAsyncMain      import *  # Experiment on an asyncio event loop
 
 printHeading("End initialization (" + strftime("%Y%m%d-%H%M%S") + ")")
 printHeading("Start test (" + strftime("%Y%m%d-%H%M%S") + ")")
@@ -88,6 +107,88 @@ def testDinoTime():
    newMet = DinoTime.getMET()
    testEquals(testName, testDesc, newMet-refMet, 10.0, 0.01)
 
+   printSubheading(testName, "Simulated clock")
+
+   DinoTime.setClock(DinoSimClock())
+   testDesc = "MET continues when the clock is replaced."
+   testEquals(testName, testDesc, DinoTime.getMET(), newMet, 0.01)
+
+   testDesc = "Sleep for 1 hour advances the MET instantly."
+   refMet = DinoTime.getMET()
+   start  = perf_counter()
+   DinoTime.sleep(3600)
+   testEquals(testName, testDesc, DinoTime.getMET() - refMet, 3600.0, 0.001)
+   testDesc = "Real time for 1 hour of simulated time."
+   testLessThan(testName, testDesc, perf_counter() - start, 0.1)
+
+   # Threads wake up in the same order as in real time.
+   events = []
+   def sleeper(name, period, count):
+      for i in range(count):
+         DinoTime.sleep(period)
+         events.append((DinoTime.getMET() - refMet, name))
+   refMet  = DinoTime.getMET()
+   threads = [Thread(target=sleeper, args=("servo", 0.5, 20)), \
+              Thread(target=sleeper, args=("camera", 2.0, 5))]
+   for thread in threads:
+      thread.start()
+   for thread in threads:
+      thread.join()
+   testDesc = "Threads wake up in MET order."
+   mets = [met for (met, name) in events]
+   testIsTrue(testName, testDesc, mets == sorted(mets))
+   testDesc = "Last wake up at 10sec."
+   testEquals(testName, testDesc, events[-1][0], 10.0, 0.001)
+
+   testDesc = "Wait returns when another thread sets the event."
+   stopEvent = Event()
+   def stopper():
+      DinoTime.sleep(5)
+      stopEvent.set()
+   thread = Thread(target=stopper)
+   refMet = DinoTime.getMET()
+   thread.start()
+   testIsTrue(testName, testDesc, DinoTime.wait(stopEvent, 60))
+   thread.join()
+   testDesc = "Wait ends at the MET of the event."
+   testEquals(testName, testDesc, DinoTime.getMET() - refMet, 5.0, 0.001)
+
+   testDesc = "Coroutines sleep in simulated time."
+   refMet = DinoTime.getMET()
+   async def sleepers():
+      await asyncio.gather(DinoTime.sleepAsync(30), DinoTime.sleepAsync(60))
+   asyncio.run(sleepers())
+   testEquals(testName, testDesc, DinoTime.getMET() - refMet, 60.0, 0.001)
+
+   DinoTime.setClock(DinoClock())
+
+   printSubheading(testName, "Vehicle clock discipline")
+
+   testDesc = "MET in nanoseconds is an integer."
+   testIsTrue(testName, testDesc, isinstance(DinoTime.getMETNs(), int))
+
+   # Vehicle sends its time (10ms resolution) at 10Hz with a clock that
+   # gains 50ppm. Packets arrive 2-6ms later.
+   discipline = DinoClockDiscipline()
+   random.seed(0)
+   offset = 1234.5
+   drift  = 50e-6
+   for i in range(1200):
+      discipline.update(round(offset + i * 0.1, 2), (i * 0.1) / (1 + drift) + random.uniform(0.002, 0.006))
+   met = (1199 * 0.1) / (1 + drift)
+   testDesc = "Estimated drift."
+   testEquals(testName, testDesc, discipline.getDrift() * 1e6, 50.0, 10.0)
+   testDesc = "Estimated vehicle time within 1ms (plus the mean delay)."
+   testEquals(testName, testDesc, discipline.getVehicleTime(met + 0.004), offset + 119.9, 0.001)
+
+   testDesc = "Reject a late packet."
+   testIsFalse(testName, testDesc, discipline.update(offset + 119.9, met + 1.0))
+   testDesc = "Restart the fit after the vehicle clock steps."
+   status = [discipline.update(offset + 500.0 + i * 0.1, met + (i + 1) * 0.1) for i in range(DISCIPLINE_MAX_REJECTS)]
+   testIsTrue(testName, testDesc, (status[-1] == True) and (discipline.getStats()['resets'] == 1))
+   testDesc = "Offset after the step."
+   testEquals(testName, testDesc, discipline.getOffset(met), offset + 500.0 - met - 0.1, 0.001)
+
 
 def testDinoLog():
 
@@ -103,10 +204,376 @@ def testDinoLog():
    obj2 = DinoLog("results-diff-2")
    testEquals(testName, testDesc, obj1, obj2)
 
-   # Log message + data files
+   printSubheading(testName, "Concurrent logging")
+
+   # Log messages + data from several threads at the same time.
+   numThreads = 4
+   numEntries = 500
+   def logEntries(threadId):
+      for i in range(numEntries):
+         DinoLog.logMsg("Thread " + str(threadId) + ", message " + str(i))
+         DinoLog.logData([threadId, i, 1.5])
+   threads = [Thread(target=logEntries, args=(i,)) for i in range(numThreads)]
+   for thread in threads:
+      thread.start()
+   for thread in threads:
+      thread.join()
+
    # Attempt to close the file and ensure it is re-opened
-   # Parse back last 5 entries of each type and confirm they are working
-   
+   obj1.closeLog()
+   DinoLog.logMsg("Log re-opened")
+   DinoLog.flush()
+
+   # Parse back the entries of each type and confirm they are complete.
+   rows = [line.rstrip("\n").split(CSV_SEP) for line in DinoLogReader.readLog(obj1.getFilename())]
+   msgIds  = [int(row[2][1:]) for row in rows if row[2].startswith(EVENT_ID)]
+   dataIds = [int(row[2][1:]) for row in rows if row[2].startswith(DATA_ID)]
+
+   testDesc = "Every message written once with a unique id."
+   testEquals(testName, testDesc, len(set(msgIds)), len(msgIds))
+   testDesc = "Every data entry written once with a unique id."
+   testEquals(testName, testDesc, len(set(dataIds)), numThreads * numEntries)
+   testDesc = "Entries are not interleaved."
+   testIsTrue(testName, testDesc, all(len(row) == (4 if row[2].startswith(EVENT_ID) else 6) for row in rows))
+   testDesc = "Log re-opened after closeLog()."
+   testIsTrue(testName, testDesc, rows[-1][3] == "Log re-opened")
+
+   printSubheading(testName, "Binary data")
+
+   # Log data matching the columns, including missing values.
+   data = []
+   for i in range(100):
+      data.append([NR_STATE_LETTERS[i % len(NR_STATE_LETTERS)], 100.5 + i, -1.25, \
+         i, 2 * i, 3 * i, 4 * i, 20.123456, 101325.5 + i, 0.0, 0.1, None])
+   for row in data:
+      DinoLog.logData(row)
+   DinoLog.flush()
+
+   testDesc = "Read back each record."
+   records = list(DinoLogReader.readData(obj1.getDataFilename()))
+   testEquals(testName, testDesc, len(records), len(data))
+   testDesc = "Values and missing columns are preserved."
+   testIsTrue(testName, testDesc, [record[3] for record in records] == data)
+
+   testDesc = "Convert to the CSV layout of the text log."
+   csvPath = obj1.getFilename()[:-len(".txt")] + ".csv"
+   DinoLogReader.convertData(obj1.getDataFilename(), csvPath)
+   with open(csvPath, 'r') as fp:
+      rows = [line.rstrip("\n").split(CSV_SEP, 3) for line in fp]
+   expected = [CSV_SEP.join(('{0:.4f}'.format(i) if isinstance(i, float) else str(i)) for i in row) for row in data]
+   testIsTrue(testName, testDesc, [row[3] for row in rows] == expected)
+
+   testDesc = "Merge with the messages in the text log."
+   count = DinoLogReader.convertData(obj1.getDataFilename(), csvPath, obj1.getFilename())
+   with open(csvPath, 'r') as fp:
+      numLines = len(fp.readlines())
+   numLines = numLines - len(list(DinoLogReader.readLog(obj1.getFilename())))
+   testEquals(testName, testDesc, numLines, count)
+
+   printSubheading(testName, "Vehicle time")
+
+   testDesc = "Vehicle time is unknown before the first packet."
+   DinoTime.getDiscipline().reset()
+   DinoLog.logData(data[0])
+   DinoLog.flush()
+   record = list(DinoLogReader.readData(obj1.getDataFilename(), True))[-1]
+   testEquals(testName, testDesc, record[3], None)
+
+   testDesc = "Data records are tagged with the vehicle time."
+   DinoTime.syncVehicle(DinoTime.getMET() + 100.0)
+   DinoLog.logData(data[0])
+   DinoLog.flush()
+   record = list(DinoLogReader.readData(obj1.getDataFilename(), True))[-1]
+   testEquals(testName, testDesc, record[3] - record[2], 100.0, 0.001)
+   DinoTime.getDiscipline().reset()
+
+   testDesc = "Text log layout is unchanged."
+   DinoLog.logMsg("Vehicle time known", True)
+   rows = [line.rstrip("\n").split(CSV_SEP) for line in DinoLogReader.readLog(obj1.getFilename())]
+   testEquals(testName, testDesc, (len(rows[-1]), rows[-1][2][:1]), (4, EVENT_ID))
+
+   printSubheading(testName, "Throttled messages")
+
+   DinoLog.setThrottle("throttle-test", 0.5)
+   testDesc = "First message is logged."
+   testIsTrue(testName, testDesc, DinoLog.logThrottled("Throttle test", "throttle-test"))
+   testDesc = "Repeats within the window are counted."
+   logged = [DinoLog.logThrottled("Throttle test", "throttle-test") for i in range(99)]
+   testEquals(testName, testDesc, logged.count(True), 0)
+   sleep(0.6)
+   testDesc = "Next message after the window is logged with the count."
+   testIsTrue(testName, testDesc, DinoLog.logThrottled("Throttle test", "throttle-test"))
+   DinoLog.flush()
+   lines = [line for line in DinoLogReader.readLog(obj1.getFilename()) if ("Throttle test" in line)]
+   testEquals(testName, testDesc, len(lines), 2)
+   testIsTrue(testName, testDesc, lines[-1].rstrip("\n").endswith(LOG_REPEAT_TEMPLATE % ("Throttle test", 100, 0.6)))
+   testDesc = "Pending repeats are logged."
+   DinoLog.logThrottled("Throttle test", "throttle-test")
+   DinoLog.logRepeats()
+   DinoLog.flush()
+   lines = [line for line in DinoLogReader.readLog(obj1.getFilename()) if ("Throttle test" in line)]
+   testIsTrue(testName, testDesc, "(repeated 1x" in lines[-1])
+
+   printSubheading(testName, "Stop")
+
+   # Stop the writer thread while other threads are logging. Entries
+   # queued around the stop request must still be written.
+   numEntries = 2000
+   started    = Event()
+   def logStopEntries(threadId):
+      started.set()
+      for i in range(numEntries):
+         DinoLog.logMsg("Stop test " + str(threadId) + ", message " + str(i))
+   switchInterval = sys.getswitchinterval()
+   sys.setswitchinterval(1e-6)
+   threads = [Thread(target=logStopEntries, args=(i,)) for i in range(numThreads)]
+   for thread in threads:
+      thread.start()
+   started.wait()
+   DinoLog.stop()
+   for thread in threads:
+      thread.join()
+   sys.setswitchinterval(switchInterval)
+
+   testDesc = "No entry is lost when the writer stops."
+   DinoLog.flush()
+   lines = [line for line in DinoLogReader.readLog(obj1.getFilename()) if ("Stop test" in line)]
+   testEquals(testName, testDesc, len(lines), numThreads * numEntries)
+   testDesc = "Requests complete after the writer stopped."
+   testIsTrue(testName, testDesc, DinoLog.sync(1.0))
+
+
+def testDinoArchive():
+   # Test variables
+   testName = "DinoArchive"
+   testDesc = ""
+   states   = "ABC"
+   count    = 300
+
+   printSubheading(testName, "Load an archive")
+
+   # Log data for three flight states with a missing temperature.
+   startMet = DinoTime.getMET()
+   for i in range(count):
+      DinoLog.logData([states[i * len(states) // count], float(i), -1.25, \
+         i, 2 * i, 3 * i, 4 * i, None if (i % 10 == 0) else 20.5, 101325.5, 0.0, 0.1, 0.9])
+   DinoLog.logMsg("Archive test message")
+   DinoLog.logMsg("Archive test message\nwith a newline")
+   DinoLog.flush()
+
+   indexPath = DinoLog("test").getIndexFilename()
+   archive = DinoArchive(indexPath)
+   data = archive.getRange(startMet, float("inf"))
+   testDesc = "Load every record in the MET range."
+   testEquals(testName, testDesc, len(data), count)
+   testDesc = "Columns are named after the data."
+   testIsTrue(testName, testDesc, list(data['altitude']) == [float(i) for i in range(count)])
+   testDesc = "Missing values are NaN."
+   testEquals(testName, testDesc, int(np.isnan(data['temperature']).sum()), count // 10)
+   testDesc = "Events are separate from the data."
+   # MET of the events only has 2 decimals in the text log.
+   events = archive.getEventsRange(startMet - 0.01, float("inf"))
+   testIsTrue(testName, testDesc, "Archive test message" in list(events['msg']))
+   testDesc = "Newlines in messages are escaped."
+   testIsTrue(testName, testDesc, "Archive test message" + SAFE_NEWLINE + "with a newline" in list(events['msg']))
+
+   printSubheading(testName, "Flight state queries")
+
+   testDesc = "Periods of each flight state."
+   testEquals(testName, testDesc, "".join(state for (state, start, end) in archive.getStates()[-3:]), states)
+   testDesc = "Data of a flight state."
+   testIsTrue(testName, testDesc, list(archive.getState("C")['altitude'][-(count // 3):]) == \
+      [float(i) for i in range(2 * count // 3, count)])
+
+   printSubheading(testName, "Cache")
+
+   testDesc = "Second load uses the cache."
+   cached = DinoArchive(indexPath)
+   testIsTrue(testName, testDesc, cached.isCached())
+   testDesc = "Cache matches the archive."
+   testIsTrue(testName, testDesc, cached.getData().tobytes() == archive.getData().tobytes())
+   testDesc = "Cache is invalid once the archive changes."
+   DinoLog.logMsg("Archive test message")
+   DinoLog.flush()
+   testIsFalse(testName, testDesc, DinoArchive(indexPath).isCached())
+
+
+def testDinoLogTailer():
+   # Test variables
+   testName = "DinoLogTailer"
+   testDesc = ""
+   count    = 50
+
+   printSubheading(testName, "Follow the active log")
+
+   received = []
+   sampled  = []
+   DinoLog.flush()
+   tailer = DinoLogTailer(DinoLog("test").getIndexFilename())
+   tailer.subscribe(received.extend)
+   tailer.subscribe(sampled.extend, 1.0)
+
+   testDesc = "Nothing new when attaching at the end."
+   testEquals(testName, testDesc, tailer.poll(), 0)
+
+   for i in range(count):
+      DinoLog.logMsg("Tailer message " + str(i))
+      DinoLog.logData([NR_STATE_LETTERS[0], float(i), 0.0, 0, 0, 0, 0, 20.5, 101325.5, 0.0, 0.0, None])
+   DinoLog.flush()
+
+   testDesc = "Only new records are read."
+   testEquals(testName, testDesc, tailer.poll(), 2 * count)
+   testEquals(testName, testDesc, tailer.poll(), 0)
+   testDesc = "Messages are published in order."
+   messages = [record[3] for record in received if (record[0] == EVENT_ID)]
+   testIsTrue(testName, testDesc, messages == [("Tailer message " + str(i)) for i in range(count)])
+   testDesc = "Data columns are published."
+   data = [record[3] for record in received if (record[0] == DATA_ID)]
+   testIsTrue(testName, testDesc, [values[I_ALTITUDE] for values in data] == [float(i) for i in range(count)])
+   testIsTrue(testName, testDesc, data[0][I_ACCEL_Z] is None)
+   testDesc = "Downsampled subscriber gets every message and fewer data."
+   testEquals(testName, testDesc, len([record for record in sampled if (record[0] == EVENT_ID)]), count)
+   testLessThan(testName, testDesc, len([record for record in sampled if (record[0] == DATA_ID)]), count)
+
+   printSubheading(testName, "Follow new segments")
+
+   basePath = DinoLog.getFolder() + "/tailer"
+   index    = DinoSegmentIndex(basePath + INDEX_EXT)
+   segments = DinoSegmentFile(index, basePath, ".txt", maxSize=1000)
+   tailer   = DinoLogTailer(basePath + INDEX_EXT, fromEnd=False, maxBytes=400)
+   lines    = []
+   tailer.subscribe(lines.extend)
+   for i in range(count):
+      segments.write(("20200101-000000," + MET_TEMPLATE % i + ",E" + str(i + 1) + ",Segment " + str(i) + "\n").encode('ascii'), i, i)
+      if(i == count // 2):
+         # Lines that are not entries are skipped.
+         segments.write(b"continued message,a,b,c\n20200101-000000,x,E1,Bad MET\n", i, i)
+      if(i % 10 == 0):
+         segments.flush()
+         tailer.poll()
+   segments.close()
+   index.close()
+   while(tailer.isClosed() == False):
+      tailer.poll()
+   testDesc = "Every line is read across segments."
+   testEquals(testName, testDesc, [record[1] for record in lines], list(range(1, count + 1)))
+
+
+def testDinoSegment():
+   # Test variables
+   testName = "DinoSegment"
+   testDesc = ""
+   maxSize  = 1000
+   line     = b"20200101-000000,00000.00,E1,Segment test message\n"
+
+   printSubheading(testName, "Preallocated segments")
+
+   basePath = DinoLog.getFolder() + "/segments"
+   index = DinoSegmentIndex(basePath + INDEX_EXT)
+   segments = DinoSegmentFile(index, basePath, ".txt", maxSize=maxSize, maxPeriod=10.0)
+
+   testDesc = "Segment is preallocated."
+   segments.write(line, 0.0, 0.0)
+   segments.flush()
+   testEquals(testName, testDesc, os.path.getsize(segments.getFilename()), maxSize)
+
+   testDesc = "Start a new segment once full."
+   for i in range(1, 40):
+      segments.write(line, i * 0.1, i * 0.1)
+   segments.flush()
+   (entries, closed) = DinoSegmentIndex.read(basePath + INDEX_EXT)
+   testEquals(testName, testDesc, len(entries), 2)
+   testDesc = "Full segment is truncated to its data."
+   first = DinoSegmentIndex.getSegments(basePath + INDEX_EXT, ".txt")[0]
+   testEquals(testName, testDesc, os.path.getsize(first), entries[os.path.basename(first)][2])
+
+   testDesc = "Start a new segment after the maximum period."
+   segments.write(line, 20.0, 20.0)
+   segments.flush()
+   (entries, closed) = DinoSegmentIndex.read(basePath + INDEX_EXT)
+   testEquals(testName, testDesc, len(entries), 3)
+   testDesc = "Index records the MET range of each segment."
+   testEquals(testName, testDesc, list(entries.values())[1][0], 2.0, 0.5)
+
+   printSubheading(testName, "Recovery after a power cut")
+
+   # Leave a partial line that was never flushed and do not close.
+   segments.write(line[:20], 20.1, 20.1)
+   segments.flush()
+   segments.write(line, 20.2, 20.2)
+   testDesc = "Archive was not closed."
+   testIsFalse(testName, testDesc, DinoSegmentIndex.read(basePath + INDEX_EXT)[1])
+   testDesc = "Recover every segment."
+   testEquals(testName, testDesc, DinoSegmentIndex.recover(basePath + INDEX_EXT), 3)
+   testDesc = "Truncate to the last complete line."
+   with open(segments.getFilename(), 'rb') as fp:
+      data = fp.read()
+   testEquals(testName, testDesc, data, line)
+   testDesc = "Archive is closed after recovery."
+   testIsTrue(testName, testDesc, DinoSegmentIndex.read(basePath + INDEX_EXT)[1])
+
+
+def testDinoCompress():
+   # Test variables
+   testName = "DinoCompress"
+   testDesc = ""
+   lines    = [("20200101-000000,%08.2f,E1,Compress test message\n" % (i * 0.1)) for i in range(2000)]
+
+   printSubheading(testName, "Compress complete files")
+
+   DinoCompressor(COMPRESS_ZLIB)
+
+   path = DinoLog.getFolder() + "/compress.txt"
+   with open(path, 'w') as fp:
+      fp.write("".join(lines))
+   size = os.path.getsize(path)
+
+   testDesc = "Compressed file replaces the original."
+   DinoCompressor.submit(path)
+   stats = DinoCompressor.waitAll()
+   testIsFalse(testName, testDesc, os.path.exists(path))
+   testIsTrue(testName, testDesc, os.path.exists(path + COMPRESS_ZLIB))
+   testDesc = "Compressed file is smaller."
+   testIsTrue(testName, testDesc, os.path.getsize(path + COMPRESS_ZLIB) < size / 4)
+   testDesc = "Statistics include the file."
+   testIsTrue(testName, testDesc, stats['bytesIn'] >= size)
+
+   testDesc = "Read the compressed file with its original name."
+   testEquals(testName, testDesc, list(DinoLogReader.readLog(path)), lines)
+
+   printSubheading(testName, "Pause and resume")
+
+   path = DinoLog.getFolder() + "/compress-paused.txt"
+   with open(path, 'w') as fp:
+      fp.write("".join(lines))
+   DinoCompressor.pause()
+   DinoCompressor.submit(path)
+   sleep(0.5)
+   testDesc = "File is not compressed while paused."
+   testIsTrue(testName, testDesc, os.path.exists(path))
+   DinoCompressor.resume()
+   DinoCompressor.waitAll()
+   testDesc = "File is compressed after resume."
+   testIsFalse(testName, testDesc, os.path.exists(path))
+
+   printSubheading(testName, "Sealed segments")
+
+   basePath = DinoLog.getFolder() + "/compress-segments"
+   index = DinoSegmentIndex(basePath + INDEX_EXT)
+   segments = DinoSegmentFile(index, basePath, ".txt", maxSize=20000)
+   segments.setSealedHandler(DinoCompressor.submit)
+   for i in range(len(lines)):
+      segments.write(lines[i].encode('ascii'), i * 0.1, i * 0.1)
+   segments.flush()
+   DinoCompressor.waitAll()
+   paths = DinoSegmentIndex.getSegments(basePath + INDEX_EXT, ".txt")
+   testDesc = "Full segments are compressed."
+   testIsTrue(testName, testDesc, os.path.exists(paths[0] + COMPRESS_ZLIB))
+   testDesc = "Open segment is not compressed."
+   testIsTrue(testName, testDesc, os.path.exists(paths[-1]))
+   testDesc = "Read compressed and open segments together."
+   testEquals(testName, testDesc, list(DinoLogReader.readLog(paths)), lines)
+
 
 def testDinoCamera():
 
@@ -210,9 +677,9 @@ def testDinoCamera():
    testEquals(testName, testDesc, camObj.isRecording(), True)   
 
    if(status == True):
-      sleep(DinoCamera.MIN_DURATION * 4)
+      sleep(DinoCamera.MIN_DURATION * 4.5)
 
-   testDesc = "Check PiCamera recording mode (after 5 * MIN_DURATION)."
+   testDesc = "Check PiCamera recording mode (after 4.5 * MIN_DURATION)."
    testEquals(testName, testDesc, camObj.isRecording(), True)   
       
    stopRecMET = DinoTime.getMET()
@@ -223,8 +690,46 @@ def testDinoCamera():
    testDesc = "Recorded for more than 20 sec."
    testGreaterThan(testName, testDesc, (stopRecMET - startRecMET), 20.0)
 
+   # The file is split every MIN_DURATION without stopping the recording.
    testDesc = "Check number of recordings since boot."
-   testEquals(testName, testDesc, camObj.getNumRecordings(), 6)  
+   testEquals(testName, testDesc, camObj.getNumRecordings(), 7)  
+
+   printSubheading(testName, "Test pre-roll buffer")
+
+   testDesc = "Arm PiCamera with pre-roll > " + str(DinoCamera.MAX_PREROLL) + "."
+   testEquals(testName, testDesc, camObj.arm(DinoCamera.MAX_PREROLL + 1), False)
+
+   testDesc = "Arm PiCamera."
+   testEquals(testName, testDesc, camObj.arm(2.0), True)
+
+   testDesc = "Don't arm PiCamera twice."
+   testEquals(testName, testDesc, camObj.arm(2.0), False)
+
+   testDesc = "Check PiCamera is armed and not recording."
+   testEquals(testName, testDesc, (camObj.isArmed(), camObj.isRecording()), (True, False))
+
+   sleep(3)
+
+   testDesc = "PiCamera start recording with the pre-roll."
+   startRecMET = DinoTime.getMET()
+   status = camObj.startRecording(duration=DinoCamera.MIN_DURATION)
+   testEquals(testName, testDesc, status, True)
+
+   testDesc = "Check PiCamera is recording and not armed."
+   testEquals(testName, testDesc, (camObj.isArmed(), camObj.isRecording()), (False, True))
+
+   while(camObj.isRecording() == True):
+      sleep(1)
+
+   testDesc = "Check number of recordings since boot."
+   testEquals(testName, testDesc, camObj.getNumRecordings(), 8)
+
+   testDesc = "Arm PiCamera."
+   testEquals(testName, testDesc, camObj.arm(2.0), True)
+
+   testDesc = "PiCamera stop recording disarms."
+   camObj.stopRecording()
+   testEquals(testName, testDesc, camObj.isArmed(), False)
 
    
    
@@ -444,9 +949,775 @@ def testDinoSerial():
    
    printSubheading(testName, "Fail to read sync byte.")
    #TODO - Start loopback program that writes numbers
+
+   printSubheading(testName, "Read packets through a pseudo-terminal.")
+   # Only used for testing when the serial port is not connected.
+   # The port name given to the singleton is replaced by the pty.
+   master, slave = os.openpty()
+   rPort._DinoSerial__portName = os.ttyname(slave)
+
+   testDesc = "Start reading thread."
+   testIsTrue(testName, testDesc, rPort.startReading())
+
+   testDesc = "Don't start a second thread."
+   testIsFalse(testName, testDesc, rPort.startReading())
+
+   testDesc = "Defaults before any packet is received."
+   testEquals(testName, testDesc, rPort.readData()[NR_FLIGHT_STATE], "@")
+
+   with open("scenario/nff-packets.txt", "rb") as fp:
+      lines = [fp.readline() for i in range(DinoSerial.QUEUE_SIZE + 10)]
+   os.write(master, b"1.0,2\n" + lines[0] + lines[1][:20])
+   packet = rPort.getPacket(1.0)
+   testDesc = "Receive first packet after a resync."
+   testEquals(testName, testDesc, packet.getBytes(), lines[0].strip())
+
+   os.write(master, lines[1][20:])
+   packet = rPort.getPacket(1.0)
+   testDesc = "Receive packet split across two writes."
+   testEquals(testName, testDesc, packet.getBytes(), lines[1].strip())
+
+   os.write(master, b"".join(lines[2:]))
+   sleep(1)
+   testDesc = "Notify when packets are queued."
+   testEquals(testName, testDesc, len(select([rPort.fileno()], [], [], 0)[0]), 1)
+   packets = rPort.getPackets()
+   testDesc = "Clear notification once packets are read."
+   testEquals(testName, testDesc, len(select([rPort.fileno()], [], [], 0)[0]), 0)
+   testDesc = "Queue keeps the most recent packets."
+   testEquals(testName, testDesc, len(packets), DinoSerial.QUEUE_SIZE)
+   testDesc = "Last packet in the queue."
+   testEquals(testName, testDesc, packets[-1].getBytes(), lines[-1].strip())
+
+   testDesc = "Latest packet snapshot."
+   testEquals(testName, testDesc, rPort.getLatestPacket().getBytes(), lines[-1].strip())
+   testDesc = "Latest packet data."
+   testEquals(testName, testDesc, rPort.readData()[NR_EXP_TIME], float(lines[-1].split(b",")[NR_EXP_TIME]), 0.001)
+
+   stats = rPort.getStats()
+   testDesc = "Count overflows."
+   testEquals(testName, testDesc, stats['overflows'], 8)
+   testDesc = "Count discarded bytes."
+   testEquals(testName, testDesc, stats['discarded'], 6)
+
+   testDesc = "No packets left."
+   testEquals(testName, testDesc, rPort.getPacket(0.1), None)
+
+   testDesc = "Stop reading thread."
+   testIsTrue(testName, testDesc, rPort.stopReading())
+
+   testDesc = "Stop reading without a thread."
+   testIsTrue(testName, testDesc, rPort.stopReading())
+   os.close(master)
+   os.close(slave)
       
    
    
+def testDinoPacket():
+   # Test variables
+   testName = "DinoPacket"
+   testDesc = ""
+   nffLine = "F,177.06,339117.625000,-0.001068,0.000145,-0.002356,0.011023," + \
+             "0.000000,0.000000,0.000064,-0.000278,0.000074,0.000500,0.000000,0.000000,0,1,0,0,0,0"
+   habLine = "['G', 1234.5, 75000, 1.234, 0.5, 270.0, 0.012, -20.1, 5.2, " + \
+             ", ".join(["'0'"] * 12) + "]"
+
+   printSubheading(testName, "New Shepard layout")
+
+   record = PACKET_NFF.newRecord()
+   testDesc = "Decode well formatted packet."
+   testIsTrue(testName, testDesc, PACKET_NFF.decode(nffLine + "\n", record))
+   testDesc = "Check flight state."
+   testEquals(testName, testDesc, record[NR_FLIGHT_STATE], "F")
+   testDesc = "Check experiment time."
+   testEquals(testName, testDesc, record[NR_EXP_TIME], 177.06, 0.001)
+   testDesc = "Check altitude."
+   testEquals(testName, testDesc, record[NR_ALTITUDE], 339117.625, 0.001)
+   testDesc = "Check acceleration magnitude."
+   testEquals(testName, testDesc, record[NR_ACCELERATION], 0.011023, 0.000001)
+   testDesc = "Check RCS warning."
+   testEquals(testName, testDesc, record[NR_WARNING_RCS], 1)
+
+   testDesc = "Encoded packet matches the original."
+   testEquals(testName, testDesc, PACKET_NFF.encode(record), nffLine)
+
+   testDesc = "Reject packet with missing fields."
+   testIsFalse(testName, testDesc, PACKET_NFF.decode(nffLine[:-2], record))
+   testDesc = "Reject packet with invalid number."
+   testIsFalse(testName, testDesc, PACKET_NFF.decode(nffLine.replace("177.06", "17x.06"), record))
+   testDesc = "Record unchanged after rejected packet."
+   testEquals(testName, testDesc, record[NR_EXP_TIME], 177.06, 0.001)
+
+   printSubheading(testName, "HAB layout")
+
+   record = PACKET_HAB.newRecord()
+   testDesc = "Decode well formatted packet."
+   testIsTrue(testName, testDesc, PACKET_HAB.decode(habLine + "\n\r", record))
+   testDesc = "Check flight state."
+   testEquals(testName, testDesc, record[NR_FLIGHT_STATE], "G")
+   testDesc = "Check altitude."
+   testEquals(testName, testDesc, record[NR_ALTITUDE], 75000)
+   testDesc = "Check temperature."
+   testEquals(testName, testDesc, record[HAB_TEMPERATURE], -20.1, 0.001)
+   testDesc = "Encoded packet matches the original."
+   testEquals(testName, testDesc, PACKET_HAB.encode(record), habLine)
+
+
+def testDinoFramer():
+   # Test variables
+   testName = "DinoFramer"
+   testDesc = ""
+   packet1 = b"@,0.06,59.114758"
+   packet2 = b"A,0.16,59.113682"
+
+   printSubheading(testName, "Split reads into packets")
+
+   framer = DinoFramer(NR_STATE_LETTERS)
+   testDesc = "Two packets in a single read."
+   packets = framer.feed(packet1 + b"\n" + packet2 + b"\n")
+   testEquals(testName, testDesc, packets, [packet1, packet2])
+
+   testDesc = "One and a half packets in a single read."
+   packets = framer.feed(packet1 + b"\n" + packet2[:5])
+   testEquals(testName, testDesc, packets, [packet1])
+
+   testDesc = "Partial packet completed by the next read."
+   packets = framer.feed(packet2[5:] + b"\n")
+   testEquals(testName, testDesc, packets, [packet2])
+
+   testDesc = "No packets on an empty read."
+   testEquals(testName, testDesc, framer.feed(b""), [])
+
+   printSubheading(testName, "Resync on sync characters")
+
+   testDesc = "Discard bytes before a sync character."
+   packets = framer.feed(b"9,1.2\n\x00" + packet1 + b"\n")
+   testEquals(testName, testDesc, packets, [packet1])
+
+   stats = framer.getStats()
+   testDesc = "Count packets."
+   testEquals(testName, testDesc, stats['packets'], 5)
+   testDesc = "Count resyncs."
+   testEquals(testName, testDesc, stats['resyncs'], 1)
+   testDesc = "Count discarded bytes."
+   testEquals(testName, testDesc, stats['discarded'], 7)
+
+   testDesc = "HAB packets with the sync character after a prefix."
+   framer = DinoFramer(NR_STATE_LETTERS, PACKET_HAB.syncOffset)
+   packets = framer.feed(b"x['@', 1]\n\r['A', 2]\n\r")
+   testEquals(testName, testDesc, packets, [b"['@', 1]", b"['A', 2]"])
+
+
+def testDinoPacketView():
+   # Test variables
+   testName = "DinoPacketView"
+   testDesc = ""
+   nffLine = b"F,177.06,339117.625000,-0.001068,0.000145,-0.002356,0.011023," + \
+             b"0.000000,0.000000,0.000064,-0.000278,0.000074,0.000500,0.000000,0.000000,0,1,0,0,0,0"
+
+   printSubheading(testName, "Lazy access to fields")
+
+   view = DinoPacketView(PACKET_NFF, nffLine)
+   testDesc = "Packet with all fields is valid."
+   testIsTrue(testName, testDesc, view.isValid())
+   testDesc = "Check flight state."
+   testEquals(testName, testDesc, view.getState(), "F")
+   testDesc = "Check flight state byte."
+   testEquals(testName, testDesc, view.getStateByte(), ord("F"))
+   testDesc = "Check acceleration magnitude."
+   testEquals(testName, testDesc, view.get(NR_ACCELERATION), 0.011023, 0.000001)
+   testDesc = "Check altitude after a later field."
+   testEquals(testName, testDesc, view.get(NR_ALTITUDE), 339117.625, 0.001)
+   testDesc = "Check last warning."
+   testEquals(testName, testDesc, view.get(NR_WARNING_FAULT), 0)
+
+   testDesc = "Full record matches the schema decoder."
+   record = PACKET_NFF.newRecord()
+   PACKET_NFF.decode(nffLine.decode("utf-8"), record)
+   testEquals(testName, testDesc, view.toRecord(PACKET_NFF.newRecord()), record)
+
+   printSubheading(testName, "Malformed packets")
+
+   testDesc = "Packet with missing fields is invalid."
+   testIsFalse(testName, testDesc, DinoPacketView(PACKET_NFF, nffLine[:-2]).isValid())
+   testDesc = "Field that cannot be converted returns None."
+   view = DinoPacketView(PACKET_NFF, nffLine.replace(b"177.06", b"17x.06"))
+   testEquals(testName, testDesc, view.get(NR_EXP_TIME), None)
+
+
+def testDinoProfiler():
+   # Test variables
+   testName = "DinoProfiler"
+   testDesc = ""
+
+   printSubheading(testName, "Initialization")
+
+   testDesc = "Initialize class"
+   prof = DinoProfiler()
+   testNotNone(testName, testDesc, prof)
+
+   testDesc = "Test singleton"
+   obj2 = DinoProfiler()
+   testEquals(testName, testDesc, obj2, prof)
+
+   printSubheading(testName, "Histograms")
+   # Start a new summary period.
+   DinoProfiler.logSummary()
+
+   # 90 samples of 150usec and 10 samples of 3msec.
+   for i in range(90):
+      DinoProfiler.stop("test", perf_counter_ns() - 150000)
+   for i in range(10):
+      DinoProfiler.stop("test", perf_counter_ns() - 3000000)
+   for i in range(5):
+      DinoProfiler.countLoop()
+   summary = DinoProfiler.getSummary()
+
+   testDesc = "Count samples."
+   testEquals(testName, testDesc, summary['phases']['test']['count'], 100)
+   testDesc = "p50 is the upper limit of its bucket."
+   testEquals(testName, testDesc, summary['phases']['test']['p50'], 200)
+   testDesc = "p95 is limited to the maximum."
+   testEquals(testName, testDesc, summary['phases']['test']['p95'], 3000, 500)
+   testDesc = "Record maximum."
+   testEquals(testName, testDesc, summary['phases']['test']['max'], 3000, 500)
+   testDesc = "Compute loop rate."
+   testGreaterThan(testName, testDesc, summary['loopRate'], 0.0)
+
+   testDesc = "Log summary returns the same statistics."
+   logged = DinoProfiler.logSummary()
+   testEquals(testName, testDesc, logged['phases']['test']['count'], 100)
+
+   testDesc = "Start a new summary period after logging."
+   summary = DinoProfiler.getSummary()
+   testEquals(testName, testDesc, summary['phases']['test']['count'], 0)
+
+   printSubheading(testName, "Phases added by another thread")
+
+   # Switch threads often such that phases are added during the summaries.
+   switchInterval = sys.getswitchinterval()
+   sys.setswitchinterval(1e-6)
+   def addPhases():
+      for i in range(1000):
+         DinoProfiler.stop("thread" + str(i), perf_counter_ns())
+   thread = Thread(target=addPhases)
+   thread.start()
+   status = True
+   while(status == True):
+      status = thread.is_alive()
+      DinoProfiler.getSummary()
+   thread.join()
+   sys.setswitchinterval(switchInterval)
+   testDesc = "Every phase added during the summaries."
+   testEquals(testName, testDesc, len([phase for phase in DinoProfiler.getSummary()['phases'] if phase.startswith("thread")]), 1000)
+   DinoProfiler.logSummary()
+
+
+def testDinoStateMachine():
+   # Test variables
+   testName = "DinoStateMachine"
+   testDesc = ""
+   numStarts = [0]
+
+   def countStart():
+      numStarts[0] = numStarts[0] + 1
+
+   printSubheading(testName, "Nominal flight")
+
+   sm = DinoStateMachine()
+   sm.registerAction(DINO_STATE_INIT, DINO_STATE_START_EXP, countStart)
+
+   testDesc = "Initial state."
+   testEquals(testName, testDesc, sm.getState(), DINO_STATE_INIT)
+   testDesc = "Stay in INIT before coast."
+   testEquals(testName, testDesc, sm.update(ord("E")), DINO_STATE_INIT)
+   testDesc = "Start experiment at coast start."
+   testEquals(testName, testDesc, sm.update(ord("F")), DINO_STATE_START_EXP)
+   testDesc = "Run start action."
+   testEquals(testName, testDesc, numStarts[0], 1)
+   testDesc = "Experiment in progress during coast."
+   testEquals(testName, testDesc, sm.update(ord("G")), DINO_STATE_EXPERIMENT)
+   testDesc = "End experiment at coast end."
+   testEquals(testName, testDesc, sm.update(ord("H")), DINO_STATE_END_EXP)
+   testDesc = "Finish at touchdown."
+   testEquals(testName, testDesc, sm.update(ord("K")), DINO_STATE_FINISHED)
+   testDesc = "Record previous state."
+   testEquals(testName, testDesc, sm.getPrevState(), DINO_STATE_END_EXP)
+   testDesc = "Record each transition."
+   testEquals(testName, testDesc, [t[:2] for t in sm.getTransitions()], \
+      [(DINO_STATE_INIT, DINO_STATE_START_EXP), (DINO_STATE_START_EXP, DINO_STATE_EXPERIMENT), \
+       (DINO_STATE_EXPERIMENT, DINO_STATE_END_EXP), (DINO_STATE_END_EXP, DINO_STATE_FINISHED)])
+
+   printSubheading(testName, "Off-nominal flight states")
+
+   sm = DinoStateMachine()
+   numStarts[0] = 0
+   sm.registerAction(DINO_STATE_INIT, DINO_STATE_START_EXP, countStart)
+
+   testDesc = "Ignore bytes that are not a flight state."
+   testEquals(testName, testDesc, sm.update(ord("Z")), DINO_STATE_INIT)
+   testDesc = "Count invalid flight states."
+   testEquals(testName, testDesc, sm.getNumInvalid(), 1)
+
+   sm.update(ord("F"))
+   sm.update(ord("@"))
+   testDesc = "Return to INIT on a pre-coast flight state."
+   testEquals(testName, testDesc, sm.getState(), DINO_STATE_INIT)
+   sm.update(ord("F"))
+   testDesc = "Re-enter START_EXP."
+   testEquals(testName, testDesc, sm.getState(), DINO_STATE_START_EXP)
+   testDesc = "Start action only runs once."
+   testEquals(testName, testDesc, numStarts[0], 1)
+
+   printSubheading(testName, "Replay a flight")
+
+   sm = DinoStateMachine()
+   testDesc = "Replay flight states."
+   testEquals(testName, testDesc, sm.replay(b"@@EFFGGHIJK"), DINO_STATE_FINISHED)
+   testDesc = "Record previous state."
+   testEquals(testName, testDesc, sm.getPrevState(), DINO_STATE_END_EXP)
+   testDesc = "Record each transition."
+   testEquals(testName, testDesc, len(sm.getTransitions()), 4)
+
+
+def testDinoStartup():
+   # Test variables
+   testName = "DinoStartup"
+   testDesc = ""
+   initTime = 0.5
+
+   def slowDevice():
+      sleep(initTime)
+      return "slow"
+
+   def failedDevice():
+      raise IOError("Device not connected")
+
+   printSubheading(testName, "Initialize devices concurrently")
+
+   start = perf_counter()
+   startup = DinoStartup()
+   startup.start("fast", lambda: "fast")
+   for i in range(3):
+      startup.start("slow" + str(i), slowDevice)
+   startup.start("failed", failedDevice)
+
+   testDesc = "Get a fast device without waiting for slow ones."
+   testEquals(testName, testDesc, startup.get("fast"), "fast")
+   testDesc = "Slow device is not ready yet."
+   testIsFalse(testName, testDesc, startup.isReady("slow0"))
+   testDesc = "Wait for a slow device."
+   testEquals(testName, testDesc, startup.get("slow0"), "slow")
+   testDesc = "Failed device returns None."
+   testEquals(testName, testDesc, startup.get("failed"), None)
+
+   testDesc = "Devices are initialized concurrently."
+   lastReady = startup.waitAll()
+   testLessThan(testName, testDesc, lastReady, 2 * initTime)
+   testDesc = "Record initialization time of each device."
+   testEquals(testName, testDesc, startup.getInitTimes()["slow2"], initTime, 0.1)
+
+   printSubheading(testName, "Defer devices until first use")
+   startup = DinoStartup()
+   startup.defer("deferred", lambda: "deferred")
+   startup.defer("prewarmed", slowDevice)
+
+   testDesc = "Deferred device is not started."
+   testIsFalse(testName, testDesc, startup.isReady("deferred"))
+   testDesc = "Deferred device is created on first use."
+   testEquals(testName, testDesc, startup.get("deferred"), "deferred")
+   testDesc = "Prewarm a deferred device in the background."
+   startup.prewarm("prewarmed")
+   testIsFalse(testName, testDesc, startup.isReady("prewarmed"))
+   testEquals(testName, testDesc, startup.get("prewarmed"), "slow")
+   startup.defer("unused", lambda: "unused")
+   startup.waitAll()
+
+   testDesc = "Deferred device used after waitAll() returns None."
+   testEquals(testName, testDesc, startup.get("unused"), None)
+   testDesc = "Unknown device returns None."
+   testEquals(testName, testDesc, startup.get("missing"), None)
+
+   printSubheading(testName, "Get a device while it is prewarmed")
+
+   # Switch threads often such that get() runs during prewarm().
+   switchInterval = sys.getswitchinterval()
+   sys.setswitchinterval(1e-6)
+   numRaces = 200
+   devices  = []
+   for i in range(numRaces):
+      startup = DinoStartup()
+      startup.defer("device", lambda: "device")
+      threads = [Thread(target=lambda: startup.prewarm("device"))] + \
+                [Thread(target=lambda: devices.append(startup.get("device"))) for j in range(3)]
+      for thread in threads:
+         thread.start()
+      for thread in threads:
+         thread.join()
+      startup.waitAll()
+   sys.setswitchinterval(switchInterval)
+   testDesc = "Every get() returns the device."
+   testEquals(testName, testDesc, devices.count("device"), 3 * numRaces)
+
+
+def testDinoImport():
+   # Test variables
+   testName = "DinoImport"
+   testDesc = ""
+
+   printSubheading(testName, "Load modules on first use")
+
+   testDesc = "Load a module."
+   module = DinoImport.load("colorsys")
+   testEquals(testName, testDesc, module.__name__, "colorsys")
+
+   testDesc = "Copy public names into a namespace."
+   namespace = {}
+   DinoImport.load("colorsys", namespace=namespace)
+   testIsTrue(testName, testDesc, ("rgb_to_hsv" in namespace) and ("__name__" not in namespace))
+
+   testDesc = "Missing module returns None."
+   testEquals(testName, testDesc, DinoImport.load("dino_missing_module", "Missing module"), None)
+
+   testDesc = "Report time taken by each import."
+   report = dict(DinoImport.getReport())
+   testIsTrue(testName, testDesc, ("colorsys" in report) and ("dino_missing_module" not in report))
+
+
+def testDinoShutdown():
+   # Test variables
+   testName = "DinoShutdown"
+   testDesc = ""
+   deadline = 0.2
+
+   printSubheading(testName, "Stop within the deadline")
+
+   # Threads that stop as soon as they are signalled, like the devices.
+   events  = [Event() for i in range(3)]
+   threads = [Thread(target=event.wait, args=(10.0,)) for event in events]
+   for thread in threads:
+      thread.start()
+   def stopThread(i, timeout):
+      events[i].set()
+      threads[i].join(timeout)
+      return threads[i].is_alive() == False
+
+   shutdown = DinoShutdown(deadline)
+   for i in range(len(threads)):
+      shutdown.register("thread" + str(i), lambda timeout, i=i: stopThread(i, timeout))
+   start  = perf_counter()
+   missed = shutdown.run("TEST")
+   testDesc = "All components stopped."
+   testEquals(testName, testDesc, len(missed), 0)
+   testDesc = "Shutdown time (including fsync) is within the deadline."
+   testLessThan(testName, testDesc, perf_counter() - start, deadline)
+
+   printSubheading(testName, "Report components that miss the deadline")
+
+   shutdown = DinoShutdown(deadline)
+   shutdown.register("fast", lambda timeout: True)
+   shutdown.register("slow", lambda timeout: (sleep(timeout) or False))
+   start  = perf_counter()
+   missed = shutdown.run("TEST")
+   testDesc = "Slow component is reported."
+   testIsTrue(testName, testDesc, "slow" in missed)
+   testDesc = "Fast component is not reported."
+   testIsFalse(testName, testDesc, "fast" in missed)
+   testDesc = "Do not wait past the deadline."
+   testLessThan(testName, testDesc, perf_counter() - start, deadline + 0.1)
+
+   printSubheading(testName, "SIGTERM")
+
+   called = []
+   shutdown = DinoShutdown(deadline)
+   testDesc = "Install the signal handler."
+   testIsTrue(testName, testDesc, shutdown.installSignalHandler(lambda: called.append(True)))
+   os.kill(os.getpid(), signal.SIGTERM)
+   sleep(0.1)
+   testDesc = "Shutdown runs on SIGTERM."
+   testEquals(testName, testDesc, len(called), 1)
+   signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def testDinoScheduler():
+   # Test variables
+   testName = "DinoScheduler"
+   testDesc = ""
+   period   = 0.05
+
+   printSubheading(testName, "Initialization")
+
+   testDesc = "Initialize class"
+   scheduler = DinoScheduler()
+   testNotNone(testName, testDesc, scheduler)
+
+   testDesc = "Test singleton"
+   testEquals(testName, testDesc, DinoScheduler(), scheduler)
+
+   printSubheading(testName, "Periodic job")
+
+   # Work that takes 40% of the period must not stretch the period.
+   runs = []
+   job = scheduler.schedule("test", lambda: (runs.append(DinoTime.getMET()) or sleep(period * 0.4)), period)
+   sleep(period * 20.5)
+   testDesc = "Job is active."
+   testIsTrue(testName, testDesc, job.isActive())
+   start = perf_counter()
+   testDesc = "Cancel the job."
+   testIsTrue(testName, testDesc, job.cancel(1.0))
+   testDesc = "Cancel returns within a run of the job."
+   testLessThan(testName, testDesc, perf_counter() - start, period)
+   testDesc = "Job is not active."
+   testIsFalse(testName, testDesc, job.isActive())
+   testDesc = "Ran once per period (21 runs)."
+   testInRange(testName, testDesc, len(runs), 20, 22)
+   testDesc = "No drift over 20 periods (sec)."
+   testLessThan(testName, testDesc, abs((runs[-1] - runs[0]) - (len(runs) - 1) * period), 0.01)
+   stats = job.getStats()
+   testDesc = "Statistics count the runs."
+   testEquals(testName, testDesc, stats['runs'], len(runs))
+   testDesc = "No overruns."
+   testEquals(testName, testDesc, stats['overruns'], 0)
+   testDesc = "Maximum duration of the runs (sec)."
+   testGreaterThan(testName, testDesc, stats['durationMax'], period * 0.4)
+
+   printSubheading(testName, "Stop a long period")
+
+   job = scheduler.schedule("slow", lambda: True, 10.0)
+   sleep(0.1)
+   start = perf_counter()
+   testDesc = "Cancel the job."
+   testIsTrue(testName, testDesc, job.cancel())
+   testDesc = "Stop in milliseconds instead of the period."
+   testLessThan(testName, testDesc, perf_counter() - start, 0.01)
+
+   printSubheading(testName, "Overruns and faults")
+
+   job = scheduler.schedule("overrun", lambda: sleep(period * 2.5), period)
+   sleep(period * 10)
+   job.cancel()
+   stats = job.getStats()
+   testDesc = "Runs longer than the period skip deadlines."
+   testGreaterThan(testName, testDesc, stats['overruns'], 0)
+   testDesc = "Skipped deadlines are not run late."
+   testLessThan(testName, testDesc, stats['runs'], 6)
+
+   faults = []
+   job = scheduler.schedule("fault", lambda: (faults.append(True) or False), period)
+   sleep(period * 4)
+   testDesc = "Job ends when its function returns False."
+   testIsFalse(testName, testDesc, job.isActive())
+   testDesc = "Job ran once."
+   testEquals(testName, testDesc, len(faults), 1)
+
+   once  = []
+   start = DinoTime.getMET()
+   job   = scheduler.schedule("once", lambda: once.append(DinoTime.getMET()), None, period)
+   sleep(period * 4)
+   testDesc = "One-shot job ran once."
+   testEquals(testName, testDesc, len(once), 1)
+   testDesc = "One-shot job ran after the delay."
+   testGreaterThanOrEquals(testName, testDesc, once[0] - start, period)
+
+   printSubheading(testName, "Simulated clock")
+
+   DinoTime.setClock(DinoSimClock())
+   simRuns = []
+   job = scheduler.schedule("sim", lambda: simRuns.append(DinoTime.getMET()), 1.0)
+   DinoTime.sleep(10.5)
+   job.cancel()
+   DinoTime.setClock(DinoClock())
+   testDesc = "Ran once per simulated period (11 runs)."
+   testEquals(testName, testDesc, len(simRuns), 11)
+   testDesc = "No jitter on a simulated clock."
+   testEquals(testName, testDesc, job.getStats()['jitterMax'], 0.0)
+
+   testDesc = "Log the statistics."
+   scheduler.logStats()
+   testIsTrue(testName, testDesc, True)
+
+
+def testDinoAsyncMain():
+   # Test variables
+   testName = "DinoAsyncMain"
+   testDesc = ""
+   events   = []  # Camera and log sync calls in order.
+   captures = []  # MET of each spectrum.
+   stops    = []  # MET of the end of the camera files.
+   resumed  = []  # Compression running at the end of the camera files.
+
+   class FakeCamera(object):
+      openTime = 0.0
+      def startFile(self):
+         sleep(self.openTime)
+         events.append("start")
+         return True
+      def splitFile(self):
+         events.append("split")
+         return True
+      def stopFile(self):
+         events.append("stop")
+         stops.append(DinoTime.getMET())
+         resumed.append(DinoCompressor._DinoCompressor__resume.is_set())
+         return True
+      def stopRecording(self, timeout=None):
+         return False
+
+   class FakeSpectrometer(object):
+      def captureOnce(self):
+         captures.append(DinoTime.getMET())
+         return True
+      def stopCapturing(self, timeout=None):
+         return False
+
+   def logSync(timeout=None):
+      events.append("sync")
+      return logSyncOrig(timeout)
+
+   printSubheading(testName, "Replay a flight on a simulated clock")
+
+   # Packets from the scenario with the flight state replaced: pre-coast,
+   # coast (START_EXP), back to pre-coast (INIT) as after a corrupted 
+   # flight state, descent (END_EXP) and landed (FINISHED).
+   with open("scenario/nff-packets.txt", "rb") as fp:
+      fields = fp.readline().strip().split(b",")
+   states = b"@" * 10 + b"F" * 400 + b"@" * 5 + b"I" * 50 + b"K"
+   lines  = []
+   for i in range(len(states)):
+      fields[NR_FLIGHT_STATE] = states[i:i + 1]
+      fields[NR_EXP_TIME]     = ('{0:.2f}'.format(i * 0.1)).encode('ascii')
+      lines.append(b",".join(fields) + b"\n")
+
+   DinoTime.setClock(DinoSimClock())
+   logSyncOrig  = DinoLog.sync
+   DinoLog.sync = staticmethod(logSync)
+   master, slave = os.openpty()
+
+   testDesc = "Initialize class"
+   main = DinoAsyncMain()
+   testNotNone(testName, testDesc, main)
+   main._startup.defer("camera", FakeCamera)
+   main._startup.defer("spectrometer", FakeSpectrometer)
+   main._startup.get("serial")._DinoSerial__portName = os.ttyname(slave)
+
+   def writer():
+      DinoTime.sleep(0.5)
+      for line in lines:
+         os.write(master, line)
+         DinoTime.sleep(0.1)
+   Thread(target=writer, daemon=True).start()
+   main.run()
+   DinoLog.sync = logSyncOrig
+   DinoTime.setClock(DinoClock())
+   os.close(master)
+   os.close(slave)
+
+   testDesc = "Test ends on the landed state."
+   testIsTrue(testName, testDesc, main._endTest)
+   testDesc = "Camera file split every CAMERA_REC_DURATION."
+   testEquals(testName, testDesc, events.count("split"), 1)
+   testDesc = "Spectrometer captured during the experiment."
+   testGreaterThanOrEquals(testName, testDesc, len(captures), 4)
+
+   printSubheading(testName, "Stop the experiment")
+
+   testDesc = "Experiment tasks ended on END_EXP."
+   testIsTrue(testName, testDesc, all(task.done() for task in main._expTasks))
+   testDesc = "No captures after END_EXP."
+   testLessThan(testName, testDesc, captures[-1], stops[-1])
+   testDesc = "Camera file closed once."
+   testEquals(testName, testDesc, events.count("stop"), 1)
+   testDesc = "Camera file closed before the log sync."
+   testEquals(testName, testDesc, events[:events.index("sync") + 1][-2:], ["stop", "sync"])
+   testDesc = "Log synced on END_EXP and FINISHED."
+   testEquals(testName, testDesc, events.count("sync"), 2)
+   testDesc = "Compression resumed after the experiment returned to INIT."
+   testEquals(testName, testDesc, resumed, [True])
+
+   printSubheading(testName, "Cancel while the camera file is opened")
+
+   async def cancelRecording(camera):
+      main._loop     = asyncio.get_running_loop()
+      main._executor = ThreadPoolExecutor(max_workers=1)
+      task = main._loop.create_task(main._recordTask(camera))
+      await asyncio.sleep(camera.openTime / 2)
+      task.cancel()
+      await asyncio.gather(task, return_exceptions=True)
+      main._executor.shutdown(wait=True)
+
+   del events[:]
+   camera = FakeCamera()
+   camera.openTime = 0.5
+   asyncio.run(cancelRecording(camera))
+   testDesc = "Camera file opened during the cancellation is closed."
+   testEquals(testName, testDesc, events, ["start", "stop"])
+
+   printSubheading(testName, "Corrupted packets")
+
+   testDesc = "Reject a packet with a corrupted numeric field."
+   fields[NR_ALTITUDE] = b"59.11x4758"
+   view = DinoPacketView(PACKET_LAYOUT, b",".join(fields))
+   numRejected = main._numRejected
+   testIsFalse(testName, testDesc, main._processPacket(view))
+   testDesc = "Count the rejected packet."
+   testEquals(testName, testDesc, main._numRejected, numRejected + 1)
+   testDesc = "Rejected packet is not used."
+   testIsFalse(testName, testDesc, main._view is view)
+
+
+def testDinoLogger():
+   # Test variables
+   testName = "DinoLogger"
+   testDesc = ""
+
+   printSubheading(testName, "Leveled messages")
+
+   logger = DinoLogger.get("TestLogger")
+   testDesc = "Same logger for a module."
+   testEquals(testName, testDesc, DinoLogger.get("TestLogger"), logger)
+
+   class Counter(object):
+      count = 0
+      def __str__(self):
+         Counter.count = Counter.count + 1
+         return "counter"
+
+   testDesc = "Disabled level is not formatted."
+   DinoLogger.setLevel(LOGGER_INFO, "TestLogger")
+   logger.debug("Debug message %s", Counter())
+   testEquals(testName, testDesc, Counter.count, 0)
+   testIsFalse(testName, testDesc, logger.isEnabled(LOGGER_DEBUG))
+
+   testDesc = "Enabled level is written to the log."
+   logger.info("Info message %s", Counter())
+   DinoLog.flush()
+   lines = [line for line in DinoLogReader.readLog(DinoLog("test").getFilename()) if ("TestLogger" in line)]
+   testEquals(testName, testDesc, Counter.count, 1)
+   testIsTrue(testName, testDesc, (len(lines) == 1) and lines[0].endswith("INFO - TestLogger: Info message counter\n"))
+
+   testDesc = "Level can be changed at runtime."
+   DinoLogger.setLevel(LOGGER_DEBUG, "TestLogger")
+   logger.debug("Debug message %s", Counter())
+   testEquals(testName, testDesc, Counter.count, 2)
+
+   testDesc = "No sinks disables every level."
+   DinoLogger.setSinks(0)
+   logger.error("Error message %s", Counter())
+   testEquals(testName, testDesc, Counter.count, 2)
+   DinoLogger.setSinks(LOGGER_SINKS)
+
+   printSubheading(testName, "Performance")
+
+   DinoLogger.setLevel(LOGGER_INFO, "TestLogger")
+   numCalls = 100000
+   start = perf_counter()
+   for i in range(numCalls):
+      logger.debug("Packet %s", i)
+   elapsed = (perf_counter() - start) / numCalls
+   testDesc = "Disabled message takes less than 1us."
+   testLessThan(testName, testDesc, elapsed, 1e-6)
+
+
 def testDinoSpectrometer():
    # Test variables
    testName = "DinoSpectrometer"
@@ -460,7 +1731,7 @@ def testDinoSpectrometer():
 if(__name__ == "__main__"):
    # Initialize time system
    DinoTime()
-   DinoLog("test")
+   DinoLog("test", I_COLUMNS)
 
    if((len(sys.argv) == 1) or ("DinoTime" in sys.argv)):
       printHeading("Test DinoTime class")
@@ -469,7 +1740,23 @@ if(__name__ == "__main__"):
    if((len(sys.argv) == 1) or ("DinoLog" in sys.argv)):
       printHeading("Test DinoLog class")
       testDinoLog()
+
+   if((len(sys.argv) == 1) or ("DinoArchive" in sys.argv)):
+      printHeading("Test DinoArchive class")
+      testDinoArchive()
+
+   if((len(sys.argv) == 1) or ("DinoLogTailer" in sys.argv)):
+      printHeading("Test DinoLogTailer class")
+      testDinoLogTailer()
+
+   if((len(sys.argv) == 1) or ("DinoSegment" in sys.argv)):
+      printHeading("Test DinoSegment class")
+      testDinoSegment()
       
+   if((len(sys.argv) == 1) or ("DinoCompress" in sys.argv)):
+      printHeading("Test DinoCompress class")
+      testDinoCompress()
+
    if((len(sys.argv) == 1) or ("DinoCamera" in sys.argv)):
       printHeading("Test DinoCamera class")
       testDinoCamera()
@@ -490,6 +1777,50 @@ if(__name__ == "__main__"):
       printHeading("Test DinoSerial class")
       testDinoSerial()
 
+   if((len(sys.argv) == 1) or ("DinoPacket" in sys.argv)):
+      printHeading("Test DinoPacket class")
+      testDinoPacket()
+
+   if((len(sys.argv) == 1) or ("DinoFramer" in sys.argv)):
+      printHeading("Test DinoFramer class")
+      testDinoFramer()
+
+   if((len(sys.argv) == 1) or ("DinoPacketView" in sys.argv)):
+      printHeading("Test DinoPacketView class")
+      testDinoPacketView()
+
+   if((len(sys.argv) == 1) or ("DinoProfiler" in sys.argv)):
+      printHeading("Test DinoProfiler class")
+      testDinoProfiler()
+
+   if((len(sys.argv) == 1) or ("DinoStateMachine" in sys.argv)):
+      printHeading("Test DinoStateMachine class")
+      testDinoStateMachine()
+
+   if((len(sys.argv) == 1) or ("DinoStartup" in sys.argv)):
+      printHeading("Test DinoStartup class")
+      testDinoStartup()
+
+   if((len(sys.argv) == 1) or ("DinoImport" in sys.argv)):
+      printHeading("Test DinoImport class")
+      testDinoImport()
+
+   if((len(sys.argv) == 1) or ("DinoShutdown" in sys.argv)):
+      printHeading("Test DinoShutdown class")
+      testDinoShutdown()
+
+   if((len(sys.argv) == 1) or ("DinoScheduler" in sys.argv)):
+      printHeading("Test DinoScheduler class")
+      testDinoScheduler()
+
+   if((len(sys.argv) == 1) or ("DinoAsyncMain" in sys.argv)):
+      printHeading("Test DinoAsyncMain class")
+      testDinoAsyncMain()
+
+   if((len(sys.argv) == 1) or ("DinoLogger" in sys.argv)):
+      printHeading("Test DinoLogger class")
+      testDinoLogger()
+
    if((len(sys.argv) == 1) or ("DinoSpectrometer" in sys.argv)):
       printHeading("Test DinoSpectrometer class")
       testDinoSpectrometer()